@@ -1,5 +1,9 @@
+import uuid
+from typing import List
+
 import streamlit as st
-from langchain_core.messages import AIMessage, HumanMessage
+from config import CHAT_WINDOW_MESSAGES, CHAT_PAGE_MESSAGES, CHAT_CONTEXT_MESSAGES, STREAM_RENDER_FPS
+from src.pipeline.chat_history import BackgroundAnswer, ChatHistoryStore, ChatMessage
 from src.pipeline.rag_pipeline import RAGPipeline
 
 # App config
@@ -61,79 +65,110 @@ def load_rag_pipeline():
     """Load RAG pipeline (cached for performance)"""
     return RAGPipeline()
 
-def render_message(role: str, content: str):
-    """Render a message bubble"""
+@st.cache_resource
+def load_chat_history():
+    """Chat history store shared by all sessions"""
+    return ChatHistoryStore()
+
+GREETING = "Hello, I am a bot. How can I help you?"
+
+def bubble_html(role: str, content: str) -> str:
+    """HTML for a message bubble"""
     bubble_class = "user-bubble" if role == "user" else "assistant-bubble"
-    st.markdown(
-        f"""
-        <div class="chat-container">
-            <div class="bubble {bubble_class}">{content}</div>
-        </div>
-        """,
+    return f'<div class="bubble {bubble_class}">{content}</div>'
+
+def render_message(role: str, content: str, placeholder=None):
+    """Render a message bubble, into a placeholder if given"""
+    (placeholder or st).markdown(
+        f'<div class="chat-container">{bubble_html(role, content)}</div>',
         unsafe_allow_html=True
     )
 
-# Initialize chat history
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = [
-        AIMessage(content="Hello, I am a bot. How can I help you?")
-    ]
+def render_history(messages: List[ChatMessage], show_greeting: bool):
+    """Render a window of messages as a single element"""
+    bubbles = [bubble_html("assistant", GREETING)] if show_greeting else []
+    bubbles += [bubble_html(message.role, message.content) for message in messages]
+    st.markdown(f'<div class="chat-container">{"".join(bubbles)}</div>', unsafe_allow_html=True)
+
+def stream_answer(answer: BackgroundAnswer):
+    """Show an answer as it is generated, redrawing at most STREAM_RENDER_FPS times per second"""
+    placeholder = st.empty()
+    shown = None
+    while True:
+        finished = answer.wait(1.0 / STREAM_RENDER_FPS)
+        text = answer.error or answer.text()
+        if text != shown:
+            render_message("assistant", text or "…", placeholder)
+            shown = text
+        if finished:
+            return
+
+# Initialize the chat session; only its ID and view size live in session state
+if "session_id" not in st.session_state:
+    # Kept in the URL so reloading the page reopens the same chat
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
+    st.session_state.history_window = CHAT_WINDOW_MESSAGES
 
 # Load RAG pipeline
 try:
     rag = load_rag_pipeline()
+    history = load_chat_history()
     
-    # Health check
+    # Health check (cheap liveness probes, cached between reruns)
     health = rag.health_check()
     if not health["retrieval"]:
         st.error("⚠️ Vector store not initialized. Please run document ingestion first.")
         st.code("python scripts/ingest_documents.py")
+    if not health["generation"]:
+        st.warning("⚠️ The language model is not available in Ollama. Check that Ollama is running.")
 
 except Exception as e:
     st.error(f"Failed to initialize RAG system: {e}")
     st.stop()
 
-# Display chat history
-for msg in st.session_state.chat_history:
-    if isinstance(msg, HumanMessage):
-        render_message("user", msg.content)
-    elif isinstance(msg, AIMessage):
-        render_message("assistant", msg.content)
+session_id = st.session_state.session_id
+
+with st.sidebar:
+    if st.button("New chat"):
+        st.session_state.session_id = session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_id
+        st.session_state.history_window = CHAT_WINDOW_MESSAGES
+        st.session_state.pop("answer", None)
+
+# An answer started in an earlier run keeps generating in the background;
+# once it is done it has been stored and is shown with the rest of the history
+answer = st.session_state.get("answer")
+if answer is not None and answer.done:
+    del st.session_state["answer"]
+    answer = None
+
+# Display the latest messages, with earlier ones loaded a page at a time
+def show_earlier_messages():
+    st.session_state.history_window += CHAT_PAGE_MESSAGES
+
+total_messages = history.count(session_id)
+if total_messages > st.session_state.history_window:
+    st.button(f"Show earlier messages ({total_messages - st.session_state.history_window} more)",
+              on_click=show_earlier_messages)
+window = st.session_state.history_window
+render_history(history.recent(session_id, window), show_greeting=total_messages <= window)
 
 # User input
 user_query = st.chat_input("Type your message here...")
-if user_query:
-    # Add user message to chat history
-    st.session_state.chat_history.append(HumanMessage(content=user_query))
-    
-    # Display user message
+if answer is not None:
+    if user_query:
+        st.toast("Please wait for the current answer to finish.")
+    stream_answer(answer)
+elif user_query:
+    # Store the question, then generate off the script thread so reruns never interrupt it
+    history.append(session_id, "user", user_query)
     render_message("user", user_query)
-    
-    # Generate and stream assistant response
-    try:
-        # Get streaming response with chat history
-        result = rag.query_stream(user_query, st.session_state.chat_history)
-        
-        # Create placeholder for streaming content
-        response_placeholder = st.empty()
-        full_response = ""
-        
-        # Stream the response
-        for chunk in result["answer_stream"]:
-            full_response += chunk
-            response_placeholder.markdown(
-                f"""
-                <div class="chat-container">
-                    <div class="bubble assistant-bubble">{full_response}</div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        
-        # Add assistant response to chat history
-        st.session_state.chat_history.append(AIMessage(content=full_response))
-        
-    except Exception as e:
-        error_msg = f"Error generating response: {str(e)}"
-        render_message("assistant", error_msg)
-        st.session_state.chat_history.append(AIMessage(content=error_msg))
+
+    answer = BackgroundAnswer(
+        rag.query_stream, user_query, history.langchain_history(session_id, CHAT_CONTEXT_MESSAGES),
+        on_done=lambda text, session_id=session_id: history.append(session_id, "assistant", text),
+        session_id=session_id
+    )
+    st.session_state.answer = answer
+    stream_answer(answer)
@@ -0,0 +1 @@
+"""Reproducible ingestion and query benchmarks (run with ``python -m benchmarks.run``)"""
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Async query concurrency benchmark
+
+Ingests a small synthetic corpus into a scratch data directory with the
+hashing embedder, then answers its questions through
+``RAGPipeline.aquery_stream`` from 1, N and M concurrent callers sharing one
+event loop. Embedding and token generation are faked with async delays, so
+a pipeline that never blocks the loop should answer nearly M times as many
+questions per second at concurrency M as at 1. Reports throughput, latency
+and time to first token per level, and fails when throughput at any level
+falls below ``--min-efficiency`` times linear scaling or an answer comes
+back incomplete. Exits non-zero when a check fails, so it can gate CI.
+
+Usage:
+    python -m benchmarks.async_query --concurrency 1 4 16 --token-delay 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.corpus import CorpusGenerator
+from benchmarks.run import DEFAULT_WORK_DIR, _git_commit, _percentile
+
+
+async def run_level(pipeline, questions: List[str], concurrency: int, per_caller: int,
+                    expected_answer: str, k: int) -> Dict[str, Any]:
+    """Answer ``per_caller`` questions from each of ``concurrency`` callers at once"""
+    from langchain_core.messages import HumanMessage
+
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    incomplete = 0
+
+    async def ask(question: str):
+        nonlocal incomplete
+        start = time.perf_counter()
+        result = await pipeline.aquery_stream(question, [HumanMessage(content=question)], k=k)
+        first_token = None
+        parts = []
+        async for chunk in result["answer_stream"]:
+            if first_token is None:
+                first_token = time.perf_counter()
+            parts.append(chunk)
+        end = time.perf_counter()
+        latencies.append((end - start) * 1000)
+        ttfts.append(((first_token or end) - start) * 1000)
+        if "".join(parts) != expected_answer or not result["num_sources"]:
+            incomplete += 1
+
+    async def caller(index: int):
+        for i in range(per_caller):
+            await ask(questions[(index * per_caller + i) % len(questions)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller(index) for index in range(concurrency)))
+    seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(latencies),
+        "seconds": round(seconds, 3),
+        "queries_per_second": round(len(latencies) / seconds, 2),
+        "p50_ms": _percentile(latencies, 0.5),
+        "p95_ms": _percentile(latencies, 0.95),
+        "ttft_p50_ms": _percentile(ttfts, 0.5),
+        "incomplete": incomplete,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that async queries scale with concurrency")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                        help="Concurrent callers per level; the first level is the baseline")
+    parser.add_argument("--queries-per-caller", type=int, default=4, help="Questions each caller asks in turn")
+    parser.add_argument("--documents", type=int, default=200, help="Synthetic corpus size")
+    parser.add_argument("--answer-words", type=int, default=20, help="Words in every fake answer")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds per streamed token")
+    parser.add_argument("--embedding-delay", type=float, default=0.01, help="Seconds per embedding request")
+    parser.add_argument("--min-efficiency", type=float, default=0.5,
+                        help="Fail below this fraction of linear throughput scaling")
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default="numpy", help="Vector store backend")
+    parser.add_argument("--seed", type=int, default=13, help="Seed for corpus and question generation")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR, help="Where scratch data and results are kept")
+    parser.add_argument("--output", type=Path, help="Results file (default: <work-dir>/results/async-query-<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch data directory")
+    args = parser.parse_args()
+
+    data_dir = args.work_dir / "runs" / f"async-query-{args.vector_store}"
+    if data_dir.exists():
+        shutil.rmtree(data_dir)
+    generator = CorpusGenerator(seed=args.seed)
+    facts = generator.write(data_dir / "raw", args.documents, "txt")
+    # Set before config is first imported, so the pipeline works in the scratch directory
+    os.environ["PRIVATEGPT_DATA_DIR"] = str(data_dir)
+    os.environ["PRIVATEGPT_VECTOR_STORE"] = args.vector_store
+
+    import config
+    from benchmarks.fakes import HashingEmbeddings, fake_chat_model
+    from src.generation.scheduler import GenerationScheduler
+    from src.pipeline.rag_pipeline import RAGPipeline
+    from src.resources import resources
+
+    embeddings = HashingEmbeddings(delay=args.embedding_delay)
+    llm = fake_chat_model(args.answer_words, args.token_delay)
+    most = max(args.concurrency)
+    resources.override(
+        embedding_client=embeddings,
+        # Uncached, so every query pays for its embedding request
+        embeddings=embeddings,
+        llm=llm,
+        # Enough slots that the fake server, not admission control, sets the pace
+        generation_scheduler=GenerationScheduler(slots_per_endpoint=most, max_queued=most)
+    )
+
+    pipeline = RAGPipeline()
+    pipeline.response_cache = None
+    pipeline.ingest_documents()
+    expected_answer = " ".join(f"word{i}" for i in range(args.answer_words))
+    questions = [fact.question for fact in facts]
+
+    async def measure() -> List[Dict[str, Any]]:
+        # Unmeasured first query opens the vector store and builds the rerank stage
+        await run_level(pipeline, questions, 1, 1, expected_answer, config.TOP_K_RETRIEVAL)
+        return [await run_level(pipeline, questions, concurrency, args.queries_per_caller, expected_answer,
+                                config.TOP_K_RETRIEVAL)
+                for concurrency in args.concurrency]
+
+    levels = asyncio.run(measure())
+    baseline = levels[0]
+    failures = []
+    for level in levels:
+        scale = level["concurrency"] / baseline["concurrency"]
+        level["speedup"] = round(level["queries_per_second"] / baseline["queries_per_second"], 2)
+        level["efficiency"] = round(level["speedup"] / scale, 2)
+        print(f"concurrency {level['concurrency']:3}: {level['queries_per_second']:7.1f} queries/s "
+              f"(x{level['speedup']:.1f}), p50 {level['p50_ms']:.0f} ms, p95 {level['p95_ms']:.0f} ms, "
+              f"ttft p50 {level['ttft_p50_ms']:.0f} ms")
+        if level["incomplete"]:
+            failures.append(f"{level['incomplete']} answers incomplete at concurrency {level['concurrency']}")
+        if level["efficiency"] < args.min_efficiency:
+            failures.append(f"throughput at concurrency {level['concurrency']} scaled x{level['speedup']}, "
+                            f"below {args.min_efficiency:g} of x{scale:g}")
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = args.work_dir / "results" / f"async-query-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **_git_commit(),
+        "settings": {key: str(value) if isinstance(value, Path) else value
+                     for key, value in vars(args).items() if key != "output"},
+        "levels": levels,
+        "failures": failures,
+    }, indent=2))
+    print(f"Results written to {output}")
+    if not args.keep:
+        shutil.rmtree(data_dir)
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Recall@k versus memory for the compact int8 index, Chroma's HNSW index
+and the exact NumPy vector store
+
+Generates clustered, normalized vectors shaped like sentence embeddings,
+computes the exact nearest neighbours of held-out queries by brute force,
+and measures each index's recall@k, query latency, on-disk size and peak
+resident memory. Building and querying each index run in separate
+processes, so the query-side memory is what a serving process would pay.
+The compact index is measured once per rescoring depth.
+
+Usage:
+    python -m benchmarks.compact_index --vectors 100000 1000000 --rescore 50 100 200
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.run import DEFAULT_WORK_DIR, _dir_size_mb, _git_commit, _peak_rss_mb
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BUILD_BATCH = 5000
+QUERY_NOISE = 0.5   # Norm of the noise added to a stored vector to make a query
+
+
+def _generate(path: Path, count: int, dim: int, clusters: int, seed: int):
+    """Write ``count`` unit vectors drawn around random cluster centres to a .npy file"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(count, dim))
+    for start in range(0, count, BUILD_BATCH):
+        end = min(start + BUILD_BATCH, count)
+        batch = centres[rng.integers(clusters, size=end - start)]
+        batch += 0.6 * rng.standard_normal(batch.shape).astype(np.float32)
+        vectors[start:end] = batch / np.linalg.norm(batch, axis=1, keepdims=True)
+    vectors.flush()
+
+
+def _ground_truth(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k rows by cosine similarity, scanning the vectors in blocks"""
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(vectors), BUILD_BATCH * 4):
+        block = np.asarray(vectors[start:start + BUILD_BATCH * 4])
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        block_rows = np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))
+        rows = np.concatenate([best_rows, block_rows], axis=1)
+        keep = np.argsort(-scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    return best_rows
+
+
+def build(backend: str, dataset: Path, index_dir: Path) -> Dict[str, Any]:
+    """Child process: load the dataset into one index"""
+    vectors = np.load(dataset / "vectors.npy", mmap_mode="r")
+    start = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=str(index_dir)).get_or_create_collection("benchmark")
+        for offset in range(0, len(vectors), BUILD_BATCH):
+            batch = np.asarray(vectors[offset:offset + BUILD_BATCH])
+            collection.add(ids=[str(i) for i in range(offset, offset + len(batch))], embeddings=batch.tolist())
+    elif backend == "numpy":
+        from langchain.schema import Document
+        from src.vectorstores.numpy_store import NumpyVectorStore
+        store = NumpyVectorStore(index_dir)
+        for offset in range(0, len(vectors), BUILD_BATCH):
+            batch = np.asarray(vectors[offset:offset + BUILD_BATCH])
+            store.add_embeddings([str(i) for i in range(offset, offset + len(batch))],
+                                 [Document(page_content="", metadata={}) for _ in batch], batch)
+    else:
+        # The index rescores against the vectors its collection already stores, here a NumPy store
+        from langchain.schema import Document
+        from src.retrieval.compact_index import CompactIndex
+        from src.vectorstores.numpy_store import NumpyVectorStore
+        index = CompactIndex(index_dir / "codes")
+        store = NumpyVectorStore(index_dir / "store")
+        for offset in range(0, len(vectors), BUILD_BATCH):
+            batch = np.asarray(vectors[offset:offset + BUILD_BATCH])
+            ids = [str(i) for i in range(offset, offset + len(batch))]
+            store.add_embeddings(ids, [Document(page_content="", metadata={}) for _ in batch], batch)
+            index.add(ids, batch)
+    return {"build_seconds": round(time.perf_counter() - start, 2)}
+
+
+def query(backend: str, dataset: Path, index_dir: Path, k: int, rescore: int) -> Dict[str, Any]:
+    """Child process: run the held-out queries against a built index"""
+    queries = np.load(dataset / "queries.npy")
+    truth = np.load(dataset / f"truth-{k}.npy")
+
+    if backend == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=str(index_dir)).get_collection("benchmark")
+
+        def search(vector):
+            return collection.query(query_embeddings=[vector.tolist()], n_results=k)["ids"][0]
+    elif backend == "numpy":
+        from src.vectorstores.numpy_store import NumpyVectorStore
+        store = NumpyVectorStore(index_dir)
+
+        def search(vector):
+            return [doc.metadata["chunk_id"] for doc, _ in store.search_by_vector(vector, k)]
+    else:
+        from src.retrieval.compact_index import CompactIndex
+        from src.vectorstores.numpy_store import NumpyVectorStore
+        index = CompactIndex(index_dir / "codes", rescore_candidates=rescore)
+        store = NumpyVectorStore(index_dir / "store")
+
+        def search(vector):
+            return [chunk_id for chunk_id, _ in index.search(vector, k, store)]
+
+    latencies, recalls = [], []
+    for vector, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({int(chunk_id) for chunk_id in found} & set(expected.tolist())) / k)
+
+    return {
+        "recall_at_k": round(statistics.mean(recalls), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 3),
+        "peak_rss_mb": _peak_rss_mb()["main"],
+    }
+
+
+def _child(*args: str) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.compact_index", "--child", *args],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_size(args, count: int) -> List[Dict[str, Any]]:
+    dataset = args.work_dir / "compact" / f"{count}x{args.dim}-seed{args.seed}"
+    dataset.mkdir(parents=True, exist_ok=True)
+    if not (dataset / "vectors.npy").exists():
+        print(f"Generating {count} vectors in {dataset}...", flush=True)
+        _generate(dataset / "vectors.npy", count, args.dim, args.clusters, args.seed)
+    vectors = np.load(dataset / "vectors.npy", mmap_mode="r")
+    if not (dataset / "queries.npy").exists():
+        # Queries are perturbed copies of stored vectors, like paraphrases of indexed text
+        rng = np.random.default_rng(args.seed + 1)
+        queries = np.asarray(vectors[rng.integers(count, size=args.queries)])
+        queries = queries + QUERY_NOISE / np.sqrt(args.dim) * rng.standard_normal(queries.shape)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        np.save(dataset / "queries.npy", queries.astype(np.float32))
+    if not (dataset / f"truth-{args.k}.npy").exists():
+        print("Computing exact neighbours...", flush=True)
+        np.save(dataset / f"truth-{args.k}.npy", _ground_truth(vectors, np.load(dataset / "queries.npy"), args.k))
+
+    results = []
+    for backend in args.backends:
+        index_dir = dataset / f"index-{backend}"
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+        print(f"Building {backend} index over {count} vectors...", flush=True)
+        try:
+            built = _child("build", backend, str(dataset), str(index_dir))
+        except subprocess.CalledProcessError as e:
+            print(f"  {backend} failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}", flush=True)
+            continue
+
+        for rescore in (args.rescore if backend == "compact" else [None]):
+            result = _child("query", backend, str(dataset), str(index_dir), str(args.k), str(rescore or 0))
+            # The compact index's own size excludes the store it rescores against, which the collection has anyway
+            size_dir = index_dir / "codes" if backend == "compact" else index_dir
+            result.update(built, backend=backend, vectors=count, dim=args.dim, k=args.k,
+                          rescore_candidates=rescore, index_size_mb=_dir_size_mb(size_dir))
+            results.append(result)
+            print(
+                f"  {backend:<8}{'' if rescore is None else f' rescore={rescore}':<14} "
+                f"recall@{args.k} {result['recall_at_k']:.3f} | p50 {result['p50_ms']} ms | "
+                f"peak RSS {result['peak_rss_mb']} MB | index {result['index_size_mb']} MB",
+                flush=True
+            )
+        if not args.keep:
+            shutil.rmtree(index_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and memory of the compact, Chroma and NumPy indexes")
+    parser.add_argument("--vectors", nargs="+", type=int, default=[100_000], help="Collection sizes to test")
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimensions (nomic-embed-text uses 768)")
+    parser.add_argument("--clusters", type=int, default=1000, help="Topic clusters the vectors are drawn around")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out queries per size")
+    parser.add_argument("-k", "--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--rescore", nargs="+", type=int, default=[50, 100, 200],
+                        help="Candidates the compact index re-scores exactly")
+    parser.add_argument("--backends", nargs="+", choices=["chroma", "compact", "numpy"],
+                        default=["chroma", "compact", "numpy"])
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR,
+                        help="Where datasets, scratch indexes and results are kept")
+    parser.add_argument("--output", type=Path, help="Results file (default: <work-dir>/results/compact-<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the built indexes")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        phase, backend, dataset, index_dir = args.child[:4]
+        if phase == "build":
+            result = build(backend, Path(dataset), Path(index_dir))
+        else:
+            result = query(backend, Path(dataset), Path(index_dir), int(args.child[4]), int(args.child[5]))
+        print(json.dumps(result))
+        return
+
+    results = []
+    for count in args.vectors:
+        results.extend(run_size(args, count))
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = args.work_dir / "results" / f"compact-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **_git_commit(),
+        "settings": {key: str(value) if isinstance(value, Path) else value
+                     for key, value in vars(args).items() if key not in ("child", "output")},
+        "results": results,
+    }, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
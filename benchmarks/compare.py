@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files scenario by scenario
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# (section, key, higher is better)
+METRICS = [
+    ("ingestion", "docs_per_second", True),
+    ("ingestion", "chunks_per_second", True),
+    ("ingestion", "reingest_seconds", False),
+    ("query", "p50_ms", False),
+    ("query", "p95_ms", False),
+    ("query", "ttft_p50_ms", False),
+    ("query", "hit_rate", True),
+    ("peak_rss_mb", "main", False),
+    (None, "index_size_mb", False),
+]
+
+
+def _scenarios(report: Dict[str, Any]) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    return {(result["format"], result["documents"]): result for result in report["results"]}
+
+
+def _value(result: Dict[str, Any], section: Optional[str], key: str) -> Optional[float]:
+    return (result.get(section) or {}).get(key) if section else result.get(key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    candidate = json.loads(args.candidate.read_text())
+    print(f"baseline  {(baseline.get('commit') or '?')[:8]}  {baseline['timestamp']}")
+    print(f"candidate {(candidate.get('commit') or '?')[:8]}  {candidate['timestamp']}")
+
+    old_scenarios = _scenarios(baseline)
+    for scenario, new in _scenarios(candidate).items():
+        old = old_scenarios.get(scenario)
+        print(f"\n{scenario[0]}/{scenario[1]}")
+        if old is None:
+            print("  (not in baseline)")
+            continue
+        for section, key, higher_is_better in METRICS:
+            before, after = _value(old, section, key), _value(new, section, key)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            marker = "" if abs(change) < 5 else ("  better" if better else "  WORSE")
+            name = f"{section}.{key}" if section else key
+            print(f"  {name:<30} {before:>12} -> {after:<12} {change:+7.1f}%{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Deterministic synthetic corpora for benchmarking
+
+Every document is filler prose around one planted fact ("The reference
+code for project <name> is <code>."), so benchmark queries have a known
+answer document and retrieval hit rate can be measured alongside latency.
+"""
+
+import random
+import textwrap
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+
+FORMATS = ("txt", "pdf", "docx")
+
+_SYLLABLES = ["ka", "lo", "mi", "ren", "ta", "vo", "sel", "dor", "qui", "ban", "tel", "mor", "fi", "zan", "pra", "ul"]
+_TOPICS = ["procurement", "leave", "security", "onboarding", "travel", "expenses", "retention", "compliance"]
+
+
+@dataclass
+class PlantedFact:
+    """Query with a known answer and the document that contains it"""
+    doc_name: str
+    project: str
+    code: str
+
+    @property
+    def question(self) -> str:
+        return f"What is the reference code for project {self.project}?"
+
+
+class CorpusGenerator:
+    """Writes ``count`` documents of one format; output depends only on the seed"""
+
+    def __init__(self, seed: int = 13, vocabulary_size: int = 5000, paragraphs: int = 6,
+                 sentences_per_paragraph: int = 5):
+        self.seed = seed
+        self.paragraphs = paragraphs
+        self.sentences_per_paragraph = sentences_per_paragraph
+        rng = random.Random(seed)
+        self.vocabulary = sorted({
+            "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))
+            for _ in range(vocabulary_size)
+        })
+
+    def _sentence(self, rng: random.Random) -> str:
+        words = rng.choices(self.vocabulary, k=rng.randint(8, 18))
+        return " ".join(words).capitalize() + "."
+
+    def document(self, index: int) -> Tuple[str, List[str], PlantedFact]:
+        """Title, paragraphs and planted fact of document ``index``"""
+        rng = random.Random(f"{self.seed}-{index}")
+        topic = rng.choice(_TOPICS)
+        project = f"{rng.choice(self.vocabulary)}-{index}"
+        fact = PlantedFact(doc_name=f"doc-{index:06d}", project=project, code=f"{rng.randrange(16 ** 8):08X}")
+
+        paragraphs = [
+            " ".join(self._sentence(rng) for _ in range(self.sentences_per_paragraph))
+            for _ in range(self.paragraphs)
+        ]
+        # The fact lands in a random paragraph so it is not always in the first chunk
+        position = rng.randrange(len(paragraphs))
+        paragraphs[position] += f" The reference code for project {project} is {fact.code}."
+        return f"{topic.capitalize()} notes {index}", paragraphs, fact
+
+    def write(self, directory: Path, count: int, file_format: str) -> List[PlantedFact]:
+        """Write the corpus, skipping files that already exist, and return its planted facts"""
+        if file_format not in FORMATS:
+            raise ValueError(f"Unsupported format {file_format!r}, expected one of {FORMATS}")
+        writer = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}[file_format]
+
+        directory.mkdir(parents=True, exist_ok=True)
+        facts = []
+        for index in range(count):
+            title, paragraphs, fact = self.document(index)
+            path = directory / f"{fact.doc_name}.{file_format}"
+            if not path.exists():
+                writer(path, title, paragraphs)
+            facts.append(fact)
+        return facts
+
+
+def write_txt(path: Path, title: str, paragraphs: List[str]):
+    path.write_text(title + "\n\n" + "\n\n".join(paragraphs) + "\n", encoding="utf-8")
+
+
+def write_docx(path: Path, title: str, paragraphs: List[str]):
+    try:
+        import docx
+    except ImportError as e:
+        raise ImportError("DOCX corpora require python-docx: pip install python-docx") from e
+
+    document = docx.Document()
+    document.add_heading(title, level=1)
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(str(path))
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, title: str, paragraphs: List[str], lines_per_page: int = 60):
+    """Minimal text-only PDF (Helvetica, no compression) readable by PyPDFLoader"""
+    lines = [title, ""]
+    for paragraph in paragraphs:
+        lines.extend(textwrap.wrap(paragraph, width=95))
+        lines.append("")
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    # Objects 1-3 are the catalog, page tree and font; each page adds a page and a content object
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {len(pages)} >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for page_id, page_lines in zip(page_ids, pages):
+        text = "\n".join(f"({_pdf_escape(line)}) Tj T*" for line in page_lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 800 Td\n{text}\nET"
+        objects[page_id] = (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects[page_id + 1] = f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += f"{object_id} 0 obj\n{objects[object_id]}\nendobj\n".encode("latin-1")
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for object_id in sorted(objects):
+        output += f"{offsets[object_id]:010d} 00000 n \n".encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(bytes(output))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Embedding client load test against a fake Ollama server
+
+Starts a local HTTP server that answers Ollama's /api/embed after a fixed
+delay, then embeds with BatchedOllamaEmbeddings from many concurrent
+callers: threads on the sync path, and coroutines sharing one event loop
+on the async path, run on two loops in turn. Reports throughput, the peak
+number of requests the server saw at once and the connections it
+accepted, and checks that every vector came back in order, that neither
+path exceeds ``max_in_flight`` requests, and that the async path reuses
+its connections instead of opening new ones per call. Exits non-zero when
+a check fails, so it can gate CI.
+
+Usage:
+    python -m benchmarks.embeddings --callers 32 --texts 64 --batch-size 16 --max-in-flight 4
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.run import DEFAULT_WORK_DIR, _git_commit
+
+
+class FakeEmbedServer(ThreadingHTTPServer):
+    """Answers /api/embed after ``delay`` seconds with vectors encoding each input text"""
+
+    daemon_threads = True
+
+    def __init__(self, delay: float):
+        super().__init__(("127.0.0.1", 0), FakeEmbedHandler)
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama-embed", daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def enter(self):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def reset(self):
+        with self._lock:
+            self.max_active = self.requests = self.connections = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "connections": self.connections, "max_concurrency": self.max_active}
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeEmbedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeEmbedServer
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connected()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path != "/api/embed":
+            self.send_response(HTTPStatus.NOT_FOUND)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.server.enter()
+        try:
+            time.sleep(self.server.delay)
+            texts = request.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            body = json.dumps({
+                "model": request.get("model", "fake"),
+                "embeddings": [[float(_text_number(text)), float(len(text)), 1.0] for text in texts],
+                "prompt_eval_count": sum(len(text.split()) for text in texts),
+            }).encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            self.server.leave()
+
+
+def _text_number(text: str) -> int:
+    return int(text.rsplit(" ", 1)[-1])
+
+
+def _texts(caller: int, count: int) -> List[str]:
+    return [f"caller {caller} text {caller * count + i}" for i in range(count)]
+
+
+def _in_order(vectors: List[List[float]], texts: List[str]) -> bool:
+    return len(vectors) == len(texts) and all(vector[0] == _text_number(text) for vector, text in zip(vectors, texts))
+
+
+def run_sync(embeddings, args) -> Dict[str, Any]:
+    """Embed from ``callers`` threads at once"""
+    def call(caller: int) -> bool:
+        texts = _texts(caller, args.texts)
+        return _in_order(embeddings.embed_documents(texts), texts)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.callers) as pool:
+        ordered = list(pool.map(call, range(args.callers)))
+    return {"seconds": time.perf_counter() - start, "ordered": all(ordered)}
+
+
+def run_async(embeddings, args) -> Dict[str, Any]:
+    """Embed from ``callers`` coroutines at once, plus one query each, on two event loops in turn"""
+    async def load() -> bool:
+        calls = [embeddings.aembed_documents(_texts(caller, args.texts)) for caller in range(args.callers)]
+        queries = [embeddings.aembed_query(f"query {i}") for i in range(args.callers)]
+        results = await asyncio.gather(*calls, *queries)
+        documents, query_vectors = results[:args.callers], results[args.callers:]
+        return all(_in_order(vectors, _texts(caller, args.texts)) for caller, vectors in enumerate(documents)) \
+            and all(vector[0] == i for i, vector in enumerate(query_vectors))
+
+    start = time.perf_counter()
+    # A second loop must get its own client rather than reuse one bound to the first
+    ordered = [asyncio.run(load()) for _ in range(2)]
+    return {"seconds": time.perf_counter() - start, "ordered": all(ordered)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the embedding client against a fake Ollama server")
+    parser.add_argument("--callers", type=int, default=32, help="Concurrent embedding calls")
+    parser.add_argument("--texts", type=int, default=64, help="Texts per call")
+    parser.add_argument("--batch-size", type=int, default=16, help="Texts per request")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Concurrent requests allowed per client")
+    parser.add_argument("--delay", type=float, default=0.005, help="Seconds the fake server takes per request")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR, help="Where results are kept")
+    parser.add_argument("--output", type=Path, help="Results file (default: <work-dir>/results/embeddings-<time>.json)")
+    args = parser.parse_args()
+
+    from src.embeddings import BatchedOllamaEmbeddings
+
+    server = FakeEmbedServer(args.delay)
+    embeddings = BatchedOllamaEmbeddings(model="fake", base_url=server.url, batch_size=args.batch_size,
+                                         max_in_flight=args.max_in_flight, max_retries=0)
+    runs = {}
+    try:
+        for name, run in (("sync", run_sync), ("async", run_async)):
+            server.reset()
+            result = run(embeddings, args)
+            runs[name] = {**result, **server.stats()}
+    finally:
+        embeddings.close()
+        server.stop()
+
+    batches = -(-args.texts // args.batch_size) * args.callers
+    for name, stats in runs.items():
+        texts = args.callers * args.texts * (2 if name == "async" else 1)
+        stats["texts_per_second"] = round(texts / stats["seconds"], 1)
+        print(f"{name + ':':7} {texts} texts in {stats['seconds']:.2f} s ({stats['texts_per_second']:.0f}/s), "
+              f"{stats['requests']} requests, peak concurrency {stats['max_concurrency']}, "
+              f"{stats['connections']} connections")
+
+    failures = []
+    for name, stats in runs.items():
+        if not stats["ordered"]:
+            failures.append(f"{name} vectors came back out of order")
+        # Single-batch sync calls run on their caller's thread; larger ones share the client's workers
+        limit = args.callers if name == "sync" and args.texts <= args.batch_size else args.max_in_flight
+        if stats["max_concurrency"] > limit:
+            failures.append(f"{name} path sent {stats['max_concurrency']} requests at once, limit {limit}")
+    # Each loop's client keeps at most max_in_flight connections, however many calls share it
+    if runs["async"]["connections"] > 2 * args.max_in_flight:
+        failures.append(f"async path opened {runs['async']['connections']} connections for {batches} batches")
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = args.work_dir / "results" / f"embeddings-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **_git_commit(),
+        "settings": {key: str(value) if isinstance(value, Path) else value
+                     for key, value in vars(args).items() if key != "output"},
+        "runs": {name: {key: round(value, 3) if isinstance(value, float) else value for key, value in stats.items()}
+                 for name, stats in runs.items()},
+        "failures": failures,
+    }, indent=2))
+    print(f"Results written to {output}")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Deterministic stand-ins for Ollama so benchmarks measure the pipeline, not the model"""
+
+import asyncio
+import hashlib
+import itertools
+import re
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+from src.embeddings import EmbeddingMetrics
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=200_000)
+def _bucket(token: str, dimensions: int) -> Tuple[int, float]:
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+
+class HashingEmbeddings(Embeddings):
+    """Feature-hashed bag of words, L2 normalised
+
+    Identical text always maps to the same vector and texts sharing words
+    are similar, so vector search behaves plausibly without a model. An
+    optional per-request delay approximates embedding server latency; the
+    async methods wait it out without blocking the event loop.
+    """
+
+    def __init__(self, dimensions: int = 768, delay: float = 0.0):
+        self.dimensions = dimensions
+        self.delay = delay
+        self.metrics = EmbeddingMetrics()
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            index, sign = _bucket(token, self.dimensions)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        if self.delay:
+            time.sleep(self.delay)
+        vectors = [self._embed(text) for text in texts]
+        self.metrics.record(
+            chunks=len(texts), tokens=sum(len(text) for text in texts) // 4,
+            seconds=time.perf_counter() - start
+        )
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        vectors = [self._embed(text) for text in texts]
+        self.metrics.record(
+            chunks=len(texts), tokens=sum(len(text) for text in texts) // 4,
+            seconds=time.perf_counter() - start
+        )
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class PacedFakeChatModel(GenericFakeChatModel):
+    """Fake chat model emitting one token every ``token_delay`` seconds, like a server generating them"""
+
+    token_delay: float = 0.0
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for chunk in super()._stream(messages, stop=stop, **kwargs):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def fake_chat_model(answer_words: int = 60, token_delay: float = 0.0) -> GenericFakeChatModel:
+    """Chat model that streams the same answer word by word on every call, ``token_delay`` seconds per word"""
+    answer = " ".join(f"word{i}" for i in range(answer_words))
+    return PacedFakeChatModel(messages=itertools.repeat(AIMessage(content=answer)), token_delay=token_delay)
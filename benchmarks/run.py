@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Ingestion and query throughput benchmark
+
+Generates synthetic TXT/PDF/DOCX corpora, ingests each one into a fresh
+local collection of each vector store backend and runs queries through the full pipeline with
+deterministic fake embedding and LLM backends. Every scenario runs in its
+own process (with PRIVATEGPT_DATA_DIR pointing at a scratch directory) so
+peak memory and on-disk size are measured per scenario.
+
+Usage:
+    python -m benchmarks.run --formats txt pdf --sizes 1000 10000 --vector-stores chroma numpy
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import FORMATS, CorpusGenerator
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_WORK_DIR = BASE_DIR / "data" / "benchmarks"
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+def _dir_size_mb(path: Path) -> float:
+    total = sum(f.stat().st_size for f in path.rglob("*") if f.is_file() and not f.is_symlink())
+    return round(total / 1024 ** 2, 2)
+
+
+def _peak_rss_mb() -> Dict[str, Optional[float]]:
+    """Peak resident memory of this process and of its reaped children (parse workers)"""
+    try:
+        import resource
+    except ImportError:
+        return {"main": None, "workers": None}
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    scale = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return {
+        "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def _git_commit() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run_scenario(file_format: str, documents: int, queries: int, warmup: int, seed: int,
+                 embedding_delay: float) -> Dict[str, Any]:
+    """Ingest and query one corpus; must run in a process whose data directory is a scratch copy"""
+    # Imported here so config picks up PRIVATEGPT_DATA_DIR set by the parent process
+    from langchain_core.messages import HumanMessage
+
+    import config
+    from benchmarks.fakes import HashingEmbeddings, fake_chat_model
+    from src.embeddings import wrap_with_cache
+    from src.ingestion import DocumentIngestion
+    from src.observability import tracer
+    from src.pipeline.rag_pipeline import RAGPipeline
+    from src.resources import resources
+
+    embeddings = HashingEmbeddings(delay=embedding_delay)
+    resources.override(
+        embedding_client=embeddings,
+        embeddings=wrap_with_cache(embeddings, "benchmark-hashing", config.EMBEDDING_CACHE_ENABLED),
+        llm=fake_chat_model()
+    )
+
+    ingestion = DocumentIngestion()
+
+    start = time.perf_counter()
+    vectorstore = ingestion.process_and_store()
+    ingest_seconds = time.perf_counter() - start
+    chunks = vectorstore.count() if vectorstore is not None else 0
+
+    # A second run over an unchanged corpus measures the incremental no-op path
+    start = time.perf_counter()
+    ingestion.process_and_store()
+    reingest_seconds = time.perf_counter() - start
+
+    pipeline = RAGPipeline()
+    pipeline.response_cache = None
+
+    generator = CorpusGenerator(seed=seed)
+    rng = random.Random(seed)
+    indices = [rng.randrange(documents) for _ in range(warmup + queries)]
+    facts = [generator.document(index)[2] for index in indices]
+
+    latencies, ttfts, hits = [], [], 0
+    query_start = None
+    for i, fact in enumerate(facts):
+        if i == warmup:
+            tracer.reset()
+            query_start = time.perf_counter()
+        start = time.perf_counter()
+        result = pipeline.query_stream(fact.question, [HumanMessage(content=fact.question)],
+                                       k=config.TOP_K_RETRIEVAL)
+        first_token = None
+        for _ in result["answer_stream"]:
+            if first_token is None:
+                first_token = time.perf_counter()
+        end = time.perf_counter()
+
+        if i < warmup:
+            continue
+        latencies.append((end - start) * 1000)
+        ttfts.append(((first_token or end) - start) * 1000)
+        if any(fact.doc_name in str(source["metadata"].get("source", "")) for source in result["sources"]):
+            hits += 1
+    query_seconds = time.perf_counter() - query_start if query_start is not None else 0.0
+
+    return {
+        "format": file_format,
+        "vector_store": config.VECTOR_STORE_BACKEND,
+        "documents": documents,
+        "chunks": chunks,
+        "ingestion": {
+            "seconds": round(ingest_seconds, 3),
+            "docs_per_second": round(documents / ingest_seconds, 2) if ingest_seconds else None,
+            "chunks_per_second": round(chunks / ingest_seconds, 2) if ingest_seconds else None,
+            "reingest_seconds": round(reingest_seconds, 3),
+        },
+        "query": {
+            "count": len(latencies),
+            "p50_ms": _percentile(latencies, 0.5),
+            "p95_ms": _percentile(latencies, 0.95),
+            "ttft_p50_ms": _percentile(ttfts, 0.5),
+            "ttft_p95_ms": _percentile(ttfts, 0.95),
+            "queries_per_second": round(len(latencies) / query_seconds, 2) if query_seconds else None,
+            "hit_rate": round(hits / len(latencies), 3) if latencies else None,
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+        "index_size_mb": _dir_size_mb(config.VECTORDB_DIR),
+        "embedding_cache_mb": round(sum(
+            f.stat().st_size for f in config.EMBEDDING_CACHE_PATH.parent.glob(config.EMBEDDING_CACHE_PATH.name + "*")
+        ) / 1024 ** 2, 2),
+        "stages": tracer.summary(),
+        "config": {
+            name: getattr(config, name)
+            for name in ("CHUNKING_STRATEGY", "CHUNK_TOKENS", "CHUNK_OVERLAP_TOKENS", "CHUNK_NEIGHBOUR_WINDOW",
+                         "TOP_K_RETRIEVAL", "RETRIEVAL_MODE", "RERANK_ENABLED", "RERANK_FETCH_K",
+                         "INGESTION_WORKERS", "INGESTION_BATCH_SIZE", "EMBEDDING_CACHE_ENABLED",
+                         "VECTOR_STORE_BACKEND", "VECTOR_INDEX")
+        },
+    }
+
+
+def _spawn_scenario(args, file_format: str, documents: int, corpus_dir: Path, vector_store: str) -> Dict[str, Any]:
+    """Run one scenario in a child process against a fresh data directory"""
+    data_dir = args.work_dir / "runs" / f"{file_format}-{documents}-{vector_store}"
+    if data_dir.exists():
+        shutil.rmtree(data_dir)
+    data_dir.mkdir(parents=True)
+    (data_dir / "raw").symlink_to(corpus_dir.resolve(), target_is_directory=True)
+    result_file = data_dir / "result.json"
+
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--scenario", file_format, str(documents),
+        "--result-file", str(result_file), "--queries", str(args.queries), "--warmup", str(args.warmup),
+        "--seed", str(args.seed), "--embedding-delay", str(args.embedding_delay),
+    ]
+    if args.verbose:
+        command.append("--verbose")
+    env = dict(os.environ, PRIVATEGPT_DATA_DIR=str(data_dir), PRIVATEGPT_VECTOR_STORE=vector_store)
+    subprocess.run(command, cwd=BASE_DIR, env=env, check=True)
+
+    result = json.loads(result_file.read_text())
+    if not args.keep:
+        shutil.rmtree(data_dir)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and query throughput")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["txt"], help="Corpus file formats")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000],
+                        help="Corpus sizes in documents, e.g. 1000 10000 100000")
+    parser.add_argument("--vector-stores", nargs="+", choices=["chroma", "numpy"], default=["chroma"],
+                        help="Vector store backends to compare")
+    parser.add_argument("--queries", type=int, default=100, help="Measured queries per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured queries run first")
+    parser.add_argument("--seed", type=int, default=13, help="Seed for corpus and query generation")
+    parser.add_argument("--embedding-delay", type=float, default=0.0,
+                        help="Seconds of simulated latency per embedding request")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR,
+                        help="Where corpora, scratch databases and results are kept")
+    parser.add_argument("--output", type=Path, help="Results file (default: <work-dir>/results/<time>-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep scratch databases after each scenario")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline logs")
+    parser.add_argument("--scenario", nargs=2, metavar=("FORMAT", "DOCUMENTS"), help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.scenario:
+        file_format, documents = args.scenario[0], int(args.scenario[1])
+        result = run_scenario(file_format, documents, args.queries, args.warmup, args.seed, args.embedding_delay)
+        args.result_file.write_text(json.dumps(result, indent=2))
+        return
+
+    generator = CorpusGenerator(seed=args.seed)
+    results = []
+    for file_format in args.formats:
+        for documents in args.sizes:
+            corpus_dir = args.work_dir / "corpora" / f"{file_format}-{documents}-seed{args.seed}"
+            print(f"Generating {documents} {file_format.upper()} documents in {corpus_dir}...", flush=True)
+            generator.write(corpus_dir, documents, file_format)
+
+            for vector_store in args.vector_stores:
+                print(f"Running {file_format}/{documents} on {vector_store}...", flush=True)
+                result = _spawn_scenario(args, file_format, documents, corpus_dir, vector_store)
+                results.append(result)
+                print(
+                    f"  ingest {result['ingestion']['docs_per_second']} docs/s, "
+                    f"{result['ingestion']['chunks_per_second']} chunks/s | "
+                    f"query p50 {result['query']['p50_ms']} ms, p95 {result['query']['p95_ms']} ms | "
+                    f"peak RSS {result['peak_rss_mb']['main']} MB | index {result['index_size_mb']} MB",
+                    flush=True
+                )
+
+    git = _git_commit()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **git,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("scenario", "result_file", "output", "work_dir")},
+        "results": results,
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = args.work_dir / "results" / f"{stamp}-{(git['commit'] or 'nogit')[:8]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
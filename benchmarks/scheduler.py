@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Generation scheduler load test against fake Ollama servers
+
+Starts local HTTP servers that speak Ollama's streaming /api/chat protocol
+and emit tokens at a fixed rate, then drives ResponseGeneration through
+the real Ollama client from many concurrent sessions, one of them sending
+far more questions than the rest. Reports queue wait and time to first
+token per session, the peak concurrency each server saw and how requests
+were spread, and checks that a queued request whose client disconnects
+never reaches a server and that closing a stream mid-answer frees its
+slot. Exits non-zero when a check fails, so it can gate CI.
+
+Usage:
+    python -m benchmarks.scheduler --servers 2 --slots 2 --sessions 8 --heavy-questions 24
+"""
+
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.run import DEFAULT_WORK_DIR, _git_commit, _percentile
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Streams ``tokens`` words per /api/chat request, ``token_delay`` seconds apart"""
+
+    daemon_threads = True
+
+    def __init__(self, tokens: int, token_delay: float):
+        super().__init__(("127.0.0.1", 0), FakeOllamaHandler)
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+        self.completed = 0
+        self.disconnects = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def enter(self):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def leave(self, completed: bool):
+        with self._lock:
+            self.active -= 1
+            if completed:
+                self.completed += 1
+            else:
+                self.disconnects += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "completed": self.completed, "disconnects": self.disconnects,
+                    "max_concurrency": self.max_active}
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOllamaServer
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def _write_line(self, payload: Dict[str, Any]):
+        line = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path != "/api/chat":
+            self.send_response(HTTPStatus.NOT_FOUND)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.server.enter()
+        completed = False
+        try:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            model = request.get("model", "fake")
+            for i in range(self.server.tokens):
+                time.sleep(self.server.token_delay)
+                self._write_line({"model": model, "created_at": "2024-01-01T00:00:00Z",
+                                  "message": {"role": "assistant", "content": f"word{i} "}, "done": False})
+            self._write_line({"model": model, "created_at": "2024-01-01T00:00:00Z",
+                              "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop"})
+            self.wfile.write(b"0\r\n\r\n")
+            completed = True
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            self.server.leave(completed)
+
+
+def _unused_url() -> str:
+    """URL of a local port nothing listens on, standing in for a server that is down"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def _generate(generation, session_id: str, question: str, results: List[Dict[str, Any]]):
+    """Generate one answer for a session, recording time to first token and total time"""
+    from langchain.schema import Document
+
+    from src.generation import StreamOutcome, generation_request
+
+    docs = [Document(page_content=f"Context for {question}", metadata={"source": "benchmark.txt"})]
+    start = time.perf_counter()
+    first_token = None
+    outcome = StreamOutcome()
+    with generation_request(session_id):
+        for _ in generation.generate_response_stream(question, docs, [], outcome=outcome):
+            if first_token is None:
+                first_token = time.perf_counter()
+    end = time.perf_counter()
+    results.append({
+        "session": session_id,
+        "ttft_ms": ((first_token or end) - start) * 1000,
+        "total_ms": (end - start) * 1000,
+        "error": not outcome.completed,
+    })
+
+
+def run_load(generation, args) -> List[Dict[str, Any]]:
+    """Send every session's questions at once, the heavy session's first"""
+    results: List[Dict[str, Any]] = []
+    threads = []
+
+    def submit(session_id: str, count: int):
+        for i in range(count):
+            thread = threading.Thread(target=_generate, args=(generation, session_id, f"Question {i}?", results))
+            thread.start()
+            threads.append(thread)
+
+    submit("heavy", args.heavy_questions)
+    # Let the heavy session's requests reach the queue before anyone else's
+    time.sleep(0.2)
+    for session in range(args.sessions - 1):
+        submit(f"session-{session}", args.questions)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def check_queued_cancel(generation, scheduler, servers: List[FakeOllamaServer], args) -> Dict[str, Any]:
+    """A request whose client disconnects while queued must leave the queue without reaching a server"""
+    from src.generation import generation_request
+
+    blockers: List[Dict[str, Any]] = []
+    threads = [threading.Thread(target=_generate, args=(generation, "blocker", f"Block {i}?", blockers))
+               for i in range(args.slots * len(servers))]
+    for thread in threads:
+        thread.start()
+    # Wait for the servers, not the scheduler: a granted slot reaches its server a moment later
+    while sum(server.active for server in servers) < len(threads):
+        time.sleep(0.01)
+    requests_before = sum(server.stats()["requests"] for server in servers)
+
+    disconnected = threading.Event()
+    outcome: Dict[str, Any] = {}
+
+    def waiting_client():
+        with generation_request("cancelled", is_cancelled=disconnected.is_set):
+            outcome["answer"] = "".join(generation.generate_response_stream("Never sent?", [], []))
+        outcome["left_at"] = time.perf_counter()
+
+    client = threading.Thread(target=waiting_client)
+    client.start()
+    while scheduler.stats()["queued"] < 1:
+        time.sleep(0.01)
+    disconnected_at = time.perf_counter()
+    disconnected.set()
+    client.join()
+    left_queue_ms = (outcome["left_at"] - disconnected_at) * 1000
+    requests_after = sum(server.stats()["requests"] for server in servers)
+    for thread in threads:
+        thread.join()
+    return {
+        "left_queue_ms": round(left_queue_ms, 1),
+        "reached_server": requests_after > requests_before,
+        "passed": requests_after == requests_before and left_queue_ms < args.cancel_poll * 1000 * 4,
+    }
+
+
+def check_stream_close(generation, scheduler, servers: List[FakeOllamaServer]) -> Dict[str, Any]:
+    """Closing an answer stream mid-answer must free its slot and drop the server connection"""
+    disconnects_before = sum(server.stats()["disconnects"] for server in servers)
+    stream = generation.generate_response_stream("Stop early?", [], [])
+    for _ in range(3):
+        next(stream)
+    in_flight_during = scheduler.stats()["in_flight"]
+    stream.close()
+    in_flight_after = scheduler.stats()["in_flight"]
+
+    # The server notices on its next write
+    deadline = time.perf_counter() + 5
+    while sum(server.stats()["disconnects"] for server in servers) == disconnects_before \
+            and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    server_disconnected = sum(server.stats()["disconnects"] for server in servers) > disconnects_before
+    return {
+        "in_flight_during": in_flight_during,
+        "in_flight_after": in_flight_after,
+        "server_disconnected": server_disconnected,
+        "passed": in_flight_during == 1 and in_flight_after == 0 and server_disconnected,
+    }
+
+
+def _session_summary(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for group, rows in (("heavy", [r for r in results if r["session"] == "heavy"]),
+                        ("light", [r for r in results if r["session"] != "heavy"])):
+        ttfts = [r["ttft_ms"] for r in rows]
+        summary[group] = {
+            "requests": len(rows),
+            "errors": sum(r["error"] for r in rows),
+            "ttft_p50_ms": _percentile(ttfts, 0.5),
+            "ttft_p95_ms": _percentile(ttfts, 0.95),
+            "total_p50_ms": _percentile([r["total_ms"] for r in rows], 0.5),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the generation scheduler against fake Ollama servers")
+    parser.add_argument("--servers", type=int, default=2, help="Fake Ollama servers")
+    parser.add_argument("--dead-servers", type=int, default=0, help="Extra endpoints that refuse connections")
+    parser.add_argument("--slots", type=int, default=2, help="Generation slots per server")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions, including the heavy one")
+    parser.add_argument("--questions", type=int, default=3, help="Questions sent at once by each light session")
+    parser.add_argument("--heavy-questions", type=int, default=24, help="Questions sent at once by the heavy session")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per fake answer")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between fake tokens")
+    parser.add_argument("--cancel-poll", type=float, default=0.05,
+                        help="Seconds between disconnect checks while queued")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR, help="Where results are kept")
+    parser.add_argument("--output", type=Path, help="Results file (default: <work-dir>/results/scheduler-<time>.json)")
+    args = parser.parse_args()
+
+    from src.generation import GenerationScheduler, ResponseGeneration
+    from src.observability import tracer
+    from src.resources import resources
+
+    servers = [FakeOllamaServer(args.tokens, args.token_delay) for _ in range(args.servers)]
+    dead = [_unused_url() for _ in range(args.dead_servers)]
+    scheduler = GenerationScheduler(
+        [server.url for server in servers] + dead, slots_per_endpoint=args.slots,
+        max_queued=args.heavy_questions + args.sessions * args.questions + 1, queue_timeout=None,
+        cancel_poll=args.cancel_poll
+    )
+    resources.override(generation_scheduler=scheduler)
+    generation = ResponseGeneration()
+
+    try:
+        tracer.reset()
+        start = time.perf_counter()
+        results = run_load(generation, args)
+        load_seconds = time.perf_counter() - start
+        queue_wait = tracer.summary().get("generation.queue_wait", {})
+        queued_cancel = check_queued_cancel(generation, scheduler, servers, args)
+        stream_close = check_stream_close(generation, scheduler, servers)
+    finally:
+        for server in servers:
+            server.stop()
+
+    sessions = _session_summary(results)
+    server_stats = [{"url": server.url, **server.stats()} for server in servers]
+    errors = sum(group["errors"] for group in sessions.values())
+
+    print(f"load:     {len(results)} generations in {load_seconds:.2f} s "
+          f"on {args.servers} servers x {args.slots} slots")
+    print(f"wait:     p50 {queue_wait.get('p50_ms', 0):.1f} ms, p95 {queue_wait.get('p95_ms', 0):.1f} ms")
+    for group, stats in sessions.items():
+        print(f"{group + ':':9} {stats['requests']:3d} requests, TTFT p50 {stats['ttft_p50_ms']:8.1f} ms, "
+              f"p95 {stats['ttft_p95_ms']:8.1f} ms, {stats['errors']} errors")
+    for stats in server_stats:
+        print(f"server:   {stats['url']} served {stats['requests']}, peak concurrency {stats['max_concurrency']}")
+    print(f"cancel:   queued request left in {queued_cancel['left_queue_ms']:.1f} ms, "
+          f"reached a server: {queued_cancel['reached_server']}")
+    print(f"close:    slot freed {stream_close['in_flight_after'] == 0}, "
+          f"server saw disconnect {stream_close['server_disconnected']}")
+
+    failures = []
+    if any(stats["max_concurrency"] > args.slots for stats in server_stats):
+        failures.append("a server ran more generations than its slots")
+    # Only generations sent to a dead endpoint before it cooled down may fail
+    if errors > args.dead_servers * args.slots:
+        failures.append(f"{errors} generations failed")
+    if sessions["light"]["requests"] and sessions["light"]["ttft_p95_ms"] >= sessions["heavy"]["ttft_p50_ms"]:
+        failures.append("light sessions waited behind the heavy session")
+    if not queued_cancel["passed"]:
+        failures.append("disconnected queued request was not dropped")
+    if not stream_close["passed"]:
+        failures.append("closed stream did not free its slot")
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = args.work_dir / "results" / f"scheduler-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **_git_commit(),
+        "settings": {key: str(value) if isinstance(value, Path) else value
+                     for key, value in vars(args).items() if key != "output"},
+        "load_seconds": round(load_seconds, 3),
+        "queue_wait": queue_wait,
+        "sessions": sessions,
+        "servers": server_stats,
+        "scheduler": scheduler.stats(),
+        "queued_cancel": queued_cancel,
+        "stream_close": stream_close,
+        "failures": failures,
+    }, indent=2))
+    print(f"Results written to {output}")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Import-time and startup-time budget check
+
+Starts fresh interpreters that import the pipeline and construct
+RAGPipeline, then reports median timings and which heavy modules and
+shared resources were loaded before the first query. Exits non-zero when
+a budget is exceeded, so it can gate CI.
+
+Usage:
+    python -m benchmarks.startup --import-budget 0.5 --startup-budget 1.0
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Modules that must not be imported before the first query or ingestion
+HEAVY_MODULES = ["chromadb", "langchain_community.document_loaders", "langchain_ollama", "sentence_transformers"]
+
+
+def measure() -> dict:
+    """Runs in a fresh interpreter: time the import and construction of the pipeline"""
+    import time
+
+    start = time.perf_counter()
+    from src.pipeline.rag_pipeline import RAGPipeline
+    imported = time.perf_counter()
+    pipeline = RAGPipeline()
+    constructed = time.perf_counter()
+
+    from src.resources import resources
+    return {
+        "import_seconds": imported - start,
+        "startup_seconds": constructed - start,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+        "resources": resources.created(),
+        "pipeline": type(pipeline).__name__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check pipeline import and startup time against a budget")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--import-budget", type=float, default=0.5, help="Seconds allowed to import the pipeline")
+    parser.add_argument("--startup-budget", type=float, default=1.0,
+                        help="Seconds allowed to import and construct the pipeline")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure()))
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child"],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    import_seconds = statistics.median(run["import_seconds"] for run in runs)
+    startup_seconds = statistics.median(run["startup_seconds"] for run in runs)
+    heavy_modules = sorted({name for run in runs for name in run["heavy_modules"]})
+    created = sorted({name for run in runs for name in run["resources"]})
+
+    print(f"import:   {import_seconds * 1000:8.1f} ms (budget {args.import_budget * 1000:.0f} ms)")
+    print(f"startup:  {startup_seconds * 1000:8.1f} ms (budget {args.startup_budget * 1000:.0f} ms)")
+    print(f"heavy modules loaded: {', '.join(heavy_modules) or 'none'}")
+    print(f"resources created:    {', '.join(created) or 'none'}")
+
+    failures = []
+    if import_seconds > args.import_budget:
+        failures.append("import time over budget")
+    if startup_seconds > args.startup_budget:
+        failures.append("startup time over budget")
+    if heavy_modules:
+        failures.append("heavy modules imported before first use")
+    if created:
+        failures.append("resources created before first use")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,173 @@ from pathlib import Path
 
 # Base paths
 BASE_DIR = Path(__file__).parent
-DATA_DIR = BASE_DIR / "data"
+# Overridable so benchmarks and tests can run against a scratch directory
+DATA_DIR = Path(os.getenv("PRIVATEGPT_DATA_DIR", BASE_DIR / "data"))
 RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
 VECTORDB_DIR = DATA_DIR / "chroma_db"
 
-# Ensure directories exist
-for dir_path in [RAW_DATA_DIR, PROCESSED_DATA_DIR, VECTORDB_DIR]:
-    dir_path.mkdir(parents=True, exist_ok=True)
+
+# Called by the components that write to these directories rather than at import time
+def ensure_data_dirs():
+    for dir_path in [RAW_DATA_DIR, PROCESSED_DATA_DIR, VECTORDB_DIR]:
+        dir_path.mkdir(parents=True, exist_ok=True)
+
 
 # Model configurations
 EMBEDDING_MODEL = "nomic-embed-text"
 LLM_MODEL = "mistral"
 OLLAMA_BASE_URL = "http://localhost:11434"
+LLM_KEEP_ALIVE = "30m"           # How long Ollama keeps the model, and its prompt cache, loaded between requests
+
+# Embedding client settings
+EMBEDDING_BATCH_SIZE = 64        # Texts sent per /api/embed request
+EMBEDDING_MAX_IN_FLIGHT = 4      # Concurrent embedding requests to Ollama
+EMBEDDING_MAX_RETRIES = 3        # Retries per batch on connection errors and 5xx/429
+EMBEDDING_TIMEOUT = 120          # Seconds per embedding request
+
+# Embedding cache settings
+# Lives outside chroma_db so rebuilding the collection reuses cached vectors
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 2_000_000   # ~6 GB of 768-dim float32 vectors
 
 # ChromaDB settings
 CHROMA_COLLECTION_NAME = "document_store"
 CHROMA_PERSIST_DIRECTORY = str(VECTORDB_DIR)
 
-# Chunking parameters
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+# Vector store settings
+# Overridable so benchmarks can compare backends on the same corpus
+VECTOR_STORE_BACKEND = os.getenv("PRIVATEGPT_VECTOR_STORE", "chroma")   # "chroma" or "numpy" (in-process memory-mapped matrix)
+NUMPY_STORE_DIR = VECTORDB_DIR / "numpy_store"
+NUMPY_SCAN_BLOCK_ROWS = 65536     # Vectors scored per matrix multiply, bounds scratch memory per search
+NUMPY_VACUUM_RATIO = 0.25         # Rewrite the vector file once this share of rows belongs to deleted chunks
+
+# Ingestion settings
+# Kept next to the collection so dropping the database also resets the manifest
+INGESTION_MANIFEST_PATH = VECTORDB_DIR / "ingestion_manifest.json"
+INGESTION_LOCK_PATH = VECTORDB_DIR / "ingestion.lock"   # Serializes ingestion runs across processes
+INGESTION_WORKERS = os.cpu_count() or 1   # Processes used to parse documents
+INGESTION_BATCH_SIZE = 256                # Chunks pushed to the vector store per batch
+
+# Parser settings
+PARSE_CACHE_ENABLED = True
+PARSE_CACHE_DIR = PROCESSED_DATA_DIR / "parsed"   # Gzipped parsed text keyed by content hash, survives db-reset
+PARSE_TIMEOUT_SECONDS = 60        # Time allowed to parse one file in a worker process...
+PARSE_TIMEOUT_PER_MB = 10         # ...plus this many seconds per MB of file size
+PARSE_MEMORY_LIMIT_MB = 2048      # Memory a parser process may allocate on top of what it starts with (Linux), None for no cap
+PARSE_LOG_PATH = DATA_DIR / "parse_log.jsonl"   # Per-file parse time and outcome, None to disable
+
+# Ingestion watcher settings
+WATCH_QUEUE_PATH = DATA_DIR / "ingestion_queue.sqlite3"   # Pending file events, kept across restarts
+WATCH_DEBOUNCE_SECONDS = 2.0      # Quiet time after a file's last event before it is ingested
+WATCH_MAX_DELAY_SECONDS = 30.0    # Files that keep changing are still ingested this often
+WATCH_POLL_INTERVAL = 5.0         # Seconds between directory scans when inotify (watchdog) is unavailable
+WATCH_BATCH_FILES = 16            # Files ingested per batch
+WATCH_MAX_ATTEMPTS = 5            # Tries per file before a failing one is dropped from the queue
+
+# Metadata and namespace settings
+METADATA_DIR_DEPTH = 3             # Folder levels stored as filterable dir_1..dir_N path prefixes
+NAMESPACE_FROM_FOLDER = False      # Use the top-level folder under data/raw as each chunk's namespace
+DEFAULT_NAMESPACE = "default"
+DEDICATED_NAMESPACES = []          # Large namespaces stored in their own collection
+
+# Chunking parameters (tokens are estimated as characters / CHARS_PER_TOKEN)
+CHUNKING_STRATEGY = "structure"   # "structure" (pages, headings, paragraphs, tables) or "recursive"
+CHUNK_TOKENS = 256                # Maximum chunk size
+CHUNK_MIN_TOKENS = 64             # A heading starts a new chunk once the current one has this many tokens
+# Overlap per strategy; structure-aware chunks are expanded with their neighbours at query time instead
+CHUNK_OVERLAP_TOKENS = {"structure": 0, "recursive": 50}
+CHUNK_NEIGHBOUR_WINDOW = 1        # Adjacent chunks on the same page stitched to each retrieved chunk, 0 to disable
 
 # Retrieval parameters
 TOP_K_RETRIEVAL = 5
+RETRIEVAL_MODE = "hybrid"         # "vector" or "hybrid" (BM25 + vector with reciprocal rank fusion)
+HYBRID_CANDIDATES = 20            # Candidates taken from each ranker before fusion
+RRF_K = 60                        # Reciprocal rank fusion damping constant
+
+# Rerank settings
+RERANK_ENABLED = True
+RERANKER = "embedding"            # "embedding" (query similarity), "cross-encoder" or "llm"
+RERANK_FETCH_K = 20               # Candidates over-fetched for reranking
+RERANK_TOP_N = TOP_K_RETRIEVAL    # Candidates passed on to generation
+MMR_LAMBDA = 0.7                  # 1.0 ranks purely by relevance, lower values favour diversity
+RERANK_BATCH_SIZE = 16
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_LLM_MODEL = LLM_MODEL
+
+# Lexical (BM25) index settings
+LEXICAL_INDEX_ENABLED = True
+LEXICAL_INDEX_PATH = VECTORDB_DIR / "lexical_index.sqlite3"
+BM25_K1 = 1.2
+BM25_B = 0.75
+LEXICAL_MAX_DF_RATIO = 0.2        # Skip query terms found in more than this share of chunks
+LEXICAL_MAX_POSTINGS = 5000       # Highest-impact postings scored per query term
+
+# Vector index settings
+VECTOR_INDEX = "chroma"           # "chroma" (HNSW) or "compact" (int8 memory-mapped scan with exact rescoring)
+COMPACT_INDEX_DIR = VECTORDB_DIR / "compact_index"
+COMPACT_RESCORE_CANDIDATES = 100  # Approximate hits re-scored against the embeddings the vector store keeps
+COMPACT_SCAN_BLOCK_ROWS = 8192    # Vectors scored per NumPy block, bounds scratch memory per query
+COMPACT_VACUUM_RATIO = 0.25       # Rewrite the files once this share of rows belongs to deleted chunks
+
+# Prompt budget settings (tokens are estimated as characters / CHARS_PER_TOKEN)
+CHARS_PER_TOKEN = 4
+CONTEXT_TOKEN_BUDGET = 2048       # Retrieved chunks packed into the prompt
+HISTORY_TOKEN_BUDGET = 768        # Chat history packed into the prompt
+HISTORY_RECENT_MESSAGES = 4       # Most recent messages kept verbatim when they fit
+HISTORY_OLD_MESSAGE_TOKENS = 64   # Older messages are truncated to this many tokens
+
+# Multi-turn chat settings
+SESSION_PROMPT_ENABLED = True     # Instructions and earlier turns form a stable prompt prefix Ollama can reuse
+SESSION_HISTORY_TOKEN_BUDGET = 1024   # Earlier turns in the session prompt, mostly served from Ollama's cache
+SESSION_MESSAGE_TOKENS = 128      # Earlier turns in the session prompt are truncated to this many tokens, whatever their age
+CONDENSE_QUESTIONS = True         # Rewrite follow-up questions into standalone retrieval queries
+CONDENSE_MAX_TOKENS = 64          # Output cap for a rewritten question
+PREFETCH_WORKERS = 4              # Speculative retrievals run while follow-up questions are rewritten
+
+# Generation scheduler settings
+GENERATION_ENDPOINTS = [OLLAMA_BASE_URL]   # Ollama servers generations are spread across
+GENERATION_SLOTS_PER_ENDPOINT = 4   # Concurrent generations per server; match OLLAMA_NUM_PARALLEL
+GENERATION_MAX_QUEUED = 64          # Generations waiting for a slot before new ones are refused
+GENERATION_QUEUE_TIMEOUT = 120      # Seconds a generation may wait for a slot
+GENERATION_PRIORITY_AGING = 30      # Seconds of waiting that count as one priority level, so batch work is not starved
+GENERATION_ENDPOINT_COOLDOWN = 30   # Seconds a server that failed to connect is skipped, unless all servers are
+GENERATION_CANCEL_POLL = 0.5        # Seconds between checks for disconnected clients while queued
+
+# Batch query settings
+BATCH_QUERY_SIZE = 64            # Questions embedded and searched together in batch mode
+BATCH_GENERATION_WORKERS = 4     # Answers generated concurrently in batch mode (see OLLAMA_NUM_PARALLEL)
+
+# Chat UI settings
+CHAT_HISTORY_PATH = DATA_DIR / "chat_history.sqlite3"
+CHAT_HISTORY_RETENTION_DAYS = 30  # Chat sessions idle for longer are deleted, None to keep them forever
+CHAT_WINDOW_MESSAGES = 20         # Latest messages shown when a chat is opened
+CHAT_PAGE_MESSAGES = 20           # Earlier messages loaded per "Show earlier messages" click
+CHAT_CONTEXT_MESSAGES = 12        # Latest messages passed to the pipeline, then trimmed to the history budget
+STREAM_RENDER_FPS = 12            # Redraws per second while an answer streams in
+
+# Response cache settings
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = 0.97   # Cosine similarity for semantic hits, None for exact matches only
+
+# Health check settings
+HEALTH_CHECK_TTL = 30            # Seconds liveness probe results are reused
+HEALTH_PROBE_TIMEOUT = 2         # Seconds before a probe counts as failed
+
+# Tracing settings
+TRACING_ENABLED = True
+TRACE_EXPORT_PATH = DATA_DIR / "traces.jsonl"   # Set to None to keep spans in memory only
+TRACE_WINDOW = 1000                              # Recent durations kept per stage for percentiles
+TRACE_EXPORT_MAX_BYTES = 50 * 1024 * 1024        # Rotate the export file at this size, 0 to never rotate
+TRACE_EXPORT_BACKUPS = 3                         # Rotated export files kept (traces.jsonl.1 is the newest)
+TRACE_FLUSH_INTERVAL = 1.0                       # Seconds between background writes of recorded spans
+TRACE_BUFFER_SPANS = 10000                       # Spans waiting to be written before new ones are dropped
+
+# HTTP API settings
+API_HOST = "127.0.0.1"
+API_PORT = 8000
+API_WORKERS = 8                  # Requests handled concurrently
+API_MAX_QUEUED = 32              # Requests waiting for a worker before new ones get 503
+API_IDLE_TIMEOUT = 15            # Seconds a connection may sit idle or stall mid-request before it is closed
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Answer a file of questions in batch mode
+Reads one JSON object per line with a "question" field (other fields such as
+"id" or an expected answer are copied to the output) and writes one JSON
+object per line with the answer and its sources, in input order.
+
+Usage:
+    python scripts/batch_query.py questions.jsonl -o answers.jsonl
+    python scripts/batch_query.py questions.jsonl --retrieval-only --filters '{"namespace": "hr"}'
+"""
+
+import argparse
+import json
+import sys
+import logging
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import TOP_K_RETRIEVAL, BATCH_QUERY_SIZE, BATCH_GENERATION_WORKERS
+from src.pipeline.rag_pipeline import RAGPipeline
+from src.retrieval import RetrievalFilter
+
+# Setup logging (stderr, so answers can be written to stdout)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+
+def read_questions(handle):
+    """Parse input records, failing on the first malformed line"""
+    records = []
+    for line_number, line in enumerate(handle, start=1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            record = {"question": record}
+        if not isinstance(record, dict) or not isinstance(record.get("question"), str):
+            raise ValueError(f"Line {line_number}: expected an object with a \"question\" string")
+        records.append(record)
+    return records
+
+
+def main():
+    """Main batch query process"""
+    logger = logging.getLogger(__name__)
+
+    parser = argparse.ArgumentParser(description="Answer questions from a JSONL file")
+    parser.add_argument("input", help="JSONL file of questions, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL file for answers (default: stdout)")
+    parser.add_argument("-k", type=int, default=TOP_K_RETRIEVAL, help="Documents used per answer")
+    parser.add_argument("--filters", type=json.loads, help="Retrieval filter applied to every question, as JSON")
+    parser.add_argument("--batch-size", type=int, default=BATCH_QUERY_SIZE,
+                        help="Questions embedded and searched together")
+    parser.add_argument("--workers", type=int, default=BATCH_GENERATION_WORKERS,
+                        help="Answers generated concurrently")
+    parser.add_argument("--retrieval-only", action="store_true", help="Only retrieve sources, skip generation")
+    args = parser.parse_args()
+
+    try:
+        filters = RetrievalFilter.from_dict(args.filters) if args.filters is not None else None
+        if args.input == "-":
+            records = read_questions(sys.stdin)
+        else:
+            with open(args.input, encoding="utf-8") as handle:
+                records = read_questions(handle)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Invalid input: {e}")
+        sys.exit(2)
+
+    logger.info(f"Answering {len(records)} questions...")
+    pipeline = RAGPipeline()
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    failed = 0
+
+    try:
+        results = pipeline.query_batch(
+            [record["question"] for record in records], k=args.k, filters=filters,
+            batch_size=args.batch_size, max_workers=args.workers, generate=not args.retrieval_only
+        )
+        for done, (record, result) in enumerate(zip(records, results), start=1):
+            failed += "error" in result
+            output.write(json.dumps({**record, **result}, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+            if done % 100 == 0:
+                logger.info(f"Answered {done}/{len(records)} questions")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"✅ Answered {len(records)} questions in {elapsed:.1f}s "
+                f"({len(records) / elapsed if elapsed else 0:.2f} questions/s, {failed} failed)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Standalone HTTP API for the RAG system
+Exposes /query (Server-Sent Events), /ingest and /health
+"""
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import API_HOST, API_PORT, API_WORKERS
+from src.api import create_server
+from src.pipeline.rag_pipeline import RAGPipeline
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def main():
+    """Start the API server"""
+    logger = logging.getLogger(__name__)
+
+    parser = argparse.ArgumentParser(description="Serve the RAG pipeline over HTTP")
+    parser.add_argument("--host", default=API_HOST, help="Interface to bind")
+    parser.add_argument("--port", type=int, default=API_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Requests handled concurrently")
+    parser.add_argument("--watch", action="store_true", help="Ingest changes to data/raw in the background")
+    args = parser.parse_args()
+
+    pipeline = RAGPipeline()
+    watcher = None
+    if args.watch:
+        # In-process, so queries see new chunks through the same Chroma client
+        from src.ingestion.watcher import IngestionWatcher
+        watcher = IngestionWatcher(pipeline.ingestion)
+        watcher.start()
+
+    server = create_server(pipeline, host=args.host, port=args.port, workers=args.workers)
+    logger.info(f"🌐 API listening on http://{args.host}:{args.port} with {args.workers} workers")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down API server...")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Watch data/raw and ingest documents as they are added, changed or removed
+Runs until interrupted; pending changes are kept in a queue on disk and
+picked up again on the next start.
+"""
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import WATCH_POLL_INTERVAL, WATCH_BATCH_FILES
+from src.ingestion.watcher import IngestionWatcher
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def main():
+    """Main watch process"""
+    parser = argparse.ArgumentParser(description="Ingest documents in data/raw as they change")
+    parser.add_argument("--poll", action="store_true", help="Scan the directory instead of using file events")
+    parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL,
+                        help="Seconds between scans in polling mode")
+    parser.add_argument("--batch-files", type=int, default=WATCH_BATCH_FILES, help="Files ingested per batch")
+    args = parser.parse_args()
+
+    watcher = IngestionWatcher(
+        poll_interval=args.poll_interval, batch_files=args.batch_files, use_watchdog=not args.poll
+    )
+    watcher.run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .server import RAGAPIServer, create_server
+
+__all__ = ['RAGAPIServer', 'create_server']
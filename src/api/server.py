@@ -0,0 +1,339 @@
+import json
+import logging
+import select
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from config import API_HOST, API_PORT, API_WORKERS, API_MAX_QUEUED, API_IDLE_TIMEOUT, TOP_K_RETRIEVAL
+from src.generation.scheduler import generation_request
+from src.observability import tracer
+from src.resources import resources
+from src.retrieval.filters import RetrievalFilter
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_QUERY_K = 50
+
+
+class IngestionJob:
+    """Runs pipeline ingestion in a background thread, one run at a time"""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.state = "idle"
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        """Start an ingestion run, returning False if one is already running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.state = "running"
+            self.error = None
+            self._thread = threading.Thread(target=self._run, name="api-ingestion", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        try:
+            self.pipeline.ingest_documents()
+            self.state = "completed"
+        except Exception as e:
+            logger.error(f"Background ingestion failed: {e}")
+            self.state = "failed"
+            self.error = str(e)
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "error": self.error}
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler exposing the RAG pipeline"""
+
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections and stalled clients give their worker back after this long
+    timeout = API_IDLE_TIMEOUT
+    server: "RAGAPIServer"
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def end_headers(self):
+        # Keep-alive only while no other connection waits for a worker
+        if self.close_connection or self.server.connections_waiting:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str, content_type: str = "text/plain; charset=utf-8"):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # The body's extent is unknown, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Invalid Content-Length"})
+            return None
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large"})
+            return None
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Request body must be JSON"})
+            return None
+        if not isinstance(data, dict):
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Request body must be a JSON object"})
+            return None
+        return data
+
+    def _send_event(self, data: Any, event: Optional[str] = None):
+        """Write one Server-Sent Event as a chunk of the chunked response"""
+        message = f"event: {event}\n" if event else ""
+        message += f"data: {json.dumps(data)}\n\n"
+        payload = message.encode("utf-8")
+        self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        with self.server.active_request():
+            self._get()
+
+    def do_POST(self):
+        with self.server.active_request():
+            self._post()
+
+    def _get(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            deep = parse_qs(url.query).get("deep", ["0"])[0] in ("1", "true")
+            self._send_json(HTTPStatus.OK, self.server.pipeline.health_check(deep=deep))
+        elif url.path == "/ingest":
+            self._send_json(HTTPStatus.OK, self.server.ingestion_job.status())
+        elif url.path == "/metrics":
+            # Prometheus scrapes the text format; ?format=json gives the same summary for humans
+            scheduler = resources.generation_scheduler()
+            if parse_qs(url.query).get("format", [""])[0] == "json":
+                self._send_json(HTTPStatus.OK, {**tracer.summary(), "generation_scheduler": scheduler.stats()})
+            else:
+                self._send_text(HTTPStatus.OK, tracer.prometheus_text() + scheduler.prometheus_text(),
+                                "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+
+    def _post(self):
+        path = urlsplit(self.path).path
+        if path == "/query":
+            self._handle_query()
+        elif path == "/ingest":
+            # The body is unused but must be drained to keep the connection usable
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.server.ingestion_job.start():
+                self._send_json(HTTPStatus.ACCEPTED, self.server.ingestion_job.status())
+            else:
+                self._send_json(HTTPStatus.CONFLICT, {"error": "Ingestion already running"})
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+
+    def _client_disconnected(self) -> bool:
+        """Whether the client closed its connection, checked while its generation is queued"""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            # A closed connection reads as end of file; pipelined request bytes are left in place
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return True
+
+    def _handle_query(self):
+        """Stream an answer as Server-Sent Events
+
+        Emits a ``sources`` event, one ``token`` event per generated chunk and
+        a final ``done`` event. Generations are queued per ``session_id``
+        (the client address when the body has none), and a queued generation
+        is dropped if its client disconnects.
+        """
+        data = self._read_json()
+        if data is None:
+            return
+
+        question = data.get("question")
+        if not isinstance(question, str) or not question.strip():
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "'question' must be a non-empty string"})
+            return
+
+        k = data.get("k", TOP_K_RETRIEVAL)
+        if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_QUERY_K:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"'k' must be an integer from 1 to {MAX_QUERY_K}"})
+            return
+        try:
+            chat_history = parse_chat_history(data.get("chat_history") or [])
+            filters = RetrievalFilter.from_dict(data["filters"]) if data.get("filters") else None
+        except ValueError as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+
+        if resources.generation_scheduler().saturated:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many generations queued"})
+            return
+
+        session_id = str(data.get("session_id") or self.client_address[0])
+        # The answer stream is consumed below, so its generation runs inside the block too
+        with generation_request(session_id, is_cancelled=self._client_disconnected):
+            result = self.server.pipeline.query_stream(question, chat_history, k=k, filters=filters)
+            answer_stream = result["answer_stream"]
+
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            try:
+                self._send_event({"sources": result["sources"], "cached": result.get("cached", False)},
+                                 event="sources")
+                for chunk in answer_stream:
+                    self._send_event({"token": chunk}, event="token")
+                self._send_event({}, event="done")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError, socket.timeout):
+                logger.info("Client disconnected or stopped reading mid-stream")
+                self.close_connection = True
+            finally:
+                # Stop generation promptly if the client went away
+                close = getattr(answer_stream, "close", None)
+                if close:
+                    close()
+
+
+def parse_chat_history(messages: Any) -> List:
+    """Convert ``[{"role": "user"|"assistant", "content": ...}]`` into chat messages
+
+    Raises ValueError describing the first malformed message.
+    """
+    if not isinstance(messages, list):
+        raise ValueError("'chat_history' must be a list of messages")
+    history = []
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict):
+            raise ValueError(f"'chat_history[{i}]' must be an object with 'role' and 'content'")
+        role = message.get("role")
+        content = message.get("content", "")
+        if not isinstance(content, str):
+            raise ValueError(f"'chat_history[{i}].content' must be a string")
+        if role == "user":
+            history.append(HumanMessage(content=content))
+        elif role == "assistant":
+            history.append(AIMessage(content=content))
+        else:
+            raise ValueError(f"'chat_history[{i}].role' must be 'user' or 'assistant'")
+    return history
+
+
+class RAGAPIServer(HTTPServer):
+    """HTTP server that handles connections on a fixed-size worker pool
+
+    Load is counted as requests being handled plus connections waiting for
+    a worker; idle keep-alive connections do not count. New connections
+    beyond ``workers + max_queued`` are rejected with 503 instead of piling
+    up behind slow generations. While connections wait, responses close
+    their connection so its worker moves on, and an idle connection gives
+    its worker back after the handler ``timeout``.
+    """
+
+    def __init__(self, pipeline, host: str = API_HOST, port: int = API_PORT,
+                 workers: int = API_WORKERS, max_queued: int = API_MAX_QUEUED):
+        super().__init__((host, port), RAGRequestHandler)
+        self.pipeline = pipeline
+        self.ingestion_job = IngestionJob(pipeline)
+        self.capacity = workers + max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+        self._waiting = 0
+        self._active = 0
+        self._counts_lock = threading.Lock()
+
+    @property
+    def connections_waiting(self) -> int:
+        """Accepted connections not yet picked up by a worker"""
+        return self._waiting
+
+    @contextmanager
+    def active_request(self):
+        """Count a request as load while it is handled"""
+        with self._counts_lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._counts_lock:
+                self._active -= 1
+
+    def process_request(self, request, client_address):
+        with self._counts_lock:
+            if self._waiting + self._active >= self.capacity:
+                self._reject(request)
+                return
+            self._waiting += 1
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        with self._counts_lock:
+            self._waiting -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def _reject(self, request):
+        body = b'{"error": "Server busy"}'
+        try:
+            request.sendall(
+                b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                b"Retry-After: 1\r\nConnection: close\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+def create_server(pipeline=None, host: str = API_HOST, port: int = API_PORT,
+                  workers: int = API_WORKERS) -> RAGAPIServer:
+    """Build an API server around a pipeline, creating the default RAGPipeline if none is given"""
+    if pipeline is None:
+        from src.pipeline.rag_pipeline import RAGPipeline
+        pipeline = RAGPipeline()
+    return RAGAPIServer(pipeline, host=host, port=port, workers=workers)
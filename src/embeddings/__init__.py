@@ -0,0 +1,4 @@
+from .ollama_client import BatchedOllamaEmbeddings, EmbeddingMetrics
+from .cache import CachedEmbeddings, wrap_with_cache
+
+__all__ = ['BatchedOllamaEmbeddings', 'EmbeddingMetrics', 'CachedEmbeddings', 'wrap_with_cache']
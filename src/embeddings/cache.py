@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 900
+
+
+def _encode(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _decode(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """On-disk LRU cache around another embeddings client
+
+    Vectors are stored as float32 blobs in SQLite, keyed by
+    ``(model, sha256(text))``. When the cache grows past ``max_entries`` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, path: Path = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model = model
+        self.path = Path(path)
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors and mark them as recently used"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                batch = hashes[start:start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model, *batch]
+                ).fetchall()
+                found.update((text_hash, _decode(blob)) for text_hash, blob in rows)
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        """Insert new vectors and evict the least recently used entries if over capacity"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model, text_hash, _encode(vector), now) for text_hash, vector in vectors.items()]
+            )
+            self._entries += cursor.rowcount
+
+            if self._entries > self.max_entries:
+                # Evict down to 90% of capacity so eviction is not paid on every insert
+                self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = self._entries - int(self.max_entries * 0.9)
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self._entries -= excess
+                    logger.info(f"Evicted {excess} entries from embedding cache")
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, only sending uncached and unique texts to the underlying client"""
+        if not texts:
+            return []
+
+        hashes = [self._hash(text) for text in texts]
+        vectors = self._lookup(list(set(hashes)))
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+
+        with self._lock:
+            self.hits += len(texts) - sum(1 for text_hash in hashes if text_hash in missing)
+            self.misses += len(missing)
+
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            self._store(computed)
+            vectors.update(computed)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query through the cache"""
+        text_hash = self._hash(text)
+        cached = self._lookup([text_hash])
+        if text_hash in cached:
+            with self._lock:
+                self.hits += 1
+            return cached[text_hash]
+
+        with self._lock:
+            self.misses += 1
+        vector = self.underlying.embed_query(text)
+        self._store({text_hash: vector})
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of embed_documents; SQLite access runs in the default executor"""
+        if not texts:
+            return []
+
+        loop = asyncio.get_running_loop()
+        hashes = [self._hash(text) for text in texts]
+        vectors = await loop.run_in_executor(None, self._lookup, list(set(hashes)))
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+
+        with self._lock:
+            self.hits += len(texts) - sum(1 for text_hash in hashes if text_hash in missing)
+            self.misses += len(missing)
+
+        if missing:
+            new_vectors = await self.underlying.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            await loop.run_in_executor(None, self._store, computed)
+            vectors.update(computed)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async variant of embed_query"""
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": self._entries,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        close = getattr(self.underlying, "close", None)
+        if close:
+            close()
+
+
+def wrap_with_cache(embeddings: Embeddings, model: str, enabled: bool = True) -> Embeddings:
+    """Wrap an embeddings client with the persistent cache when enabled"""
+    if not enabled:
+        return embeddings
+    try:
+        return CachedEmbeddings(embeddings, model=model)
+    except sqlite3.Error as e:
+        logger.error(f"Embedding cache unavailable, embedding without cache: {e}")
+        return embeddings
+
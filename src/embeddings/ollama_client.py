@@ -0,0 +1,305 @@
+import asyncio
+import http.client
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlparse
+
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_MODEL, OLLAMA_BASE_URL, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_IN_FLIGHT, EMBEDDING_MAX_RETRIES, EMBEDDING_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingRequestError(Exception):
+    """Raised when Ollama rejects or fails an embedding request"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@dataclass
+class EmbeddingMetrics:
+    """Thread-safe throughput counters for an embedding client"""
+    requests: int = 0
+    retries: int = 0
+    chunks: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, chunks: int, tokens: int, seconds: float, retries: int = 0):
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.chunks += chunks
+            self.tokens += tokens
+            self.seconds += seconds
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """Snapshot of the counters and derived rates
+
+        ``seconds`` is the summed request time, so with several requests in
+        flight the rates describe per-request throughput, not wall-clock.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "chunks": self.chunks,
+                "tokens": self.tokens,
+                "seconds": round(self.seconds, 3),
+                "chunks_per_second": round(self.chunks_per_second, 2),
+                "tokens_per_second": round(self.tokens_per_second, 2),
+            }
+
+
+class _ConnectionPool:
+    """Small pool of keep-alive HTTP connections to one host"""
+
+    def __init__(self, base_url: str, timeout: float):
+        parsed = urlparse(base_url)
+        self.scheme = parsed.scheme or "http"
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+
+        try:
+            yield conn
+        except Exception:
+            # A failed connection may be half-read; never hand it out again
+            conn.close()
+            raise
+        else:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class BatchedOllamaEmbeddings(Embeddings):
+    """Embedding client for the Ollama ``/api/embed`` endpoint
+
+    Texts are sent in batches of ``batch_size`` with at most ``max_in_flight``
+    concurrent requests over pooled keep-alive connections. Connection errors,
+    5xx and 429 responses are retried with exponential backoff. The async
+    methods share one Ollama client and request limit per event loop.
+    """
+
+    def __init__(self, model: str = EMBEDDING_MODEL, base_url: str = OLLAMA_BASE_URL,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+                 max_retries: int = EMBEDDING_MAX_RETRIES, timeout: float = EMBEDDING_TIMEOUT,
+                 backoff_base: float = 0.5):
+        self.model = model
+        self.base_url = base_url
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.metrics = EmbeddingMetrics()
+        self.timeout = timeout
+        self._pool = _ConnectionPool(base_url, timeout)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Event loop -> (async client, request semaphore)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight,
+                    thread_name_prefix="ollama-embed"
+                )
+            return self._executor
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a JSON payload and decode the JSON response"""
+        body = json.dumps(payload).encode("utf-8")
+        try:
+            with self._pool.connection() as conn:
+                conn.request(
+                    "POST", self._pool.base_path + path, body=body,
+                    headers={"Content-Type": "application/json"}
+                )
+                response = conn.getresponse()
+                data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise EmbeddingRequestError(f"Connection to {self.base_url} failed: {e}", retryable=True)
+
+        if response.status >= 400:
+            retryable = response.status >= 500 or response.status == 429
+            raise EmbeddingRequestError(
+                f"Ollama returned HTTP {response.status}: {data[:200].decode('utf-8', 'replace')}",
+                retryable=retryable
+            )
+        return json.loads(data)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying transient failures"""
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                data = self._post("/api/embed", {"model": self.model, "input": texts})
+            except EmbeddingRequestError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                logger.warning(f"Embedding request failed ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            embeddings = data.get("embeddings") or []
+            if len(embeddings) != len(texts):
+                raise EmbeddingRequestError(
+                    f"Expected {len(texts)} embeddings from Ollama, got {len(embeddings)}"
+                )
+            self.metrics.record(
+                chunks=len(texts),
+                tokens=data.get("prompt_eval_count", 0),
+                seconds=time.perf_counter() - start,
+                retries=attempt
+            )
+            return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in concurrent batches, preserving input order"""
+        if not texts:
+            return []
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+
+        embeddings = []
+        for batch_embeddings in self._get_executor().map(self._embed_batch, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        return self._embed_batch([text])[0]
+
+    async def _aembed_batch(self, client, semaphore: asyncio.Semaphore, texts: List[str]) -> List[List[float]]:
+        """Embed one batch with the async Ollama client, retrying transient failures"""
+        import httpx
+        from ollama import ResponseError
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                async with semaphore:
+                    response = await client.embed(model=self.model, input=texts)
+            except (ResponseError, httpx.TransportError, ConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = status is None or status >= 500 or status == 429
+                if not retryable or attempt >= self.max_retries:
+                    raise EmbeddingRequestError(f"Async embedding request failed: {e}", retryable=retryable)
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                logger.warning(f"Embedding request failed ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            embeddings = [list(vector) for vector in response["embeddings"]]
+            if len(embeddings) != len(texts):
+                raise EmbeddingRequestError(
+                    f"Expected {len(texts)} embeddings from Ollama, got {len(embeddings)}"
+                )
+            self.metrics.record(
+                chunks=len(texts),
+                tokens=response.get("prompt_eval_count") or 0,
+                seconds=time.perf_counter() - start,
+                retries=attempt
+            )
+            return embeddings
+
+    def _async_client(self) -> Tuple[Any, asyncio.Semaphore]:
+        """Async Ollama client and request semaphore of the running event loop, created on first use
+
+        Both are bound to the loop that created them, so each loop gets its
+        own; those of closed loops are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        with self._executor_lock:
+            entry = self._async_clients.get(loop)
+            if entry is None:
+                from ollama import AsyncClient
+
+                for closed in [other for other in self._async_clients if other.is_closed()]:
+                    del self._async_clients[closed]
+                entry = (AsyncClient(host=self.base_url, timeout=self.timeout), asyncio.Semaphore(self.max_in_flight))
+                self._async_clients[loop] = entry
+            return entry
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts without blocking the event loop, with the same batching and concurrency limits"""
+        if not texts:
+            return []
+
+        client, semaphore = self._async_client()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._aembed_batch(client, semaphore, batch) for batch in batches))
+        return [vector for batch_embeddings in results for vector in batch_embeddings]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query without blocking the event loop"""
+        return (await self.aembed_documents([text]))[0]
+
+    async def aclose(self):
+        """Close the running event loop's async client and its connections"""
+        with self._executor_lock:
+            entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].close()
+
+    def close(self):
+        """Shut down worker threads and pooled connections"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            # Async clients can only be closed on their own loop; their connections go with them
+            self._async_clients.clear()
+        self._pool.close()
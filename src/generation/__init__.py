@@ -1,3 +1,10 @@
-from .response_generator import ResponseGeneration
+from .response_generator import ResponseGeneration, StreamOutcome, ERROR_RESPONSE_PREFIX
+from .scheduler import (
+    GenerationScheduler, GenerationCancelled, SchedulerFull, QueueTimeout, generation_request,
+    PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
 
-__all__ = ['ResponseGeneration']
+__all__ = [
+    'ResponseGeneration', 'StreamOutcome', 'ERROR_RESPONSE_PREFIX', 'GenerationScheduler', 'GenerationCancelled',
+    'SchedulerFull', 'QueueTimeout', 'generation_request', 'PRIORITY_INTERACTIVE', 'PRIORITY_BATCH'
+]
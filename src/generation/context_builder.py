@@ -0,0 +1,180 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain_core.messages import AIMessage, HumanMessage
+
+from config import (
+    CHARS_PER_TOKEN, CHUNK_OVERLAP_TOKENS, CONTEXT_TOKEN_BUDGET, HISTORY_TOKEN_BUDGET,
+    HISTORY_RECENT_MESSAGES, HISTORY_OLD_MESSAGE_TOKENS, SESSION_HISTORY_TOKEN_BUDGET, SESSION_MESSAGE_TOKENS
+)
+from src.utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Overlaps shorter than this are treated as coincidence rather than splitter overlap
+MIN_OVERLAP_CHARS = 20
+CHUNK_SEPARATOR = "\n\n"
+
+
+def _overlap(left: str, right: str, max_chars: int) -> int:
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``"""
+    for length in range(min(len(left), len(right), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+@dataclass
+class _Passage:
+    text: str
+    source: Optional[Tuple]
+
+
+class ContextBuilder:
+    """Packs retrieved chunks and chat history into fixed token budgets
+
+    Chunks are taken in relevance order. Exact duplicates are dropped, and
+    neighbouring chunks from the same source that share splitter overlap are
+    merged so the overlap is only paid once. Chat history is filled from the
+    newest message backwards: recent messages verbatim, older ones truncated,
+    and the oldest dropped once the budget is spent.
+    """
+
+    def __init__(self, context_budget: int = CONTEXT_TOKEN_BUDGET, history_budget: int = HISTORY_TOKEN_BUDGET,
+                 recent_messages: int = HISTORY_RECENT_MESSAGES,
+                 old_message_tokens: int = HISTORY_OLD_MESSAGE_TOKENS,
+                 session_history_budget: int = SESSION_HISTORY_TOKEN_BUDGET,
+                 session_message_tokens: int = SESSION_MESSAGE_TOKENS,
+                 count_tokens: Callable[[str], int] = estimate_tokens,
+                 max_overlap_chars: int = max(CHUNK_OVERLAP_TOKENS.values()) * CHARS_PER_TOKEN * 2):
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.recent_messages = recent_messages
+        self.old_message_tokens = old_message_tokens
+        self.session_history_budget = session_history_budget
+        self.session_message_tokens = session_message_tokens
+        self.count_tokens = count_tokens
+        self.max_overlap_chars = max_overlap_chars
+
+    @staticmethod
+    def _source_key(doc: Document) -> Optional[Tuple]:
+        source = doc.metadata.get("source")
+        return (source, doc.metadata.get("page")) if source else None
+
+    def _merge(self, passages: List[_Passage], doc: Document) -> bool:
+        """Fold a chunk into an already selected passage, returning True if it was absorbed"""
+        text = doc.page_content
+        source = self._source_key(doc)
+
+        for passage in passages:
+            if text in passage.text:
+                return True
+            if source is None or passage.source != source:
+                continue
+            if passage.text in text:
+                passage.text = text
+                return True
+
+            overlap = _overlap(passage.text, text, self.max_overlap_chars)
+            if overlap:
+                passage.text += text[overlap:]
+                return True
+            overlap = _overlap(text, passage.text, self.max_overlap_chars)
+            if overlap:
+                passage.text = text + passage.text[overlap:]
+                return True
+        return False
+
+    def build_context(self, relevant_docs: List[Document]) -> str:
+        """Deduplicate chunks and pack them, most relevant first, into the context budget"""
+        passages: List[_Passage] = []
+        for doc in relevant_docs:
+            if not self._merge(passages, doc):
+                passages.append(_Passage(text=doc.page_content, source=self._source_key(doc)))
+
+        separator_tokens = self.count_tokens(CHUNK_SEPARATOR)
+        selected = []
+        used = 0
+        for passage in passages:
+            tokens = self.count_tokens(passage.text) + (separator_tokens if selected else 0)
+            # A passage that does not fit is skipped so smaller, less relevant ones can still be used
+            if used + tokens > self.context_budget:
+                continue
+            selected.append(passage.text)
+            used += tokens
+
+        if len(selected) < len(passages):
+            logger.info(f"Context budget kept {len(selected)} of {len(passages)} passages (~{used} tokens)")
+        return CHUNK_SEPARATOR.join(selected)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        return text[:max_chars].rsplit(" ", 1)[0] + " …"
+
+    @staticmethod
+    def _history_messages(chat_history: List, question: Optional[str]) -> List:
+        messages = [msg for msg in chat_history or [] if isinstance(msg, (HumanMessage, AIMessage))]
+
+        # The current question is usually already appended to the history by the caller
+        if question is not None and messages and isinstance(messages[-1], HumanMessage) \
+                and messages[-1].content == question:
+            messages = messages[:-1]
+        return messages
+
+    def build_history(self, chat_history: List, question: Optional[str] = None) -> str:
+        """Format chat history within the history budget"""
+        messages = self._history_messages(chat_history, question)
+
+        if not messages:
+            return "No previous conversation."
+
+        lines = []
+        used = 0
+        for age, message in enumerate(reversed(messages)):
+            speaker = "Human" if isinstance(message, HumanMessage) else "Assistant"
+            content = message.content
+            if age >= self.recent_messages:
+                content = self._truncate(content, self.old_message_tokens)
+
+            line = f"{speaker}: {content}"
+            tokens = self.count_tokens(line)
+            if used + tokens > self.history_budget:
+                if lines:
+                    break
+                # Always keep at least the latest message, truncated to the budget
+                line = self._truncate(line, self.history_budget)
+                tokens = self.count_tokens(line)
+            lines.append(line)
+            used += tokens
+
+        return "\n".join(reversed(lines))
+
+    def build_session_history(self, chat_history: List, question: Optional[str] = None) -> List:
+        """Chat history as messages that stay identical from one turn to the next
+
+        Unlike ``build_history``, every message is truncated to the same
+        ``session_message_tokens`` whatever its age, and once the history
+        outgrows ``session_history_budget`` the oldest messages are dropped
+        until only half of it is used. Earlier turns therefore form a prompt prefix that
+        only changes every few turns, which Ollama can keep cached.
+        """
+        messages = self._history_messages(chat_history, question)
+        contents = [self._truncate(message.content, self.session_message_tokens) for message in messages]
+        tokens = [self.count_tokens(content) for content in contents]
+
+        start = used = 0
+        for index, message_tokens in enumerate(tokens):
+            used += message_tokens
+            if used > self.session_history_budget:
+                while start <= index and used > self.session_history_budget // 2:
+                    used -= tokens[start]
+                    start += 1
+        # Chat templates expect the conversation to open with a human turn
+        while start < len(messages) and not isinstance(messages[start], HumanMessage):
+            start += 1
+
+        return [type(message)(content=content) for message, content in zip(messages[start:], contents[start:])]
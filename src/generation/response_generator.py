@@ -1,40 +1,26 @@
-from typing import List, Dict, Any, Iterator, Optional, Callable
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Callable
 import logging
+import math
+import time
+from dataclasses import dataclass
 
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema import Document
-from langchain_core.messages import HumanMessage, AIMessage
 
-from config import LLM_MODEL, OLLAMA_BASE_URL
+from config import CHARS_PER_TOKEN, SESSION_PROMPT_ENABLED, CONDENSE_MAX_TOKENS
+from src.observability import tracer
+from src.resources import resources
+from src.utils.tokens import estimate_tokens
+from .context_builder import ContextBuilder
+from .scheduler import GenerationCancelled, GenerationScheduler
 
 logger = logging.getLogger(__name__)
 
+ERROR_RESPONSE_PREFIX = "I apologize, but I encountered an error while generating a response"
 
-class ResponseGeneration:
-    """Handles response generation using LLM with context from retrieved documents and chat history"""
-    
-    def __init__(self):
-        self.llm = ChatOllama(
-            model=LLM_MODEL,
-            base_url=OLLAMA_BASE_URL
-        )
-        self.output_parser = StrOutputParser()
-        
-        # RAG prompt template with chat history
-        self.prompt_template = ChatPromptTemplate.from_template("""You are a helpful assistant that answers questions based on the provided context and chat history.
-
-Context:
-{context}
-
-Chat History:
-{chat_history}
+PROMPT_INTRO = "You are a helpful assistant that answers questions based on the provided context and chat history."
 
-Current Question: {question}
-
-Instructions:
-- Answer the question based on the context provided and previous conversation
+ANSWER_INSTRUCTIONS = """- Answer the question based on the context provided and previous conversation
 - If the context doesn't contain enough information to answer the question, say so
 - Be concise and accurate
 - Cite specific information from the context when relevant
@@ -42,47 +28,222 @@ Instructions:
 - If the question and the context are unrelated, specify that it's not clear
 - Format the answers so that they are easy to read. Use indents, point forms or spacings
 - Encourage the use of Emojis if it helps with answer clarity
-- Consider the chat history to provide contextual responses
+- Consider the chat history to provide contextual responses"""
+
+# The instructions open the conversation as a regular exchange rather than a system message:
+# some chat templates (Mistral's among them) render the system prompt next to the last
+# message, which would change the prompt prefix on every turn.
+SESSION_PREFIX = [
+    ("human", PROMPT_INTRO + " Each of my questions comes with context from my documents.\n\n"
+              "Instructions:\n" + ANSWER_INSTRUCTIONS),
+    ("ai", "Understood. Send me the context and your question."),
+    MessagesPlaceholder("chat_history"),
+]
+
+@dataclass
+class StreamOutcome:
+    """How a response stream ended, filled in by the stream itself
+
+    The streamed text alone cannot tell a complete answer from one cut short
+    by an error or a cancellation, so callers that keep answers check
+    ``completed`` once the stream is exhausted.
+    """
+    completed: bool = False
+
+
+CONDENSE_REQUEST = """Rewrite my next question as a standalone search query that can be understood without our conversation, resolving references to earlier messages. Reply with the query only.
 
-Answer:""")
+Question: {question}"""
+
+
+class ResponseGeneration:
+    """Handles response generation using LLM with context from retrieved documents and chat history"""
     
-    def _format_chat_history(self, chat_history: List) -> str:
-        """Format chat history for inclusion in prompt"""
-        if not chat_history:
-            return "No previous conversation."
-        
-        formatted_history = []
-        for message in chat_history[-10:]:  # Keep last 10 messages to avoid token limit
-            if isinstance(message, HumanMessage):
-                formatted_history.append(f"Human: {message.content}")
-            elif isinstance(message, AIMessage):
-                formatted_history.append(f"Assistant: {message.content}")
+    def __init__(self, session_prompts: bool = SESSION_PROMPT_ENABLED):
+        self.context_builder = ContextBuilder()
         
-        return "\n".join(formatted_history)
+        self.session_prompts = session_prompts
+        # Single-message prompt: context, chat history and question followed by the instructions
+        self.prompt_template = ChatPromptTemplate.from_template(
+            PROMPT_INTRO + "\n\nContext:\n{context}\n\nChat History:\n{chat_history}\n\n"
+            "Current Question: {question}\n\nInstructions:\n" + ANSWER_INSTRUCTIONS + "\n\nAnswer:"
+        )
+        # Session prompt: instructions and earlier turns first, so consecutive turns share a prefix
+        self.session_prompt = ChatPromptTemplate.from_messages(
+            SESSION_PREFIX + [("human", "Context:\n{context}\n\nQuestion: {question}")]
+        )
+        self.condense_prompt = ChatPromptTemplate.from_messages(SESSION_PREFIX + [("human", CONDENSE_REQUEST)])
+
+    @property
+    def llm(self):
+        """Shared chat model, created on first generation"""
+        return resources.llm()
+
+    @property
+    def scheduler(self) -> GenerationScheduler:
+        """Shared scheduler every generation waits on for a slot"""
+        return resources.generation_scheduler()
+
+    def _format_chat_history(self, chat_history: List, question: Optional[str] = None) -> str:
+        """Format chat history for inclusion in prompt, within the history token budget"""
+        return self.context_builder.build_history(chat_history, question)
+
+    def _build_inputs(self, query: str, relevant_docs: List[Document], chat_history: List) -> Dict[str, Any]:
+        """Prompt variables for a query, traced with their estimated token counts"""
+        with tracer.span("generation.build_prompt", documents=len(relevant_docs),
+                         session=self.session_prompts) as span:
+            inputs = {
+                # Deduplicate and pack relevant documents into the context budget
+                "context": self.context_builder.build_context(relevant_docs),
+                "question": query,
+            }
+            if self.session_prompts:
+                inputs["chat_history"] = self.context_builder.build_session_history(chat_history, query)
+                history_tokens = sum(estimate_tokens(message.content) for message in inputs["chat_history"])
+            else:
+                inputs["chat_history"] = self._format_chat_history(chat_history, query)
+                history_tokens = estimate_tokens(inputs["chat_history"])
+            span.set(
+                context_tokens=estimate_tokens(inputs["context"]),
+                history_tokens=history_tokens,
+                prompt_tokens=estimate_tokens(inputs["context"]) + estimate_tokens(query) + history_tokens
+            )
+        return inputs
+
+    def _messages(self, inputs: Dict[str, Any]) -> List:
+        prompt = self.session_prompt if self.session_prompts else self.prompt_template
+        return prompt.format_messages(**inputs)
+
+    def _condense_messages(self, question: str, chat_history: List) -> List:
+        # Shares the session prompt's prefix, so Ollama only processes the rewrite request itself
+        return self.condense_prompt.format_messages(
+            question=question, chat_history=self.context_builder.build_session_history(chat_history, question)
+        )
+
+    def _condense_options(self) -> Dict[str, Any]:
+        # Options replace the model's defaults; a different context size would make Ollama reload the model
+        return {"num_ctx": getattr(self.llm, "num_ctx", None), "num_predict": CONDENSE_MAX_TOKENS, "temperature": 0}
+
+    @staticmethod
+    def _clean_condensed(text: str, question: str) -> str:
+        lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+        if not lines:
+            return question
+        condensed = lines[0]
+        if condensed.lower().startswith(("query:", "question:")):
+            condensed = condensed.split(":", 1)[1].strip()
+        return condensed.strip('"\'') or question
+
+    def condense_question(self, question: str, chat_history: List) -> str:
+        """Rewrite a follow-up question into a standalone retrieval query, falling back to the question itself"""
+        try:
+            with tracer.span("generation.condense") as span, self.scheduler.acquire() as lease:
+                response = resources.llm(lease.endpoint).invoke(
+                    self._condense_messages(question, chat_history),
+                    options=self._condense_options()
+                )
+                condensed = self._clean_condensed(response.content, question)
+                span.set(rewritten=condensed != question)
+            return condensed
+        except Exception as e:
+            logger.error(f"Error condensing question, retrieving with it as asked: {e}")
+            return question
+
+    async def acondense_question(self, question: str, chat_history: List) -> str:
+        """Async variant of condense_question"""
+        try:
+            with tracer.span("generation.condense") as span, await self.scheduler.aacquire() as lease:
+                response = await resources.llm(lease.endpoint).ainvoke(
+                    self._condense_messages(question, chat_history),
+                    options=self._condense_options()
+                )
+                condensed = self._clean_condensed(response.content, question)
+                span.set(rewritten=condensed != question)
+            return condensed
+        except Exception as e:
+            logger.error(f"Error condensing question, retrieving with it as asked: {e}")
+            return question
+
+    @staticmethod
+    def _record_stream(start: float, first_chunk_at: Optional[float], chunks: int, output_chars: int):
+        """Trace time to first token and total streaming time of one generation"""
+        if first_chunk_at is not None:
+            tracer.record("generation.ttft", (first_chunk_at - start) * 1000)
+        tracer.record(
+            "generation.stream", (time.perf_counter() - start) * 1000,
+            chunks=chunks, output_tokens=math.ceil(output_chars / CHARS_PER_TOKEN)
+        )
     
     def generate_response_stream(self, query: str, relevant_docs: List[Document], 
-                               chat_history: List = None) -> Iterator[str]:
-        """Generate streaming response using retrieved documents and chat history"""
+                               chat_history: List = None, outcome: Optional[StreamOutcome] = None) -> Iterator[str]:
+        """Generate streaming response using retrieved documents and chat history
+
+        ``outcome.completed`` is set only if the model's answer was streamed in full.
+        """
         try:
-            # Combine relevant documents into context
-            context = "\n\n".join([doc.page_content for doc in relevant_docs])
-            
-            # Format chat history
-            formatted_history = self._format_chat_history(chat_history or [])
-            
-            # Create the chain
-            chain = self.prompt_template | self.llm | self.output_parser
+            inputs = self._build_inputs(query, relevant_docs, chat_history or [])
             
-            # Stream the response
-            for chunk in chain.stream({
-                "context": context,
-                "question": query,
-                "chat_history": formatted_history
-            }):
-                yield chunk
+            # Wait for a generation slot, then stream from the server it belongs to
+            with self.scheduler.acquire() as lease:
+                # Streamed from the model itself: closing a runnable sequence's stream drains it instead
+                stream = resources.llm(lease.endpoint).stream(self._messages(inputs))
+                try:
+                    start = time.perf_counter()
+                    first_chunk_at = None
+                    chunks = output_chars = 0
+                    for message in stream:
+                        chunk = message.content
+                        if first_chunk_at is None:
+                            first_chunk_at = time.perf_counter()
+                        chunks += 1
+                        output_chars += len(chunk)
+                        yield chunk
+                finally:
+                    # Drops the connection when the consumer stops early, so the server stops generating
+                    stream.close()
                 
+            self._record_stream(start, first_chunk_at, chunks, output_chars)
             logger.info("Streaming response generated successfully")
+            if outcome is not None:
+                outcome.completed = True
             
+        except GenerationCancelled as e:
+            # Nobody is left to read an answer
+            logger.info(f"Generation dropped: {e}")
+        except Exception as e:
+            logger.error(f"Error generating streaming response: {e}")
+            yield f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
+
+    async def agenerate_response_stream(self, query: str, relevant_docs: List[Document],
+                                        chat_history: List = None,
+                                        outcome: Optional[StreamOutcome] = None) -> AsyncIterator[str]:
+        """Async variant of generate_response_stream built on the async Ollama client"""
+        try:
+            inputs = self._build_inputs(query, relevant_docs, chat_history or [])
+
+            with await self.scheduler.aacquire() as lease:
+                stream = resources.llm(lease.endpoint).astream(self._messages(inputs))
+                try:
+                    start = time.perf_counter()
+                    first_chunk_at = None
+                    chunks = output_chars = 0
+                    async for message in stream:
+                        chunk = message.content
+                        if first_chunk_at is None:
+                            first_chunk_at = time.perf_counter()
+                        chunks += 1
+                        output_chars += len(chunk)
+                        yield chunk
+                finally:
+                    await stream.aclose()
+
+            self._record_stream(start, first_chunk_at, chunks, output_chars)
+            logger.info("Streaming response generated successfully")
+            if outcome is not None:
+                outcome.completed = True
+
+        except GenerationCancelled as e:
+            logger.info(f"Generation dropped: {e}")
         except Exception as e:
             logger.error(f"Error generating streaming response: {e}")
-            yield f"I apologize, but I encountered an error while generating a response: {str(e)}"
+            yield f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
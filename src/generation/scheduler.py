@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence
+
+from config import (
+    GENERATION_ENDPOINTS, GENERATION_SLOTS_PER_ENDPOINT, GENERATION_MAX_QUEUED, GENERATION_QUEUE_TIMEOUT,
+    GENERATION_PRIORITY_AGING, GENERATION_ENDPOINT_COOLDOWN, GENERATION_CANCEL_POLL
+)
+from src.observability import tracer
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first; aging lifts a batch request level with interactive
+# ones after PRIORITY_BATCH * GENERATION_PRIORITY_AGING seconds (300 s by default)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Session of generations started outside any generation_request block
+DEFAULT_SESSION = "default"
+
+
+class SchedulerFull(RuntimeError):
+    """The generation queue is full"""
+
+
+class GenerationCancelled(RuntimeError):
+    """The client went away while its generation was queued"""
+
+
+class QueueTimeout(TimeoutError):
+    """No generation slot became free in time"""
+
+
+@dataclass
+class GenerationRequest:
+    """Who a generation is for: its session, priority and how to tell its client is gone"""
+    session_id: str = DEFAULT_SESSION
+    priority: int = PRIORITY_INTERACTIVE
+    is_cancelled: Optional[Callable[[], bool]] = None
+
+
+_current_request: ContextVar[GenerationRequest] = ContextVar("generation_request", default=GenerationRequest())
+
+
+@contextmanager
+def generation_request(session_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE,
+                       is_cancelled: Optional[Callable[[], bool]] = None) -> Iterator[GenerationRequest]:
+    """Attribute the generations started in this block to a session
+
+    Generations are queued per session and sessions take turns, so one
+    client sending many questions cannot delay everybody else. Answer
+    streams run in their consumer's context, so the block must also
+    cover consuming them.
+    """
+    request = GenerationRequest(session_id or DEFAULT_SESSION, priority, is_cancelled)
+    token = _current_request.set(request)
+    try:
+        yield request
+    finally:
+        _current_request.reset(token)
+
+
+def current_request() -> GenerationRequest:
+    return _current_request.get()
+
+
+class _Endpoint:
+    """Slots and health of one Ollama server"""
+
+    def __init__(self, url: str, slots: int):
+        self.url = url
+        self.slots = max(1, slots)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.cooling_until = 0.0
+
+    def load(self) -> float:
+        return self.in_flight / self.slots
+
+
+class _Ticket:
+    """A generation waiting for, or holding, a slot"""
+
+    def __init__(self, request: GenerationRequest, seq: int, queued: int,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.request = request
+        self.seq = seq
+        self.queued = queued
+        self.enqueued_at = time.monotonic()
+        self.endpoint: Optional[_Endpoint] = None
+        self.granted = threading.Event()
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop is not None else None
+
+    def grant(self, endpoint: _Endpoint):
+        self.endpoint = endpoint
+        self.granted.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Lease:
+    """A generation slot on one endpoint, released when the generation ends"""
+
+    def __init__(self, scheduler: "GenerationScheduler", endpoint: _Endpoint, waited_ms: float):
+        self.endpoint = endpoint.url
+        self.waited_ms = waited_ms
+        self._scheduler = scheduler
+        self._slot = endpoint
+        self._released = False
+
+    def release(self, failed: bool = False):
+        """Free the slot; ``failed`` puts the endpoint on cooldown"""
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self._slot, failed)
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(failed=is_connection_error(exc))
+
+
+def is_connection_error(error: Optional[BaseException]) -> bool:
+    """Whether a generation failed because its server could not be reached"""
+    return isinstance(error, (ConnectionError, OSError)) or type(error).__name__ in ("ConnectError", "ConnectTimeout")
+
+
+class GenerationScheduler:
+    """Admission control for LLM generations
+
+    At most ``slots_per_endpoint`` generations run on each Ollama server at
+    once; the rest wait in a queue. The queue is split by priority and,
+    within a priority, by session: sessions take turns, one generation
+    each, so a client with many questions in flight only delays its own
+    answers. Waiting requests gain one priority level every
+    ``priority_aging`` seconds, so lower priority work (batch queries)
+    still progresses under constant interactive load.
+
+    Each granted slot goes to the endpoint with the lowest load. An
+    endpoint whose connection failed is skipped for ``cooldown`` seconds,
+    unless every endpoint is cooling down. Requests waiting longer than
+    ``queue_timeout``, or whose ``is_cancelled`` check reports a
+    disconnected client, leave the queue. Wait times are traced as
+    ``generation.queue_wait``; ``stats()`` reports queue depth and load.
+    """
+
+    def __init__(self, endpoints: Sequence[str] = GENERATION_ENDPOINTS,
+                 slots_per_endpoint: int = GENERATION_SLOTS_PER_ENDPOINT, max_queued: int = GENERATION_MAX_QUEUED,
+                 queue_timeout: Optional[float] = GENERATION_QUEUE_TIMEOUT,
+                 priority_aging: Optional[float] = GENERATION_PRIORITY_AGING,
+                 cooldown: float = GENERATION_ENDPOINT_COOLDOWN, cancel_poll: float = GENERATION_CANCEL_POLL):
+        if not endpoints:
+            raise ValueError("The generation scheduler needs at least one endpoint")
+        self.endpoints = [_Endpoint(url.rstrip("/"), slots_per_endpoint) for url in dict.fromkeys(endpoints)]
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.priority_aging = priority_aging
+        self.cooldown = cooldown
+        self.cancel_poll = cancel_poll
+        self._lock = threading.Lock()
+        # priority -> session -> waiting tickets; sessions are kept in turn order
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Ticket]]"] = {}
+        self._queued = 0
+        self._seq = 0
+        self._counters = {"admitted": 0, "rejected": 0, "cancelled": 0, "timed_out": 0}
+
+    # Queue bookkeeping, called with the lock held
+
+    def _route(self) -> Optional[_Endpoint]:
+        """Least loaded endpoint with a free slot, skipping those cooling down unless all of them are"""
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.cooling_until <= now] or self.endpoints
+        free = [endpoint for endpoint in healthy if endpoint.in_flight < endpoint.slots]
+        return min(free, key=_Endpoint.load) if free else None
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Pop the next ticket: best effective priority first, then the session whose turn it is"""
+        now = time.monotonic()
+        best = None
+        for priority, sessions in self._queues.items():
+            head = next(iter(sessions.values()))[0]
+            rank = priority - ((now - head.enqueued_at) / self.priority_aging if self.priority_aging else 0)
+            if best is None or (rank, head.seq) < best[0]:
+                best = ((rank, head.seq), priority)
+        if best is None:
+            return None
+
+        sessions = self._queues[best[1]]
+        session_id, tickets = next(iter(sessions.items()))
+        ticket = tickets.popleft()
+        if tickets:
+            # The session goes to the back of the line for its next request
+            sessions.move_to_end(session_id)
+        else:
+            del sessions[session_id]
+        if not sessions:
+            del self._queues[best[1]]
+        self._queued -= 1
+        return ticket
+
+    def _dispatch(self):
+        while self._queued:
+            endpoint = self._route()
+            if endpoint is None:
+                return
+            ticket = self._next_ticket()
+            endpoint.in_flight += 1
+            ticket.grant(endpoint)
+
+    def _submit(self, request: GenerationRequest, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Ticket:
+        with self._lock:
+            if self._queued >= self.max_queued:
+                self._counters["rejected"] += 1
+                raise SchedulerFull(f"{self._queued} generations are already waiting")
+            self._seq += 1
+            ticket = _Ticket(request, self._seq, self._queued, loop)
+            sessions = self._queues.setdefault(request.priority, OrderedDict())
+            sessions.setdefault(request.session_id, deque()).append(ticket)
+            self._queued += 1
+            self._counters["admitted"] += 1
+            self._dispatch()
+            return ticket
+
+    def _abandon(self, ticket: _Ticket, reason: str):
+        """Take a ticket out of the queue, or give back its slot if it was granted meanwhile"""
+        with self._lock:
+            self._counters[reason] += 1
+            if ticket.endpoint is None:
+                sessions = self._queues.get(ticket.request.priority, {})
+                tickets = sessions.get(ticket.request.session_id)
+                if tickets is not None and ticket in tickets:
+                    tickets.remove(ticket)
+                    self._queued -= 1
+                    if not tickets:
+                        del sessions[ticket.request.session_id]
+                    if not sessions:
+                        self._queues.pop(ticket.request.priority, None)
+                return
+        self._release(ticket.endpoint, failed=False)
+
+    def _release(self, endpoint: _Endpoint, failed: bool):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if failed:
+                endpoint.failed += 1
+                endpoint.cooling_until = time.monotonic() + self.cooldown
+                logger.warning(f"Generation endpoint {endpoint.url} failed, skipping it for {self.cooldown:g}s")
+            else:
+                endpoint.completed += 1
+            self._dispatch()
+
+    def _lease(self, ticket: _Ticket) -> Lease:
+        waited_ms = (time.monotonic() - ticket.enqueued_at) * 1000
+        tracer.record("generation.queue_wait", waited_ms, session=ticket.request.session_id,
+                      priority=ticket.request.priority, endpoint=ticket.endpoint.url, queued=ticket.queued)
+        return Lease(self, ticket.endpoint, waited_ms)
+
+    def _check_waiting(self, ticket: _Ticket, deadline: Optional[float]):
+        """Leave the queue if the client is gone or the wait is over"""
+        is_cancelled = ticket.request.is_cancelled
+        if is_cancelled is not None and is_cancelled():
+            self._abandon(ticket, "cancelled")
+            raise GenerationCancelled("Client disconnected while waiting for a generation slot")
+        if deadline is not None and time.monotonic() >= deadline:
+            self._abandon(ticket, "timed_out")
+            raise QueueTimeout(f"No generation slot became free within {self.queue_timeout:g}s")
+
+    def acquire(self, request: Optional[GenerationRequest] = None) -> Lease:
+        """Wait for a generation slot for ``request`` (the current ``generation_request`` by default)"""
+        ticket = self._submit(request or current_request())
+        deadline = ticket.enqueued_at + self.queue_timeout if self.queue_timeout is not None else None
+        try:
+            while not ticket.granted.wait(self.cancel_poll):
+                self._check_waiting(ticket, deadline)
+        except (GenerationCancelled, QueueTimeout):
+            raise
+        except BaseException:
+            self._abandon(ticket, "cancelled")
+            raise
+        return self._lease(ticket)
+
+    async def aacquire(self, request: Optional[GenerationRequest] = None) -> Lease:
+        """Async variant of acquire; cancelling the awaiting task leaves the queue"""
+        ticket = self._submit(request or current_request(), asyncio.get_running_loop())
+        deadline = ticket.enqueued_at + self.queue_timeout if self.queue_timeout is not None else None
+        try:
+            while not ticket.granted.is_set():
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.future), self.cancel_poll)
+                except asyncio.TimeoutError:
+                    self._check_waiting(ticket, deadline)
+        except (GenerationCancelled, QueueTimeout):
+            raise
+        except BaseException:
+            self._abandon(ticket, "cancelled")
+            raise
+        return self._lease(ticket)
+
+    @property
+    def saturated(self) -> bool:
+        """Whether new generations would be refused"""
+        with self._lock:
+            return self._queued >= self.max_queued
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, oldest wait, per-endpoint load and request counters"""
+        now = time.monotonic()
+        with self._lock:
+            waiting: List[_Ticket] = [
+                ticket for sessions in self._queues.values() for tickets in sessions.values() for ticket in tickets
+            ]
+            return {
+                "queued": self._queued,
+                "max_queued": self.max_queued,
+                "waiting_sessions": len({ticket.request.session_id for ticket in waiting}),
+                "oldest_wait_ms": round(max((now - ticket.enqueued_at for ticket in waiting), default=0) * 1000, 1),
+                "in_flight": sum(endpoint.in_flight for endpoint in self.endpoints),
+                "slots": sum(endpoint.slots for endpoint in self.endpoints),
+                "endpoints": [
+                    {
+                        "url": endpoint.url,
+                        "in_flight": endpoint.in_flight,
+                        "slots": endpoint.slots,
+                        "completed": endpoint.completed,
+                        "failed": endpoint.failed,
+                        "cooling_down": endpoint.cooling_until > now,
+                    }
+                    for endpoint in self.endpoints
+                ],
+                **self._counters,
+            }
+
+    def prometheus_text(self) -> str:
+        """Queue and endpoint gauges plus request counters in the Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            "# HELP rag_generation_queued Generations waiting for a slot.",
+            "# TYPE rag_generation_queued gauge",
+            f"rag_generation_queued {stats['queued']}",
+            "# HELP rag_generation_oldest_wait_ms Time the longest waiting generation has been queued.",
+            "# TYPE rag_generation_oldest_wait_ms gauge",
+            f"rag_generation_oldest_wait_ms {stats['oldest_wait_ms']}",
+            "# HELP rag_generation_in_flight Generations running per endpoint.",
+            "# TYPE rag_generation_in_flight gauge",
+        ]
+        lines += [f'rag_generation_in_flight{{endpoint="{endpoint["url"]}"}} {endpoint["in_flight"]}'
+                  for endpoint in stats["endpoints"]]
+        lines += [
+            "# HELP rag_generation_endpoint_failures_total Generations that could not reach their endpoint.",
+            "# TYPE rag_generation_endpoint_failures_total counter",
+        ]
+        lines += [f'rag_generation_endpoint_failures_total{{endpoint="{endpoint["url"]}"}} {endpoint["failed"]}'
+                  for endpoint in stats["endpoints"]]
+        lines += [
+            "# HELP rag_generation_requests_total Generation requests by outcome of admission.",
+            "# TYPE rag_generation_requests_total counter",
+        ]
+        lines += [f'rag_generation_requests_total{{outcome="{name}"}} {stats[name]}'
+                  for name in ("admitted", "rejected", "cancelled", "timed_out")]
+        return "\n".join(lines) + "\n"
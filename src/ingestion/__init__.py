@@ -1,3 +1,15 @@
-from .document_ingestion import DocumentIngestion
+__all__ = ['DocumentIngestion', 'IngestionWatcher', 'SUPPORTED_EXTENSIONS']
 
-__all__ = ['DocumentIngestion']
+
+def __getattr__(name):
+    # Document loaders are slow to import, so they are only loaded once ingestion is used
+    if name == 'DocumentIngestion':
+        from .document_ingestion import DocumentIngestion
+        return DocumentIngestion
+    if name == 'SUPPORTED_EXTENSIONS':
+        from .document_ingestion import SUPPORTED_EXTENSIONS
+        return SUPPORTED_EXTENSIONS
+    if name == 'IngestionWatcher':
+        from .watcher import IngestionWatcher
+        return IngestionWatcher
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
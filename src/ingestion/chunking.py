@@ -0,0 +1,275 @@
+import re
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from config import CHUNKING_STRATEGY, CHUNK_TOKENS, CHUNK_MIN_TOKENS, CHUNK_OVERLAP_TOKENS
+from src.utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+Span = Tuple[int, int]
+
+_BLANK_LINES = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+_WHITESPACE = re.compile(r"\s+")
+_NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|[IVXLC]+\.|[A-Z]\.)\s+\S")
+MAX_HEADING_CHARS = 80
+
+# Bump when chunk boundaries or chunk metadata change so files are re-chunked
+CHUNKER_VERSION = 1
+
+
+def _is_heading(line: str) -> bool:
+    """Heuristic for a heading line: markdown marker, numbered title or short all-caps line"""
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS:
+        return False
+    if line.startswith("#"):
+        return True
+    if line[-1] in ".,;!?":
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    letters = [char for char in line if char.isalpha()]
+    return len(letters) >= 3 and line.isupper()
+
+
+def _is_table(lines: List[str]) -> bool:
+    """Rows of a table keep their column separators (pipes from DOCX tables, tabs from text exports)"""
+    return len(lines) >= 2 and sum("|" in line or "\t" in line for line in lines) >= 0.6 * len(lines)
+
+
+@dataclass
+class Block:
+    """A structural unit of a page: heading, paragraph or table, as offsets into the page text"""
+    start: int
+    end: int
+    kind: str
+
+
+def find_blocks(text: str) -> List[Block]:
+    """Split page text into headings, paragraphs and tables at blank lines
+
+    A heading directly followed by its paragraph (common in PDF text,
+    which rarely keeps blank lines) is split off as its own block.
+    """
+    blocks: List[Block] = []
+
+    def add(start: int, end: int):
+        segment = text[start:end]
+        stripped = segment.strip()
+        if not stripped:
+            return
+        start += len(segment) - len(segment.lstrip())
+        end = start + len(stripped)
+        lines = stripped.splitlines()
+        if len(lines) > 1 and _is_heading(lines[0]) and not _is_table(lines):
+            heading_end = start + len(lines[0].rstrip())
+            blocks.append(Block(start, heading_end, "heading"))
+            add(heading_end, end)
+        elif len(lines) == 1 and _is_heading(lines[0]):
+            blocks.append(Block(start, end, "heading"))
+        else:
+            blocks.append(Block(start, end, "table" if _is_table(lines) else "paragraph"))
+
+    position = 0
+    for match in _BLANK_LINES.finditer(text):
+        add(position, match.start())
+        position = match.end()
+    add(position, len(text))
+    return blocks
+
+
+class Chunker:
+    """Splits loaded documents into chunks that record where they came from
+
+    Every chunk carries ``start_index``/``end_index`` (character offsets
+    into its source page) and ``chunk_index`` (position within the file),
+    so retrieval can fetch and stitch neighbouring chunks on demand
+    instead of duplicating text between chunks at ingest.
+    """
+
+    strategy = ""
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: Optional[int] = None,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = CHUNK_OVERLAP_TOKENS.get(self.strategy, 0) if overlap_tokens is None \
+            else overlap_tokens
+        self.count_tokens = count_tokens
+
+    def settings(self) -> Dict[str, Any]:
+        """Parameters that decide the chunks produced, part of the ingestion fingerprint"""
+        return {"version": CHUNKER_VERSION, "strategy": self.strategy, "chunk_tokens": self.chunk_tokens,
+                "overlap_tokens": self.overlap_tokens}
+
+    def split_text(self, text: str) -> List[Tuple[int, int, Dict]]:
+        """Chunk spans of one page as (start, end, extra metadata)"""
+        raise NotImplementedError
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Chunk the pages of one file, numbering chunks across pages"""
+        chunks = []
+        for doc in documents:
+            text = doc.page_content
+            for start, end, extra in self.split_text(text):
+                metadata = dict(doc.metadata)
+                metadata.update(extra)
+                metadata.update(start_index=start, end_index=end, chunk_index=len(chunks))
+                chunks.append(Document(page_content=text[start:end], metadata=metadata))
+        return chunks
+
+
+class StructureChunker(Chunker):
+    """Token-sized chunks that follow the document's own structure
+
+    Whole paragraphs and tables are packed into chunks of up to
+    ``chunk_tokens``, overlap included. A heading starts a new chunk once
+    the current one has ``min_tokens``, so a section does not start at
+    the tail of the previous one, and each chunk records the heading it
+    falls under as ``section``. Pages are chunked separately (PDF loaders yield
+    one document per page). Only blocks larger than a chunk are split,
+    tables between rows and prose between sentences.
+    """
+
+    strategy = "structure"
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: Optional[int] = None,
+                 min_tokens: int = CHUNK_MIN_TOKENS, count_tokens: Callable[[str], int] = estimate_tokens):
+        super().__init__(chunk_tokens, overlap_tokens, count_tokens)
+        # Room is left for the overlap so chunks never exceed chunk_tokens
+        self.body_tokens = max(1, chunk_tokens - self.overlap_tokens)
+        self.min_tokens = min(min_tokens, self.body_tokens)
+
+    def settings(self) -> Dict[str, Any]:
+        return dict(super().settings(), min_tokens=self.min_tokens)
+
+    def _pieces(self, text: str, block: Block) -> List[Span]:
+        """Break an oversized block at row, then sentence, then word boundaries"""
+        pattern = re.compile(r"\n") if block.kind == "table" else _SENTENCE_END
+        spans = self._split_at(text, block.start, block.end, pattern)
+        pieces = []
+        for start, end in spans:
+            if self.count_tokens(text[start:end]) <= self.body_tokens:
+                pieces.append((start, end))
+            else:
+                pieces.extend(self._pack(text, self._split_at(text, start, end, _WHITESPACE)))
+        return self._pack(text, pieces)
+
+    @staticmethod
+    def _split_at(text: str, start: int, end: int, pattern) -> List[Span]:
+        spans = []
+        position = start
+        for match in pattern.finditer(text, start, end):
+            if match.start() > position:
+                spans.append((position, match.start()))
+            position = match.end()
+        if end > position:
+            spans.append((position, end))
+        return spans
+
+    def _pack(self, text: str, spans: List[Span]) -> List[Span]:
+        """Greedily merge consecutive spans while they fit in a chunk"""
+        packed: List[Span] = []
+        for start, end in spans:
+            if packed and self.count_tokens(text[packed[-1][0]:end]) <= self.body_tokens:
+                packed[-1] = (packed[-1][0], end)
+            else:
+                packed.append((start, end))
+        return packed
+
+    def _overlap_start(self, text: str, previous: Span, start: int) -> int:
+        """Earliest sentence start in the previous chunk whose tail fits in the overlap budget"""
+        if self.overlap_tokens <= 0:
+            return start
+        best = start
+        for sentence_start, _ in reversed(self._split_at(text, previous[0], previous[1], _SENTENCE_END)):
+            if self.count_tokens(text[sentence_start:start]) > self.overlap_tokens:
+                break
+            best = sentence_start
+        return best
+
+    def split_text(self, text: str) -> List[Tuple[int, int, Dict]]:
+        chunks: List[Tuple[int, int, Dict]] = []
+        current: Optional[Span] = None
+        current_section: Optional[str] = None
+        section: Optional[str] = None
+
+        def flush():
+            nonlocal current
+            if current is None:
+                return
+            start = self._overlap_start(text, chunks[-1][:2], current[0]) if chunks else current[0]
+            chunks.append((start, current[1], {"section": current_section} if current_section else {}))
+            current = None
+
+        for block in find_blocks(text):
+            if block.kind == "heading":
+                if current is not None and self.count_tokens(text[current[0]:current[1]]) >= self.min_tokens:
+                    flush()
+                section = text[block.start:block.end].lstrip("#").strip()
+
+            if self.count_tokens(text[block.start:block.end]) <= self.body_tokens:
+                pieces = [(block.start, block.end)]
+            else:
+                pieces = self._pieces(text, block)
+
+            for start, end in pieces:
+                if current is not None and self.count_tokens(text[current[0]:end]) > self.body_tokens:
+                    flush()
+                if current is None:
+                    current = (start, end)
+                    current_section = section
+                else:
+                    current = (current[0], end)
+        flush()
+        return chunks
+
+
+class RecursiveChunker(Chunker):
+    """Structure-agnostic recursive splitter, sized in tokens"""
+
+    strategy = "recursive"
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: Optional[int] = None,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        super().__init__(chunk_tokens, overlap_tokens, count_tokens)
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_tokens,
+            chunk_overlap=self.overlap_tokens,
+            length_function=self.count_tokens
+        )
+
+    def split_text(self, text: str) -> List[Tuple[int, int, Dict]]:
+        spans = []
+        position = 0
+        for piece in self.splitter.split_text(text):
+            # Pieces are stripped substrings in order; overlap means the next one may start before the last end
+            start = text.find(piece, max(0, position - len(piece)))
+            if start < 0:
+                start = text.find(piece)
+            if start < 0:
+                continue
+            spans.append((start, start + len(piece), {}))
+            position = start + len(piece)
+        return spans
+
+
+CHUNKERS = {
+    StructureChunker.strategy: StructureChunker,
+    RecursiveChunker.strategy: RecursiveChunker,
+}
+
+
+def create_chunker(strategy: str = CHUNKING_STRATEGY) -> Chunker:
+    """Build the chunker configured by ``CHUNKING_STRATEGY``"""
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    chunker = CHUNKERS[strategy]()
+    logger.info(f"Chunking with {strategy} strategy, {chunker.chunk_tokens} tokens, "
+                f"{chunker.overlap_tokens} tokens overlap")
+    return chunker
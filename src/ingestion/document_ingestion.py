@@ -1,85 +1,339 @@
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import hashlib
+import json
 import logging
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks on Windows
+    fcntl = None
 
-from langchain.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OllamaEmbeddings
-from langchain.vectorstores import Chroma
 from langchain.schema import Document
 
 from config import (
-    RAW_DATA_DIR, CHROMA_COLLECTION_NAME, CHROMA_PERSIST_DIRECTORY,
-    EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, OLLAMA_BASE_URL
+    RAW_DATA_DIR, EMBEDDING_MODEL, CHARS_PER_TOKEN,
+    INGESTION_MANIFEST_PATH, INGESTION_LOCK_PATH, INGESTION_WORKERS, INGESTION_BATCH_SIZE,
+    ensure_data_dirs
 )
+from src.embeddings import CachedEmbeddings
+from src.observability import tracer
+from src.resources import resources
+from src.retrieval.filters import all_collection_names, collection_name, file_metadata, metadata_settings
+from src.vectorstores import VectorStore
+from .chunking import Chunker, create_chunker
+from .manifest import IngestionManifest, PendingFile, make_chunk_id
+from .parsers import DocumentParser, PARSERS, PARSER_VERSION, load_file
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_EXTENSIONS = set(PARSERS)
+
+
+def ingestion_fingerprint(chunker: Chunker) -> str:
+    """Hash of every setting that shapes the stored chunks
+
+    Recorded per file in the manifest; files ingested under a different
+    fingerprint are re-ingested. Parsed text and embeddings come from their
+    caches, so only chunking and storage are redone.
+    """
+    settings = {
+        "parser": PARSER_VERSION,
+        "chunker": chunker.settings(),
+        "chars_per_token": CHARS_PER_TOKEN,
+        "metadata": metadata_settings(),
+        "embedding_model": EMBEDDING_MODEL,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@contextmanager
+def ingestion_lock():
+    """Hold an exclusive lock so ingestion runs from different processes never interleave"""
+    ensure_data_dirs()
+    with open(INGESTION_LOCK_PATH, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
 class DocumentIngestion:
     """Handles document loading, processing, and storage in vector database"""
-    
-    def __init__(self):
-        self.embeddings = OllamaEmbeddings(
-            model=EMBEDDING_MODEL,
-            base_url=OLLAMA_BASE_URL
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
+
+    def __init__(self, max_workers: int = INGESTION_WORKERS, batch_size: int = INGESTION_BATCH_SIZE):
+        ensure_data_dirs()
+        self.chunker = create_chunker()
+        self.config_hash = ingestion_fingerprint(self.chunker)
+        self.max_workers = max(1, max_workers)
+        self.batch_size = max(1, batch_size)
+        self.parser = DocumentParser(workers=self.max_workers)
+
+    # Clients are shared with retrieval through the registry
+
+    @property
+    def embedding_client(self):
+        return resources.embedding_client()
+
+    @property
+    def embeddings(self):
+        return resources.embeddings()
+
+    @property
+    def lexical_index(self):
+        return resources.lexical_index()
+
+    def discover_files(self, paths: Optional[List[Path]] = None) -> List[Path]:
+        """List supported files in the raw data directory, or only in the given files and folders"""
+        files = []
+
+        candidates = RAW_DATA_DIR.rglob("*") if paths is None else (
+            child for path in paths for child in ([path, *path.rglob("*")] if path.is_dir() else [path])
         )
-        
-    def load_documents(self) -> List[Document]:
-        """Load all documents from raw data directory"""
+        for file_path in sorted(set(candidates)):
+            if not file_path.is_file():
+                continue
+            if file_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+                logger.warning(f"Unsupported file type: {file_path}")
+                continue
+            files.append(file_path)
+
+        return files
+
+    def load_file(self, file_path: Path) -> List[Document]:
+        """Load a single document with the loader matching its extension"""
+        return load_file(file_path)
+
+    def iter_loaded(self, file_paths: List[Path],
+                    content_hashes: Optional[Dict[Path, str]] = None) -> Iterator[Tuple[Path, Optional[List[Document]]]]:
+        """Parse files and yield them as they finish
+
+        Parsed text comes from the parse cache when the file's content was
+        parsed before; other files are parsed in worker processes, each
+        within a time and memory cap. Files that fail to load are logged and
+        yielded with ``None``.
+        """
+        for result in self.parser.parse(file_paths, content_hashes):
+            yield result.path, result.documents
+
+    def load_documents(self, file_paths: Optional[List[Path]] = None) -> List[Document]:
+        """Load documents from the raw data directory, or only the given files"""
         documents = []
-        
-        for file_path in RAW_DATA_DIR.rglob("*"):
-            if file_path.is_file():
-                try:
-                    if file_path.suffix.lower() == '.pdf':
-                        loader = PyPDFLoader(str(file_path))
-                    elif file_path.suffix.lower() in ['.docx', '.doc']:
-                        loader = Docx2txtLoader(str(file_path))
-                    elif file_path.suffix.lower() == '.txt':
-                        loader = TextLoader(str(file_path))
-                    else:
-                        logger.warning(f"Unsupported file type: {file_path}")
-                        continue
-                    
-                    docs = loader.load()
-                    documents.extend(docs)
-                    logger.info(f"Loaded {len(docs)} documents from {file_path}")
-                    
-                except Exception as e:
-                    logger.error(f"Error loading {file_path}: {e}")
-                    
+
+        for file_path, docs in self.iter_loaded(file_paths if file_paths is not None else self.discover_files()):
+            if docs is None:
+                continue
+            documents.extend(docs)
+            logger.info(f"Loaded {len(docs)} documents from {file_path}")
+
         return documents
-    
-    def process_and_store(self):
-        """Complete ingestion pipeline"""
-        logger.info("Starting document ingestion...")
-        
-        # Load documents
-        documents = self.load_documents()
-        if not documents:
-            logger.warning("No documents found to process")
+
+    def _get_vectorstore(self) -> VectorStore:
+        """Open the persistent vector store"""
+        return resources.vectorstore()
+
+    def _forget_parsed(self, content_hashes: Set[str], manifest: IngestionManifest, pending: List[PendingFile]):
+        """Drop cached parses of content no ingested or pending file has any more
+
+        The parse cache is keyed by content, so identical files share an
+        entry and a renamed file reuses its old one.
+        """
+        in_use = {record.content_hash for record in manifest.records.values()}
+        in_use.update(file.content_hash for file in pending)
+        for content_hash in content_hashes - in_use:
+            self.parser.forget(content_hash)
+
+    @staticmethod
+    def _scope(paths: List[Path]) -> List[str]:
+        """Paths relative to the raw data directory, skipping any outside it"""
+        scope = []
+        for path in map(Path, paths):
+            try:
+                rel_path = path.relative_to(RAW_DATA_DIR)
+            except ValueError:
+                try:
+                    # Either side may be reached through a symlink
+                    rel_path = path.resolve().relative_to(RAW_DATA_DIR.resolve())
+                except ValueError:
+                    logger.warning(f"Skipping {path}, which is outside the raw data directory {RAW_DATA_DIR}")
+                    continue
+            scope.append(rel_path.as_posix())
+        return scope
+
+    def _vectorstores(self) -> List[VectorStore]:
+        """The shared collection plus those of dedicated namespaces"""
+        return [resources.vectorstore(name) for name in all_collection_names()]
+
+    @staticmethod
+    def _attach_metadata(pending: PendingFile, chunks: List[Document], ingested_at: int):
+        """Add filterable file metadata to each chunk of a file"""
+        metadata = file_metadata(pending.rel_path, ingested_at)
+        for chunk in chunks:
+            chunk.metadata.update(metadata)
+            # Unpaged formats get page 0 so every chunk can be filtered by page
+            chunk.metadata.setdefault("page", 0)
+
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """Remove chunks from the vector stores and the lexical index"""
+        if not chunk_ids:
             return
-        
-        # Split documents into chunks
-        logger.info(f"Total Documents: {len(documents)}")
-        chunks = self.text_splitter.split_documents(documents)
-        logger.info(f"Split into {len(chunks)} chunks")
-        
-        # Create or update vector store
-        vectorstore = Chroma(
-            collection_name=CHROMA_COLLECTION_NAME,
-            embedding_function=self.embeddings,
-            persist_directory=CHROMA_PERSIST_DIRECTORY
+        # A file's chunks may sit in any collection if its namespace changed, and deleting absent IDs is a no-op
+        for name in all_collection_names():
+            resources.vectorstore(name).delete(chunk_ids)
+            if resources.compact_index(name) is not None:
+                resources.compact_index(name).delete(chunk_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(chunk_ids)
+
+    def _flush(self, manifest: IngestionManifest, batch: List[Tuple[PendingFile, List[Document], List[str]]],
+               stale_hashes: Set[str]) -> int:
+        """Store a batch of split files and record them in the manifest, collecting replaced content hashes"""
+        chunks = [chunk for _, file_chunks, _ in batch for chunk in file_chunks]
+        chunk_ids = [chunk_id for _, _, file_ids in batch for chunk_id in file_ids]
+
+        by_collection: Dict[str, Tuple[List[Document], List[str]]] = {}
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            chunk.metadata["chunk_id"] = chunk_id
+            collection_docs, collection_ids = by_collection.setdefault(
+                collection_name(chunk.metadata.get("namespace")), ([], [])
+            )
+            collection_docs.append(chunk)
+            collection_ids.append(chunk_id)
+
+        with tracer.span("ingestion.store", files=len(batch), chunks=len(chunks)):
+            for name, (collection_docs, collection_ids) in by_collection.items():
+                vectorstore = resources.vectorstore(name)
+                compact_index = resources.compact_index(name)
+                for start in range(0, len(collection_docs), self.batch_size):
+                    batch_ids = collection_ids[start:start + self.batch_size]
+                    vectorstore.add_documents(collection_docs[start:start + self.batch_size], ids=batch_ids)
+                    if compact_index is not None:
+                        compact_index.add_from(vectorstore, batch_ids)
+        if self.lexical_index is not None:
+            with tracer.span("ingestion.lexical_index", chunks=len(chunks)):
+                self.lexical_index.add(chunk_ids, [chunk.page_content for chunk in chunks])
+
+        for pending, file_chunks, file_ids in batch:
+            # Old chunks are removed only once the replacement is stored
+            if pending.previous:
+                self._delete_chunks(pending.previous.chunk_ids)
+                stale_hashes.add(pending.previous.content_hash)
+            manifest.record(pending, file_ids)
+            logger.info(f"Ingested {len(file_chunks)} chunks from {pending.path}")
+
+        return len(chunks)
+
+    def process_and_store(self, paths: Optional[List[Path]] = None):
+        """Incremental, streaming ingestion pipeline
+
+        Only new or modified files are loaded, split and embedded. Files are
+        parsed in parallel and their chunks are pushed to the vector store in
+        batches of ``batch_size`` as soon as they are ready. Chunks of
+        modified and removed files are deleted by their deterministic IDs.
+        With ``paths`` (files or folders under the raw data directory, which
+        may no longer exist), only those are checked; paths outside it are
+        skipped with a warning.
+        """
+        with ingestion_lock():
+            return self._process_and_store(paths)
+
+    def _process_and_store(self, paths: Optional[List[Path]]):
+        logger.info("Starting document ingestion...")
+
+        with tracer.span("ingestion.plan") as span:
+            manifest = IngestionManifest.load(INGESTION_MANIFEST_PATH)
+            scope = None
+            if paths is not None:
+                scope = self._scope(paths)
+                paths = [RAW_DATA_DIR / rel_path for rel_path in scope]
+                scope = ["" if rel_path == "." else rel_path for rel_path in scope]
+            files = self.discover_files(paths)
+            plan = manifest.plan(files, RAW_DATA_DIR, scope, self.config_hash)
+            span.set(files=len(files))
+        logger.info(
+            f"Found {len(files)} files: {len(plan.new)} new, {len(plan.changed)} changed, "
+            f"{len(plan.removed)} removed, {plan.unchanged} unchanged"
         )
-        
-        # Add documents to vector store
-        vectorstore.add_documents(chunks)
-        vectorstore.persist()
-        
-        logger.info(f"Successfully ingested {len(chunks)} chunks into vector store")
+
+        if not files and not plan.removed:
+            if paths is None:
+                logger.warning("No documents found to process")
+            return
+
+        vectorstore = self._get_vectorstore()
+
+        # Collections ingested before the lexical or compact index existed are backfilled once
+        if self.lexical_index is not None and manifest.records and len(self.lexical_index) == 0:
+            for store in self._vectorstores():
+                self.lexical_index.rebuild_from(store)
+        for name in all_collection_names():
+            compact_index = resources.compact_index(name)
+            if compact_index is not None and manifest.records and len(compact_index) == 0:
+                compact_index.rebuild_from(resources.vectorstore(name))
+
+        if not plan.has_changes:
+            # Still persist refreshed size/mtime for files that were only touched
+            if manifest.modified:
+                manifest.save()
+            logger.info("Vector store is already up to date")
+            return vectorstore
+
+        with tracer.span("ingestion.run", files=len(plan.pending)) as run_span:
+            total_chunks = 0
+            ingested_at = int(time.time())
+            stale_hashes: Set[str] = set()
+            try:
+                for record in plan.removed:
+                    self._delete_chunks(record.chunk_ids)
+                    stale_hashes.add(record.content_hash)
+                    manifest.forget(record.path)
+                    logger.info(f"Removed {len(record.chunk_ids)} chunks of deleted file {record.path}")
+
+                pending_by_path = {pending.path: pending for pending in plan.pending}
+                batch = []
+                batch_chunks = 0
+
+                content_hashes = {pending.path: pending.content_hash for pending in plan.pending}
+                for file_path, docs in self.iter_loaded(list(pending_by_path), content_hashes):
+                    if docs is None:
+                        continue
+                    pending = pending_by_path[file_path]
+                    with tracer.span("ingestion.split", documents=len(docs)) as span:
+                        chunks = self.chunker.split_documents(docs)
+                        span.set(chunks=len(chunks))
+                    self._attach_metadata(pending, chunks, ingested_at)
+                    chunk_ids = [
+                        make_chunk_id(pending.rel_path, pending.content_hash, i, pending.config_hash)
+                        for i in range(len(chunks))
+                    ]
+                    batch.append((pending, chunks, chunk_ids))
+                    batch_chunks += len(chunks)
+
+                    if batch_chunks >= self.batch_size:
+                        total_chunks += self._flush(manifest, batch, stale_hashes)
+                        batch = []
+                        batch_chunks = 0
+
+                if batch:
+                    total_chunks += self._flush(manifest, batch, stale_hashes)
+
+                for store in self._vectorstores():
+                    store.persist()
+            finally:
+                # Save progress even if a later file failed so finished work is not redone
+                if manifest.modified:
+                    manifest.save()
+                self._forget_parsed(stale_hashes, manifest, plan.pending)
+            run_span.set(chunks=total_chunks)
+
+        logger.info(f"Successfully ingested {total_chunks} chunks into vector store")
+        logger.info(f"Embedding throughput: {self.embedding_client.metrics.summary()}")
+        if isinstance(self.embeddings, CachedEmbeddings):
+            logger.info(f"Embedding cache: {self.embeddings.stats()}")
         return vectorstore
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 2
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path: Path) -> str:
+    """Compute the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for block in iter(lambda: fh.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(rel_path: str, content_hash: str, index: int, config_hash: str = "") -> str:
+    """Build a deterministic chunk ID from the file path, its content hash, the ingestion settings and chunk position
+
+    The settings are part of the ID so a file re-ingested under new settings
+    never overwrites the chunks it replaces before they are deleted.
+    """
+    path_hash = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:16]
+    version_hash = hashlib.sha1(f"{content_hash}:{config_hash}".encode("utf-8")).hexdigest()[:16]
+    return f"{path_hash}-{version_hash}-{index:05d}"
+
+
+def neighbour_chunk_id(chunk_id: str, offset: int) -> Optional[str]:
+    """ID of the chunk ``offset`` positions away in the same file version, or None before the first chunk"""
+    prefix, _, index = chunk_id.rpartition("-")
+    if not prefix or not index.isdigit() or int(index) + offset < 0:
+        return None
+    return f"{prefix}-{int(index) + offset:05d}"
+
+
+def in_scope(rel_path: str, scope: List[str]) -> bool:
+    """Whether a relative path is one of, or lies under one of, the scoped paths ("" is the whole tree)"""
+    return any(not prefix or rel_path == prefix or rel_path.startswith(prefix + "/") for prefix in scope)
+
+
+@dataclass
+class FileRecord:
+    """Manifest entry describing one ingested file"""
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    chunk_ids: List[str] = field(default_factory=list)
+    # Fingerprint of the ingestion settings the chunks were produced with; empty before manifest version 2
+    config_hash: str = ""
+
+
+@dataclass
+class PendingFile:
+    """A file that needs to be (re-)ingested"""
+    path: Path
+    rel_path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    config_hash: str = ""
+    previous: Optional[FileRecord] = None
+
+
+@dataclass
+class IngestionPlan:
+    """Result of comparing the files on disk against the manifest"""
+    new: List[PendingFile] = field(default_factory=list)
+    changed: List[PendingFile] = field(default_factory=list)
+    removed: List[FileRecord] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def pending(self) -> List[PendingFile]:
+        return self.new + self.changed
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.new or self.changed or self.removed)
+
+
+class IngestionManifest:
+    """Persistent record of ingested files used to make ingestion incremental"""
+
+    def __init__(self, path: Path, records: Optional[Dict[str, FileRecord]] = None):
+        self.path = Path(path)
+        self.records: Dict[str, FileRecord] = records or {}
+        # Set when records differ from the file on disk; the response cache is versioned on its mtime
+        self.modified = False
+
+    @classmethod
+    def load(cls, path: Path) -> "IngestionManifest":
+        """Load the manifest from disk, starting empty if it is missing or unreadable"""
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            records = {
+                entry["path"]: FileRecord(**entry)
+                for entry in data.get("files", [])
+            }
+            return cls(path, records)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.error(f"Could not read ingestion manifest {path}, starting fresh: {e}")
+            return cls(path)
+
+    def save(self):
+        """Atomically write the manifest to disk"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "files": [asdict(record) for record in sorted(self.records.values(), key=lambda r: r.path)],
+        }
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+    def plan(self, file_paths: List[Path], root: Path, scope: Optional[List[str]] = None,
+             config_hash: str = "") -> IngestionPlan:
+        """Classify files as new, changed, unchanged or removed
+
+        Size and mtime are checked first so unchanged files are never re-hashed.
+        Files whose stat changed but whose content hash did not are treated as unchanged.
+        Files ingested with other settings than ``config_hash`` are changed.
+        With ``scope`` (relative file or folder paths), only recorded files
+        under those paths can be reported as removed.
+        """
+        plan = IngestionPlan()
+        seen = set()
+
+        for file_path in file_paths:
+            rel_path = file_path.relative_to(root).as_posix()
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                # Deleted since it was listed; handled as removed
+                continue
+            seen.add(rel_path)
+            record = self.records.get(rel_path)
+
+            same_stat = record and record.size == stat.st_size and record.mtime_ns == stat.st_mtime_ns
+            same_config = record and record.config_hash == config_hash
+            if same_stat and same_config:
+                plan.unchanged += 1
+                continue
+
+            content_hash = record.content_hash if same_stat else hash_file(file_path)
+            if same_config and record.content_hash == content_hash:
+                record.size = stat.st_size
+                record.mtime_ns = stat.st_mtime_ns
+                self.modified = True
+                plan.unchanged += 1
+                continue
+
+            pending = PendingFile(
+                path=file_path,
+                rel_path=rel_path,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                content_hash=content_hash,
+                config_hash=config_hash,
+                previous=record
+            )
+            if record:
+                plan.changed.append(pending)
+            else:
+                plan.new.append(pending)
+
+        plan.removed = [
+            record for path, record in self.records.items()
+            if path not in seen and (scope is None or in_scope(path, scope))
+        ]
+        return plan
+
+    def record(self, pending: PendingFile, chunk_ids: List[str]):
+        """Store the result of ingesting a file"""
+        self.records[pending.rel_path] = FileRecord(
+            path=pending.rel_path,
+            size=pending.size,
+            mtime_ns=pending.mtime_ns,
+            content_hash=pending.content_hash,
+            chunk_ids=chunk_ids,
+            config_hash=pending.config_hash
+        )
+        self.modified = True
+
+    def forget(self, rel_path: str):
+        """Drop a file from the manifest"""
+        if self.records.pop(rel_path, None) is not None:
+            self.modified = True
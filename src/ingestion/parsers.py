@@ -0,0 +1,448 @@
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # No rlimits on Windows
+    resource = None
+
+from langchain.schema import Document
+
+from config import (
+    INGESTION_WORKERS, PARSE_CACHE_ENABLED, PARSE_CACHE_DIR, PARSE_TIMEOUT_SECONDS, PARSE_TIMEOUT_PER_MB,
+    PARSE_MEMORY_LIMIT_MB, PARSE_LOG_PATH
+)
+from src.observability import tracer
+from .manifest import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Bump when parser output changes so cached text is re-parsed
+PARSER_VERSION = 1
+
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"   # Legacy Word (.doc) and other OLE compound files
+ZIP_MAGIC = b"PK\x03\x04"                         # Office Open XML (.docx)
+
+# A parsed file: the text of each page (one page for unpaged formats) with its metadata
+Pages = List[Tuple[str, Dict[str, Any]]]
+
+
+class UnsupportedDocument(ValueError):
+    """Raised for files no available parser can read"""
+
+
+def parse_pdf(file_path: Path) -> Pages:
+    """Extract the text layer of a PDF page by page, without OCR
+
+    Pages are read one at a time, so memory follows the largest page rather
+    than the whole document. Scanned pages without a text layer come out
+    empty and produce no chunks.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        from PyPDF2 import PdfReader
+
+    pages = []
+    for page_number, page in enumerate(PdfReader(str(file_path)).pages):
+        text = page.extract_text() or ""
+        if text.strip():
+            pages.append((text, {"source": str(file_path), "page": page_number}))
+    return pages
+
+
+def parse_docx(file_path: Path) -> Pages:
+    """Load a DOCX file keeping its structure
+
+    Headings become markdown-style ``#`` lines and table rows are joined
+    with `` | ``, so the chunker can recognise sections and tables that
+    plain text extraction flattens.
+    """
+    try:
+        import docx
+        from docx.table import Table
+    except ImportError:
+        import docx2txt
+        return [(docx2txt.process(str(file_path)), {"source": str(file_path)})]
+
+    blocks = []
+    for item in docx.Document(str(file_path)).iter_inner_content():
+        if isinstance(item, Table):
+            rows = [" | ".join(cell.text.strip() for cell in row.cells) for row in item.rows]
+            blocks.append("\n".join(rows))
+            continue
+        text = item.text.strip()
+        if not text:
+            continue
+        style = item.style.name if item.style is not None else ""
+        if style.startswith("Heading") and style[len("Heading"):].strip().isdigit():
+            text = "#" * int(style[len("Heading"):]) + " " + text
+        elif style == "Title":
+            text = "# " + text
+        blocks.append(text)
+    return [("\n\n".join(blocks), {"source": str(file_path)})]
+
+
+def parse_doc(file_path: Path) -> Pages:
+    """Read a legacy Word file with antiword, failing fast when it cannot be read
+
+    Files that are really DOCX documents with a ``.doc`` extension are
+    parsed as DOCX.
+    """
+    with open(file_path, "rb") as fh:
+        magic = fh.read(8)
+    if magic.startswith(ZIP_MAGIC):
+        return parse_docx(file_path)
+    if magic != OLE_MAGIC:
+        raise UnsupportedDocument(f"{file_path.name} is not a Word document")
+
+    antiword = shutil.which("antiword")
+    if antiword is None:
+        raise UnsupportedDocument(
+            f"{file_path.name} is a legacy .doc file; install antiword or convert it to .docx"
+        )
+    result = subprocess.run([antiword, str(file_path)], capture_output=True, check=True)
+    return [(result.stdout.decode("utf-8", errors="replace"), {"source": str(file_path)})]
+
+
+def parse_txt(file_path: Path) -> Pages:
+    return [(file_path.read_text(encoding="utf-8", errors="replace"), {"source": str(file_path)})]
+
+
+PARSERS = {
+    ".pdf": parse_pdf,
+    ".docx": parse_docx,
+    ".doc": parse_doc,
+    ".txt": parse_txt,
+}
+
+# Cheap enough to run in the ingesting process instead of a worker
+IN_PROCESS_EXTENSIONS = {".txt"}
+
+
+def parse_file(file_path: Path) -> Pages:
+    """Parse a single file with the parser matching its extension"""
+    file_path = Path(file_path)
+    parser = PARSERS.get(file_path.suffix.lower())
+    if parser is None:
+        raise UnsupportedDocument(f"Unsupported file type: {file_path}")
+    return parser(file_path)
+
+
+def load_file(file_path: Path) -> List[Document]:
+    """Parse a single file into one document per page"""
+    return [Document(page_content=text, metadata=metadata) for text, metadata in parse_file(file_path)]
+
+
+@dataclass
+class ParseResult:
+    """Outcome of parsing one file"""
+    path: Path
+    pages: Optional[Pages]
+    seconds: float
+    error: Optional[str] = None
+    status: str = "parsed"    # "parsed", "cached", "failed" or "timeout"
+
+    @property
+    def documents(self) -> Optional[List[Document]]:
+        if self.pages is None:
+            return None
+        return [Document(page_content=text, metadata=dict(metadata)) for text, metadata in self.pages]
+
+
+class ParseCache:
+    """Parsed text of files, gzipped under the processed data directory and keyed by content hash
+
+    Lets documents be re-chunked, for example after changing the chunking
+    settings and resetting the database, without parsing them again.
+    """
+
+    def __init__(self, directory: Path = PARSE_CACHE_DIR):
+        self.directory = Path(directory)
+
+    def _path(self, content_hash: str) -> Path:
+        return self.directory / content_hash[:2] / f"{content_hash}.v{PARSER_VERSION}.json.gz"
+
+    def get(self, content_hash: str, file_path: Path) -> Optional[Pages]:
+        try:
+            with gzip.open(self._path(content_hash), "rt", encoding="utf-8") as fh:
+                entries = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable parse cache entry for {file_path}: {e}")
+            return None
+        # Identical content may have been cached under another path
+        return [(text, {**metadata, "source": str(file_path)}) for text, metadata in entries]
+
+    def put(self, content_hash: str, pages: Pages):
+        path = self._path(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as fh:
+            json.dump(pages, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, content_hash: str):
+        self._path(content_hash).unlink(missing_ok=True)
+
+
+def _limit_memory(limit_mb: Optional[int]):
+    """Cap how much more memory this process may map, on top of what it inherited"""
+    if limit_mb is None or resource is None:
+        return
+    try:
+        # Forked workers start with the parent's address space, so the cap is relative to it
+        with open("/proc/self/statm") as fh:
+            current = int(fh.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Address space limits are only enforced on Linux
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + limit_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _worker_main(conn, memory_limit_mb: Optional[int]):
+    """Parse paths received over ``conn`` until told to stop"""
+    # Interrupts are handled by the ingesting process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _limit_memory(memory_limit_mb)
+    while True:
+        try:
+            file_path = conn.recv()
+        except EOFError:
+            return
+        if file_path is None:
+            return
+        try:
+            conn.send((True, parse_file(Path(file_path))))
+        except MemoryError:
+            conn.send((False, f"exceeded the parser memory limit of {memory_limit_mb} MB"))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+@dataclass
+class _Worker:
+    process: Any
+    conn: Any
+    path: Optional[Path] = None
+    started: float = 0.0
+    deadline: float = 0.0
+
+
+class ParserPool:
+    """Worker processes that parse one file at a time, each within a time and memory cap
+
+    A worker that runs past a file's deadline, or dies on it, is killed
+    and replaced, so one pathological document costs at most its timeout
+    and never stalls the rest of the run. The deadline grows with file
+    size: ``timeout`` seconds plus ``timeout_per_mb`` per megabyte.
+    """
+
+    def __init__(self, workers: int = INGESTION_WORKERS, timeout: float = PARSE_TIMEOUT_SECONDS,
+                 timeout_per_mb: float = PARSE_TIMEOUT_PER_MB, memory_limit_mb: Optional[int] = PARSE_MEMORY_LIMIT_MB):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.timeout_per_mb = timeout_per_mb
+        self.memory_limit_mb = memory_limit_mb
+        self._context = multiprocessing.get_context()
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, self.memory_limit_mb), name="document-parser", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _deadline_seconds(self, file_path: Path) -> float:
+        try:
+            size_mb = file_path.stat().st_size / (1024 * 1024)
+        except OSError:
+            size_mb = 0
+        return self.timeout + self.timeout_per_mb * size_mb
+
+    def _assign(self, worker: _Worker, file_path: Path):
+        worker.path = file_path
+        worker.started = time.perf_counter()
+        worker.deadline = worker.started + self._deadline_seconds(file_path)
+        worker.conn.send(str(file_path))
+
+    @staticmethod
+    def _kill(worker: _Worker):
+        worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+
+    def imap_unordered(self, file_paths: Iterable[Path]) -> Iterator[ParseResult]:
+        """Parse files, yielding results as they finish"""
+        remaining = iter(file_paths)
+        workers: List[_Worker] = []
+        try:
+            for file_path in remaining:
+                worker = self._spawn()
+                workers.append(worker)
+                self._assign(worker, file_path)
+                if len(workers) >= self.workers:
+                    break
+
+            while True:
+                busy = [worker for worker in workers if worker.path is not None]
+                if not busy:
+                    return
+                timeout = max(0.0, min(worker.deadline for worker in busy) - time.perf_counter())
+                ready = wait([worker.conn for worker in busy], timeout)
+
+                for index, worker in enumerate(workers):
+                    if worker.path is None:
+                        continue
+                    now = time.perf_counter()
+                    if worker.conn in ready:
+                        try:
+                            ok, payload = worker.conn.recv()
+                            replace = False
+                        except (EOFError, OSError):
+                            worker.process.join()
+                            ok, payload = False, f"parser process died (exit code {worker.process.exitcode})"
+                            replace = True
+                        status = "parsed" if ok else "failed"
+                    elif now >= worker.deadline:
+                        ok, payload, status, replace = (
+                            False, f"timed out after {worker.deadline - worker.started:g}s", "timeout", True
+                        )
+                    else:
+                        continue
+
+                    result = ParseResult(
+                        worker.path, payload if ok else None, now - worker.started,
+                        error=None if ok else payload, status=status
+                    )
+                    worker.path = None
+                    if replace:
+                        self._kill(worker)
+                        worker = workers[index] = self._spawn()
+                    yield result
+
+                    next_path = next(remaining, None)
+                    if next_path is not None:
+                        self._assign(worker, next_path)
+        finally:
+            for worker in workers:
+                if worker.path is None:
+                    try:
+                        worker.conn.send(None)
+                    except OSError:
+                        pass
+                    worker.process.join(timeout=1)
+                if worker.process.is_alive():
+                    self._kill(worker)
+
+
+class DocumentParser:
+    """Turns files into page documents for ingestion
+
+    Files are looked up in the parse cache by content hash first. Plain
+    text is read in-process; everything else goes through a ``ParserPool``
+    so each file is bounded in time and memory. Every file's parse time
+    and outcome is appended to ``log_path`` as JSON lines.
+    """
+
+    def __init__(self, workers: int = INGESTION_WORKERS, cache: Optional[ParseCache] = None,
+                 log_path: Optional[Path] = PARSE_LOG_PATH, pool: Optional[ParserPool] = None):
+        self.pool = pool or ParserPool(workers=workers)
+        self.cache = cache if cache is not None else (ParseCache() if PARSE_CACHE_ENABLED else None)
+        self.log_path = Path(log_path) if log_path is not None else None
+
+    def _log(self, result: ParseResult):
+        if self.log_path is None:
+            return
+        try:
+            size = result.path.stat().st_size
+        except OSError:
+            size = None
+        line = json.dumps({
+            "timestamp": time.time(),
+            "path": str(result.path),
+            "bytes": size,
+            "status": result.status,
+            "seconds": round(result.seconds, 4),
+            "pages": len(result.pages) if result.pages is not None else None,
+            "chars": sum(len(text) for text, _ in result.pages) if result.pages is not None else None,
+            "error": result.error,
+        })
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write parse log {self.log_path}: {e}")
+
+    def _finish(self, result: ParseResult, content_hash: Optional[str]) -> ParseResult:
+        tracer.record("ingestion.parse", result.seconds * 1000, status=result.status,
+                      pages=len(result.pages) if result.pages is not None else 0)
+        if result.status == "parsed" and self.cache is not None and content_hash is not None:
+            try:
+                self.cache.put(content_hash, result.pages)
+            except OSError as e:
+                logger.warning(f"Could not cache parsed text of {result.path}: {e}")
+        if result.error:
+            logger.error(f"Error loading {result.path}: {result.error}")
+        self._log(result)
+        return result
+
+    def parse(self, file_paths: List[Path], content_hashes: Optional[Dict[Path, str]] = None) -> Iterator[ParseResult]:
+        """Parse files, yielding results as they become available (not in input order)"""
+        content_hashes = dict(content_hashes or {})
+        in_pool = []
+
+        for file_path in file_paths:
+            content_hash = content_hashes.get(file_path)
+            if self.cache is not None and content_hash is None:
+                try:
+                    content_hash = content_hashes[file_path] = hash_file(file_path)
+                except OSError:
+                    pass
+            if self.cache is not None and content_hash is not None:
+                start = time.perf_counter()
+                pages = self.cache.get(content_hash, file_path)
+                if pages is not None:
+                    yield self._finish(
+                        ParseResult(file_path, pages, time.perf_counter() - start, status="cached"), None
+                    )
+                    continue
+
+            if file_path.suffix.lower() in IN_PROCESS_EXTENSIONS:
+                start = time.perf_counter()
+                try:
+                    result = ParseResult(file_path, parse_file(file_path), time.perf_counter() - start)
+                except Exception as e:
+                    result = ParseResult(file_path, None, time.perf_counter() - start,
+                                         error=f"{type(e).__name__}: {e}", status="failed")
+                yield self._finish(result, content_hash)
+            else:
+                in_pool.append(file_path)
+
+        for result in self.pool.imap_unordered(in_pool):
+            yield self._finish(result, content_hashes.get(result.path))
+
+    def forget(self, content_hash: str):
+        """Drop the cached text of a file version that is no longer ingested"""
+        if self.cache is not None:
+            self.cache.delete(content_hash)
@@ -0,0 +1,319 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (
+    RAW_DATA_DIR, WATCH_QUEUE_PATH, WATCH_DEBOUNCE_SECONDS, WATCH_MAX_DELAY_SECONDS, WATCH_POLL_INTERVAL,
+    WATCH_BATCH_FILES, WATCH_MAX_ATTEMPTS
+)
+from src.observability import tracer
+
+logger = logging.getLogger(__name__)
+
+# Queue entry standing for a rescan of the whole directory
+FULL_SCAN = ""
+
+
+class WorkQueue:
+    """Debounced queue of changed paths, persisted in SQLite so it survives restarts
+
+    Every event for a path pushes its due time ``debounce`` seconds into
+    the future, so a burst of writes to one file becomes a single entry,
+    but never beyond ``max_delay`` after its first event. Entries carry a
+    sequence number so an event arriving while a path is being ingested
+    keeps it queued for another pass.
+    """
+
+    def __init__(self, path: Path = WATCH_QUEUE_PATH, debounce: float = WATCH_DEBOUNCE_SECONDS,
+                 max_delay: float = WATCH_MAX_DELAY_SECONDS):
+        self.path = Path(path)
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS queue (
+                path TEXT PRIMARY KEY,
+                first_seen REAL NOT NULL,
+                due_at REAL NOT NULL,
+                seq INTEGER NOT NULL DEFAULT 1,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.commit()
+        return conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def push(self, rel_paths: List[str]):
+        """Queue paths (relative to the watched directory) or postpone them if already queued"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO queue (path, first_seen, due_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET "
+                "due_at = MIN(excluded.due_at, queue.first_seen + ?), seq = queue.seq + 1",
+                [(rel_path, now, now + self.debounce, self.max_delay) for rel_path in rel_paths]
+            )
+            self._conn.commit()
+
+    def due(self, limit: int) -> List[Tuple[str, int]]:
+        """Paths whose quiet period is over, with the sequence number they were claimed at"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, seq FROM queue WHERE due_at <= ? ORDER BY due_at LIMIT ?", (time.time(), limit)
+            ).fetchall()
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            return self._conn.execute("SELECT MIN(due_at) FROM queue").fetchone()[0]
+
+    def complete(self, items: List[Tuple[str, int]]):
+        """Remove processed paths unless new events arrived for them meanwhile"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM queue WHERE path = ? AND seq = ?", items)
+            self._conn.commit()
+
+    def retry(self, items: List[Tuple[str, int]], max_attempts: int = WATCH_MAX_ATTEMPTS) -> List[str]:
+        """Back off failed paths exponentially, dropping and returning those out of attempts"""
+        now = time.time()
+        dropped = []
+        with self._lock:
+            for rel_path, _ in items:
+                row = self._conn.execute("SELECT attempts FROM queue WHERE path = ?", (rel_path,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                if attempts >= max_attempts:
+                    self._conn.execute("DELETE FROM queue WHERE path = ?", (rel_path,))
+                    dropped.append(rel_path)
+                    continue
+                self._conn.execute(
+                    "UPDATE queue SET attempts = ?, due_at = ?, first_seen = ? WHERE path = ?",
+                    (attempts, now + self.debounce * 2 ** attempts, now, rel_path)
+                )
+            self._conn.commit()
+        return dropped
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IngestionWatcher:
+    """Keeps the vector store in sync with the raw data directory
+
+    File events come from watchdog (inotify on Linux, FSEvents on macOS)
+    when it is installed, otherwise from periodic directory scans. Changed
+    paths go through a persistent, debounced ``WorkQueue`` and a worker
+    thread ingests them ``batch_files`` at a time with
+    ``DocumentIngestion.process_and_store(paths)``, so each run touches
+    only a few files and readers are never blocked for long. On start a
+    full incremental rescan is queued to catch changes made while the
+    watcher was not running.
+    """
+
+    def __init__(self, ingestion=None, root: Path = RAW_DATA_DIR, queue: Optional[WorkQueue] = None,
+                 poll_interval: float = WATCH_POLL_INTERVAL, batch_files: int = WATCH_BATCH_FILES,
+                 use_watchdog: bool = True, on_ingested: Optional[Callable[[List[str]], None]] = None):
+        # Imported here so importing this module does not load the document loaders
+        from src.ingestion import SUPPORTED_EXTENSIONS
+
+        self._ingestion = ingestion
+        self.extensions = frozenset(SUPPORTED_EXTENSIONS)
+        self.root = Path(root)
+        self.queue = queue if queue is not None else WorkQueue()
+        self.poll_interval = poll_interval
+        self.batch_files = max(1, batch_files)
+        self.use_watchdog = use_watchdog
+        self.on_ingested = on_ingested
+        self.mode: Optional[str] = None
+        self.processed = 0
+        self.failed = 0
+        self.last_run: Optional[float] = None
+        self._observer = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def ingestion(self):
+        """Ingestion component, imported on first use like in RAGPipeline"""
+        if self._ingestion is None:
+            from src.ingestion import DocumentIngestion
+            self._ingestion = DocumentIngestion()
+        return self._ingestion
+
+    def _rel_path(self, path: Path) -> Optional[str]:
+        """Queue key for an event path, or None for files ingestion ignores"""
+        try:
+            rel_path = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return None
+        if any(part.startswith((".", "~$")) for part in rel_path.parts):
+            # Hidden files and editor or Office lock files
+            return None
+        # Deleted folders can only be told apart from files by their missing extension
+        if rel_path.suffix.lower() not in self.extensions and rel_path.suffix:
+            return None
+        return rel_path.as_posix()
+
+    def notify(self, *paths: Path):
+        """Record that files or folders changed"""
+        rel_paths = [rel_path for rel_path in map(self._rel_path, paths) if rel_path is not None]
+        if rel_paths:
+            self.queue.push(rel_paths)
+            self._wake.set()
+
+    def start(self):
+        """Start watching and the ingestion worker in background threads"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self.queue.push([FULL_SCAN])
+
+        if self.use_watchdog and self._start_observer():
+            self.mode = f"events ({type(self._observer).__name__})"
+        else:
+            self.mode = f"polling every {self.poll_interval:g}s"
+            self._spawn(self._poll_loop, "ingestion-poller")
+        self._spawn(self._work_loop, "ingestion-worker")
+        logger.info(f"Watching {self.root} for changes using {self.mode}")
+
+    def _spawn(self, target: Callable, name: str):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _start_observer(self) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info("watchdog is not installed (pip install watchdog), falling back to polling")
+            return False
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Folder "modified" events only echo changes to their files; opens and reads change nothing
+                if event.event_type in ("opened", "closed_no_write") or \
+                        (event.is_directory and event.event_type == "modified"):
+                    return
+                paths = [Path(event.src_path)]
+                if getattr(event, "dest_path", None):
+                    paths.append(Path(event.dest_path))
+                watcher.notify(*paths)
+
+        try:
+            self._observer = Observer()
+            self._observer.schedule(Handler(), str(self.root), recursive=True)
+            self._observer.start()
+            return True
+        except OSError as e:
+            # e.g. the inotify watch limit is exhausted
+            logger.warning(f"Could not watch {self.root} for events, falling back to polling: {e}")
+            self._observer = None
+            return False
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for path in self.root.rglob("*"):
+            try:
+                if path.suffix.lower() in self.extensions and path.is_file():
+                    stat = path.stat()
+                    snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+        return snapshot
+
+    def _poll_loop(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            try:
+                current = self._snapshot()
+            except OSError as e:
+                logger.error(f"Could not scan {self.root}: {e}")
+                continue
+            changed = [path for path, stat in current.items() if previous.get(path) != stat]
+            changed += [path for path in previous if path not in current]
+            if changed:
+                self.notify(*changed)
+            previous = current
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            items = self.queue.due(self.batch_files)
+            if not items:
+                next_due = self.queue.next_due()
+                timeout = self.poll_interval if next_due is None else max(0.05, next_due - time.time())
+                self._wake.wait(timeout)
+                self._wake.clear()
+                continue
+            self._process(items)
+
+    def _process(self, items: List[Tuple[str, int]]):
+        rel_paths = [rel_path for rel_path, _ in items]
+        start = time.perf_counter()
+        try:
+            with tracer.span("ingestion.watch_batch", files=len(rel_paths)):
+                if FULL_SCAN in rel_paths:
+                    self.ingestion.process_and_store()
+                else:
+                    self.ingestion.process_and_store([self.root / rel_path for rel_path in rel_paths])
+        except Exception as e:
+            self.failed += len(rel_paths)
+            logger.error(f"Ingesting {len(rel_paths)} changed paths failed, will retry: {e}")
+            for rel_path in self.queue.retry(items):
+                logger.error(f"Giving up on {rel_path or RAW_DATA_DIR} after {WATCH_MAX_ATTEMPTS} attempts")
+            return
+
+        self.queue.complete(items)
+        self.processed += len(rel_paths)
+        self.last_run = time.time()
+        logger.info(f"Ingested {len(rel_paths)} changed paths in {time.perf_counter() - start:.2f}s")
+        if self.on_ingested is not None:
+            self.on_ingested(rel_paths)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "mode": self.mode,
+            "running": any(thread.is_alive() for thread in self._threads),
+            "queued": len(self.queue),
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_run": self.last_run,
+        }
+
+    def stop(self, timeout: Optional[float] = 10):
+        """Stop watching; a batch already being ingested is finished first"""
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout)
+            self._observer = None
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_forever(self):
+        """Watch until interrupted"""
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            logger.info("Stopping ingestion watcher...")
+        finally:
+            self.stop()
@@ -0,0 +1,3 @@
+from .tracing import Span, Tracer, tracer
+
+__all__ = ['Span', 'Tracer', 'tracer']
@@ -0,0 +1,319 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+from config import (
+    TRACING_ENABLED, TRACE_EXPORT_PATH, TRACE_WINDOW, TRACE_EXPORT_MAX_BYTES, TRACE_EXPORT_BACKUPS,
+    TRACE_FLUSH_INTERVAL, TRACE_BUFFER_SPANS
+)
+
+logger = logging.getLogger(__name__)
+
+# Numeric span attributes that are also summed into per-stage counters
+COUNTED_ATTRIBUTES = ("chunks", "documents", "tokens", "prompt_tokens", "output_tokens", "files")
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@dataclass
+class Span:
+    """One timed operation within a trace"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float
+    duration_ms: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _StageStats:
+    """Rolling window of durations plus running totals for one span name"""
+
+    def __init__(self, window: int):
+        self.durations: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.counters: Dict[str, float] = {}
+
+    def add(self, span: Span):
+        self.durations.append(span.duration_ms)
+        self.count += 1
+        self.total_ms += span.duration_ms
+        for name in COUNTED_ATTRIBUTES:
+            value = span.attributes.get(name)
+            if isinstance(value, (int, float)):
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def quantile(self, q: float) -> float:
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TraceExporter:
+    """Appends finished spans to a JSONL file from a background thread
+
+    Spans are buffered and written in batches every ``flush_interval``
+    seconds, so recording a span never waits on the disk. Once
+    ``max_buffered`` spans are waiting, new ones are dropped and counted.
+    The file is rotated when a write would take it past ``max_bytes``,
+    keeping ``backups`` older files.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = TRACE_EXPORT_MAX_BYTES, backups: int = TRACE_EXPORT_BACKUPS,
+                 flush_interval: float = TRACE_FLUSH_INTERVAL, max_buffered: int = TRACE_BUFFER_SPANS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.flush_interval = flush_interval
+        self.max_buffered = max(1, max_buffered)
+        self.dropped = 0
+        self._buffer: List[Span] = []
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._failed = False
+
+    def submit(self, span: Span):
+        """Queue a span for the next background write"""
+        with self._condition:
+            if self._failed:
+                return
+            if len(self._buffer) >= self.max_buffered:
+                if not self.dropped:
+                    logger.warning(f"Trace export is falling behind, dropping spans for {self.path}")
+                self.dropped += 1
+                return
+            self._buffer.append(span)
+            # Wake the writer early rather than drop spans under a burst
+            if len(self._buffer) == self.max_buffered // 2:
+                self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write every buffered span now"""
+        with self._write_lock:
+            with self._condition:
+                spans, self._buffer = self._buffer, []
+            if not spans or self._failed:
+                return
+            try:
+                self._write([(json.dumps(asdict(span), default=str) + "\n").encode("utf-8") for span in spans])
+            except OSError as e:
+                logger.error(f"Disabling trace export to {self.path}: {e}")
+                with self._condition:
+                    self._failed = True
+                    self._buffer = []
+
+    def _write(self, lines: List[bytes]):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "ab")
+        # Sized from the file itself, which other processes may also append to
+        size = os.fstat(self._file.fileno()).st_size
+        pending: List[bytes] = []
+        for line in lines:
+            if self.max_bytes and size and size + len(line) > self.max_bytes:
+                self._file.write(b"".join(pending))
+                pending = []
+                self._rotate()
+                size = 0
+            pending.append(line)
+            size += len(line)
+        self._file.write(b"".join(pending))
+        self._file.flush()
+
+    def _rotate(self):
+        """Shift traces.jsonl to traces.jsonl.1, .1 to .2 and so on, dropping the oldest"""
+        self._file.close()
+        self._file = None
+        if self.backups:
+            for index in range(self.backups - 1, 0, -1):
+                older = self.path.with_name(f"{self.path.name}.{index}")
+                if older.exists():
+                    os.replace(older, self.path.with_name(f"{self.path.name}.{index + 1}"))
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "ab")
+
+
+class Tracer:
+    """Records spans, exports them as JSONL and keeps per-stage latency summaries
+
+    Spans nest through a context variable, so child spans opened inside a
+    ``span()`` block share its trace ID. Code that yields between start and
+    end (streaming generators) should measure itself and call ``record()``.
+    """
+
+    def __init__(self, export_path: Optional[Path] = TRACE_EXPORT_PATH, window: int = TRACE_WINDOW,
+                 enabled: bool = TRACING_ENABLED):
+        self.export_path = Path(export_path) if export_path else None
+        self.window = window
+        self.enabled = enabled
+        self._stats: Dict[str, _StageStats] = {}
+        self._lock = threading.Lock()
+        self.exporter = TraceExporter(self.export_path) if self.export_path else None
+
+    def _start(self, name: str, attributes: Dict[str, Any]) -> Span:
+        parent = _current_span.get()
+        return Span(
+            name=name,
+            trace_id=parent.trace_id if parent else _new_id(),
+            span_id=_new_id(),
+            parent_id=parent.span_id if parent else None,
+            start_time=time.time(),
+            attributes=dict(attributes)
+        )
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time a block; the duration is always measured, even with tracing disabled"""
+        span = self._start(name, attributes)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.attributes["error"] = str(e)
+            raise
+        finally:
+            span.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record(self, name: str, duration_ms: float, **attributes) -> Span:
+        """Record an already measured operation as a child of the current span"""
+        span = self._start(name, attributes)
+        span.start_time -= duration_ms / 1000
+        span.duration_ms = round(duration_ms, 3)
+        self._finish(span)
+        return span
+
+    def within(self, stream: Iterator[str], parent: Span) -> Iterator[str]:
+        """Iterate a lazy stream with ``parent`` as the current span
+
+        Generators run in their consumer's context, so without this spans
+        recorded while streaming would start traces of their own.
+        """
+        try:
+            while True:
+                token = _current_span.set(parent)
+                try:
+                    chunk = next(stream)
+                except StopIteration:
+                    return
+                finally:
+                    _current_span.reset(token)
+                yield chunk
+        finally:
+            # Propagate close() so an abandoned stream stops generating
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+    async def awithin(self, stream: AsyncIterator[str], parent: Span) -> AsyncIterator[str]:
+        """Async variant of within"""
+        try:
+            while True:
+                token = _current_span.set(parent)
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current_span.reset(token)
+                yield chunk
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose:
+                await aclose()
+
+    def _finish(self, span: Span):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = _StageStats(self.window)
+            stats.add(span)
+        if self.exporter is not None:
+            self.exporter.submit(span)
+
+    def flush(self):
+        """Write spans still waiting for the background exporter"""
+        if self.exporter is not None:
+            self.exporter.flush()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """p50/p95/p99, mean and counters per stage"""
+        with self._lock:
+            return {
+                name: {
+                    "count": stats.count,
+                    "mean_ms": round(stats.total_ms / stats.count, 3) if stats.count else 0.0,
+                    **{f"p{int(q * 100)}_ms": stats.quantile(q) for q in QUANTILES},
+                    **stats.counters,
+                }
+                for name, stats in sorted(self._stats.items())
+            }
+
+    def prometheus_text(self) -> str:
+        """Per-stage summaries in the Prometheus text exposition format"""
+        lines = [
+            "# HELP rag_stage_duration_ms Duration of RAG pipeline stages in milliseconds.",
+            "# TYPE rag_stage_duration_ms summary",
+        ]
+        counters: Dict[str, list] = {}
+        with self._lock:
+            for name, stats in sorted(self._stats.items()):
+                for q in QUANTILES:
+                    lines.append(f'rag_stage_duration_ms{{stage="{name}",quantile="{q}"}} {stats.quantile(q)}')
+                lines.append(f'rag_stage_duration_ms_sum{{stage="{name}"}} {round(stats.total_ms, 3)}')
+                lines.append(f'rag_stage_duration_ms_count{{stage="{name}"}} {stats.count}')
+                for counter, value in stats.counters.items():
+                    counters.setdefault(counter, []).append(f'rag_stage_{counter}_total{{stage="{name}"}} {value}')
+
+        for counter, counter_lines in sorted(counters.items()):
+            lines.append(f"# HELP rag_stage_{counter}_total Total {counter.replace('_', ' ')} processed per stage.")
+            lines.append(f"# TYPE rag_stage_{counter}_total counter")
+            lines.extend(counter_lines)
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Process-wide tracer shared by all pipeline components
+tracer = Tracer()
@@ -0,0 +1,177 @@
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from config import CHAT_HISTORY_PATH, CHAT_HISTORY_RETENTION_DAYS
+from src.generation.scheduler import generation_request
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatMessage:
+    """A stored chat message"""
+    id: int
+    role: str
+    content: str
+    created_at: float
+
+    def to_langchain(self):
+        return HumanMessage(content=self.content) if self.role == "user" else AIMessage(content=self.content)
+
+
+class ChatHistoryStore:
+    """Chat sessions persisted in SQLite
+
+    Callers keep only a session ID and read the slice of messages they
+    need: a window of recent messages to display or pass to the pipeline,
+    and earlier pages on demand. Sessions idle for longer than
+    ``retention_days`` are deleted when the store is opened.
+    """
+
+    def __init__(self, path: Path = CHAT_HISTORY_PATH, retention_days: Optional[float] = CHAT_HISTORY_RETENTION_DAYS):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        if retention_days is not None:
+            self.prune(time.time() - retention_days * 86400)
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+        conn.commit()
+        return conn
+
+    def append(self, session_id: str, role: str, content: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def recent(self, session_id: str, limit: int) -> List[ChatMessage]:
+        """The latest ``limit`` messages of a session, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE session_id = ? "
+                "ORDER BY id DESC LIMIT ?", (session_id, limit)
+            ).fetchall()
+        return [ChatMessage(*row) for row in reversed(rows)]
+
+    def langchain_history(self, session_id: str, limit: int) -> List:
+        """The latest messages as LangChain messages, as expected by ``RAGPipeline.query_stream``
+
+        The window starts at a multiple of ``limit // 2`` messages, so it
+        holds between half and all of ``limit`` and its first message only
+        moves every few turns. Prompts built from it then keep a stable
+        prefix that Ollama can reuse from one turn to the next.
+        """
+        step = max(1, limit // 2)
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            start = -(-max(0, total - limit) // step) * step
+            rows = self._conn.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE session_id = ? "
+                "ORDER BY id LIMIT -1 OFFSET ?", (session_id, start)
+            ).fetchall()
+        return [ChatMessage(*row).to_langchain() for row in rows]
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def prune(self, before: float) -> int:
+        """Delete sessions whose last message is older than ``before`` (Unix time)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM messages GROUP BY session_id HAVING MAX(created_at) < ?)", (before,)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} chat messages from idle sessions")
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BackgroundAnswer:
+    """Generates one answer on a background thread
+
+    The thread consumes ``query_stream`` into a list of chunks and stores
+    the finished answer with ``on_done``, so a UI can poll ``text()`` at
+    its own pace and a page rerun or disconnect never interrupts
+    generation or loses the answer. Its generations are queued under
+    ``session_id``.
+    """
+
+    def __init__(self, query_stream: Callable[..., Dict[str, Any]], question: str, chat_history: List,
+                 on_done: Optional[Callable[[str], None]] = None, session_id: Optional[str] = None, **kwargs):
+        self.question = question
+        self.sources: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self._parts: List[str] = []
+        self._done = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(query_stream, question, chat_history, on_done, session_id, kwargs),
+            name="background-answer", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, query_stream, question, chat_history, on_done, session_id, kwargs):
+        try:
+            with generation_request(session_id):
+                result = query_stream(question, chat_history, **kwargs)
+                self.sources = result.get("sources", [])
+                for chunk in result["answer_stream"]:
+                    # list.append is atomic, so readers never see a torn list
+                    self._parts.append(chunk)
+        except Exception as e:
+            logger.error(f"Background answer failed: {e}")
+            self.error = f"Error generating response: {e}"
+        finally:
+            try:
+                if on_done is not None:
+                    on_done(self.error or self.text())
+            finally:
+                self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
@@ -0,0 +1,143 @@
+import json
+import logging
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from config import (
+    OLLAMA_BASE_URL, LLM_MODEL, EMBEDDING_MODEL, HEALTH_CHECK_TTL, HEALTH_PROBE_TIMEOUT, INGESTION_MANIFEST_PATH
+)
+from src.generation import StreamOutcome
+from src.ingestion.manifest import IngestionManifest
+from src.resources import resources
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of a single health probe"""
+    ok: bool
+    latency_ms: float
+    detail: Dict[str, Any] = field(default_factory=dict)
+
+
+def _model_available(name: str, installed: set) -> bool:
+    """Match a configured model name against installed tags like ``mistral:latest``"""
+    return name in installed or f"{name}:latest" in installed
+
+
+def _timed(name: str, probe: Callable[[], Dict[str, Any]]) -> ProbeResult:
+    """Run a probe returning ``{"ok": bool, ...}`` and record its latency"""
+    start = time.perf_counter()
+    try:
+        detail = probe()
+        ok = bool(detail.pop("ok"))
+    except Exception as e:
+        ok, detail = False, {"error": str(e)}
+    if not ok:
+        logger.warning(f"Health probe '{name}' failed: {detail}")
+    return ProbeResult(ok=ok, latency_ms=round((time.perf_counter() - start) * 1000, 2), detail=detail)
+
+
+class HealthChecker:
+    """Tiered health checks for the RAG pipeline
+
+    Liveness probes ask the embedding server and every generation endpoint
+    which models are installed and count the documents in the collection;
+    they never generate and their results are reused for ``ttl`` seconds.
+    Generation counts as up while any endpoint that is not cooling down
+    after a failure has the model. The deep check additionally embeds a query
+    and runs a real generation, and is only performed when asked for.
+    """
+
+    def __init__(self, retrieval, generation, ttl: float = HEALTH_CHECK_TTL,
+                 base_url: str = OLLAMA_BASE_URL, timeout: float = HEALTH_PROBE_TIMEOUT):
+        self.retrieval = retrieval
+        self.generation = generation
+        self.ttl = ttl
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._cached: Optional[Dict[str, ProbeResult]] = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    def _installed_models(self, base_url: str) -> set:
+        with urllib.request.urlopen(f"{base_url}/api/tags", timeout=self.timeout) as response:
+            tags = json.load(response)
+        return {model["name"] for model in tags.get("models", [])}
+
+    def _probe_ollama(self) -> Dict[str, Any]:
+        embedding_ok = _model_available(EMBEDDING_MODEL, self._installed_models(self.base_url))
+
+        endpoints = {}
+        for endpoint in resources.generation_scheduler().stats()["endpoints"]:
+            try:
+                llm_ok = _model_available(LLM_MODEL, self._installed_models(endpoint["url"]))
+                endpoints[endpoint["url"]] = {"llm_model": llm_ok, "cooling_down": endpoint["cooling_down"]}
+            except Exception as e:
+                endpoints[endpoint["url"]] = {"llm_model": False, "error": str(e)}
+        llm_ok = any(detail["llm_model"] and not detail.get("cooling_down") for detail in endpoints.values())
+        return {"ok": llm_ok and embedding_ok, "llm_model": llm_ok, "embedding_model": embedding_ok,
+                "endpoints": endpoints}
+
+    def _probe_collection(self) -> Dict[str, Any]:
+        # Until the first query opens the vector store, answer from the ingestion manifest instead of opening it here
+        if not resources.is_created("vectorstore"):
+            manifest = IngestionManifest.load(INGESTION_MANIFEST_PATH)
+            count = sum(len(record.chunk_ids) for record in manifest.records.values())
+            return {"ok": count > 0, "documents": count, "source": "manifest"}
+
+        vectorstore = self.retrieval.vectorstore
+        if vectorstore is None:
+            return {"ok": False, "documents": 0}
+        count = vectorstore.count()
+        return {"ok": count > 0, "documents": count}
+
+    def _probe_embedding(self) -> Dict[str, Any]:
+        vector = self.retrieval.embeddings.embed_query("health check")
+        return {"ok": bool(vector), "dimensions": len(vector)}
+
+    def _probe_generation(self) -> Dict[str, Any]:
+        outcome = StreamOutcome()
+        response = "".join(self.generation.generate_response_stream("Test", [], [], outcome=outcome))
+        return {"ok": bool(response) and outcome.completed}
+
+    def liveness(self, force: bool = False) -> Dict[str, ProbeResult]:
+        """Cheap probes, cached for ``ttl`` seconds"""
+        with self._lock:
+            if not force and self._cached is not None and time.monotonic() - self._cached_at < self.ttl:
+                return self._cached
+
+            self._cached = {
+                "ollama": _timed("ollama", self._probe_ollama),
+                "collection": _timed("collection", self._probe_collection),
+            }
+            self._cached_at = time.monotonic()
+            return self._cached
+
+    def deep(self) -> Dict[str, ProbeResult]:
+        """Liveness probes plus a real embedding and generation, never cached"""
+        probes = dict(self.liveness(force=True))
+        probes["embedding"] = _timed("embedding", self._probe_embedding)
+        probes["generation"] = _timed("generation", self._probe_generation)
+        return probes
+
+    def check(self, deep: bool = False) -> Dict[str, Any]:
+        """Component status with per-probe latencies and details"""
+        probes = self.deep() if deep else self.liveness()
+        status = {
+            "ingestion": True,
+            "retrieval": probes["collection"].ok,
+            "generation": bool(probes["ollama"].detail.get("llm_model", False)),
+            "deep": deep,
+            "latency_ms": {name: probe.latency_ms for name, probe in probes.items()},
+            "details": {name: {"ok": probe.ok, **probe.detail} for name, probe in probes.items()},
+        }
+        if deep:
+            status["retrieval"] = status["retrieval"] and probes["embedding"].ok
+            status["generation"] = probes["generation"].ok
+
+        return status
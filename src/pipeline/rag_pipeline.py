@@ -1,9 +1,22 @@
+import asyncio
+import contextvars
 import logging
-from typing import Dict, Any, List, Iterator
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Dict, Any, List, AsyncIterator, Iterator, Optional, Sequence, Tuple
 
-from src.ingestion import DocumentIngestion
-from src.retrieval import DocumentRetrieval
-from src.generation import ResponseGeneration
+from langchain_core.messages import HumanMessage
+
+from config import (
+    RESPONSE_CACHE_ENABLED, RERANK_ENABLED, RERANK_FETCH_K, BATCH_QUERY_SIZE, BATCH_GENERATION_WORKERS,
+    CONDENSE_QUESTIONS, PREFETCH_WORKERS
+)
+from src.retrieval import DocumentRetrieval, RerankStage, RetrievalFilter, create_reranker
+from src.generation import ResponseGeneration, StreamOutcome, PRIORITY_BATCH, generation_request
+from src.observability import tracer
+from .health import HealthChecker
+from .response_cache import ResponseCache, normalize_question, replay_stream
 
 logger = logging.getLogger(__name__)
 
@@ -11,16 +24,165 @@ class RAGPipeline:
     """Main RAG pipeline orchestrator with streaming support and chat history"""
     
     def __init__(self):
-        self.ingestion = DocumentIngestion()
+        # Components are cheap to build; the clients they use are created on first use
         self.retrieval = DocumentRetrieval()
         self.generation = ResponseGeneration()
+        self.response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+        self.health = HealthChecker(self.retrieval, self.generation)
+
+    @cached_property
+    def ingestion(self):
+        """Ingestion component, imported on first use so query-only processes skip the document loaders"""
+        from src.ingestion import DocumentIngestion
+        return DocumentIngestion()
+
+    @cached_property
+    def rerank_stage(self) -> Optional[RerankStage]:
+        """Rerank stage, built on the first query since rerankers may load a model"""
+        if not RERANK_ENABLED:
+            return None
+        return RerankStage(self.retrieval.embeddings, create_reranker(),
+                           stored_embeddings=self.retrieval.stored_embeddings)
         
+    @cached_property
+    def prefetch_pool(self) -> ThreadPoolExecutor:
+        """Threads running speculative retrievals while follow-up questions are condensed"""
+        return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="retrieval-prefetch")
+
     def ingest_documents(self):
         """Run document ingestion process"""
         logger.info("Starting document ingestion...")
+        # Runs that change the collection rewrite the manifest, which invalidates the response cache
         return self.ingestion.process_and_store()
+
+    @staticmethod
+    def _is_standalone(question: str, chat_history: Optional[List]) -> bool:
+        """Whether a question has no earlier human turns its answer could depend on"""
+        human_turns = [msg for msg in chat_history or [] if isinstance(msg, HumanMessage)]
+        if human_turns and human_turns[-1].content == question:
+            human_turns = human_turns[:-1]
+        return not human_turns
+
+    def _use_cache(self, question: str, chat_history: Optional[List], filters: Optional[RetrievalFilter]) -> bool:
+        """Whether an answer may be served from or stored in the response cache"""
+        return (
+            self.response_cache is not None
+            and (filters is None or filters.is_empty)
+            and self._is_standalone(question, chat_history)
+        )
+
+    def _caching_stream(self, question: str, k: int, answer_stream: Iterator[str], outcome: StreamOutcome,
+                        sources: List[Dict[str, Any]], query_embedding: Optional[List[float]]) -> Iterator[str]:
+        """Pass a generated stream through and cache the answer if the stream reports it complete"""
+        start = time.perf_counter()
+        parts = []
+        for chunk in answer_stream:
+            parts.append(chunk)
+            yield chunk
+
+        answer = "".join(parts)
+        if answer and outcome.completed:
+            self.response_cache.put(
+                question, k, answer, sources,
+                generation_seconds=time.perf_counter() - start,
+                embedding=query_embedding
+            )
     
-    def query_stream(self, question: str, chat_history: List = None, k: int = 5) -> Dict[str, Any]:
+    def _condenses(self, question: str, chat_history: Optional[List]) -> bool:
+        """Whether a question is a follow-up to rewrite into a standalone retrieval query"""
+        return CONDENSE_QUESTIONS and not self._is_standalone(question, chat_history)
+
+    def _retrieve(self, question: str, chat_history: Optional[List], k: int,
+                  filters: Optional[RetrievalFilter], timings: Dict[str, float]) -> Tuple[str, List]:
+        """Retrieve candidates, returning them with the query to rerank them against
+
+        Follow-up questions are rewritten into standalone queries by the
+        model. The question as asked is retrieved speculatively while the
+        rewrite runs and both result lists are fused, so the rewrite only
+        adds its own latency and one more retrieval to the critical path.
+        """
+        start = time.perf_counter()
+        if not self._condenses(question, chat_history):
+            docs = self.retrieval.retrieve_documents(question, k=k, filters=filters)
+            timings["retrieval_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return question, docs
+
+        # Run in a copy of the current context so its spans belong to this query's trace
+        speculative = self.prefetch_pool.submit(
+            contextvars.copy_context().run, self.retrieval.retrieve_documents, question, k, filters
+        )
+        condensed = self.generation.condense_question(question, chat_history)
+        timings["condense_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        result_lists = [speculative.result()]
+        if normalize_question(condensed) != normalize_question(question):
+            result_lists.insert(0, self.retrieval.retrieve_documents(condensed, k=k, filters=filters))
+        timings["retrieval_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return condensed, self.retrieval.merge_results(result_lists, k)
+
+    async def _aretrieve(self, question: str, chat_history: Optional[List], k: int,
+                         filters: Optional[RetrievalFilter], timings: Dict[str, float]) -> Tuple[str, List]:
+        """Async variant of _retrieve"""
+        start = time.perf_counter()
+        if not self._condenses(question, chat_history):
+            docs = await self.retrieval.aretrieve_documents(question, k=k, filters=filters)
+            timings["retrieval_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return question, docs
+
+        speculative = asyncio.ensure_future(self.retrieval.aretrieve_documents(question, k=k, filters=filters))
+        condensed = await self.generation.acondense_question(question, chat_history)
+        timings["condense_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        result_lists = [await speculative]
+        if normalize_question(condensed) != normalize_question(question):
+            result_lists.insert(0, await self.retrieval.aretrieve_documents(condensed, k=k, filters=filters))
+        timings["retrieval_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return condensed, self.retrieval.merge_results(result_lists, k)
+
+    def _rerank(self, question: str, relevant_docs: List, k: int, timings: Dict[str, float]) -> List:
+        """Narrow over-fetched candidates to ``k``, falling back to retrieval order on failure"""
+        if self.rerank_stage is None or len(relevant_docs) <= k:
+            return relevant_docs[:k]
+        start = time.perf_counter()
+        try:
+            with tracer.span("rerank", documents=len(relevant_docs), top_n=k):
+                return self.rerank_stage.rerank(question, relevant_docs, top_n=k, timings=timings)
+        except Exception as e:
+            logger.error(f"Reranking failed, using retrieval order: {e}")
+            return relevant_docs[:k]
+        finally:
+            timings["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    @staticmethod
+    def _build_sources(relevant_docs: List) -> List[Dict[str, Any]]:
+        """Summarize retrieved documents for display alongside the answer"""
+        sources = []
+        for doc in relevant_docs:
+            source_info = {
+                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+                "metadata": doc.metadata
+            }
+            sources.append(source_info)
+        return sources
+
+    async def _acaching_stream(self, question: str, k: int, answer_stream: AsyncIterator[str],
+                               outcome: StreamOutcome, sources: List[Dict[str, Any]],
+                               query_embedding: Optional[List[float]]) -> AsyncIterator[str]:
+        """Async variant of _caching_stream"""
+        start = time.perf_counter()
+        parts = []
+        async for chunk in answer_stream:
+            parts.append(chunk)
+            yield chunk
+
+        answer = "".join(parts)
+        if answer and outcome.completed:
+            self.response_cache.put(
+                question, k, answer, sources,
+                generation_seconds=time.perf_counter() - start,
+                embedding=query_embedding
+            )
+
+    def query_stream(self, question: str, chat_history: List = None, k: int = 5,
+                     filters: Optional[RetrievalFilter] = None) -> Dict[str, Any]:
         """
         Main streaming query interface for the RAG system with chat history
         
@@ -28,13 +190,44 @@ class RAGPipeline:
             question: User's question
             chat_history: List of previous messages
             k: Number of documents to retrieve
+            filters: Optional restriction of the search to a namespace, folder, file type or ingest time
             
         Returns:
             Dictionary containing streaming answer generator and metadata
         """
+        with tracer.span("query", k=k) as query_span:
+            result = self._query_stream(question, chat_history, k, filters)
+            query_span.set(cached=result.get("cached", False), documents=result["num_sources"])
+        # Spans recorded while the answer streams belong to this query's trace
+        result["answer_stream"] = tracer.within(result["answer_stream"], query_span)
+        return result
+
+    def _query_stream(self, question: str, chat_history: Optional[List], k: int,
+                      filters: Optional[RetrievalFilter]) -> Dict[str, Any]:
         try:
-            # Retrieve relevant documents
-            relevant_docs = self.retrieval.retrieve_documents(question, k=k)
+            # Follow-up questions depend on the conversation, so only standalone, unscoped ones are cached
+            use_cache = self._use_cache(question, chat_history, filters)
+            query_embedding = None
+            if use_cache:
+                with tracer.span("response_cache.lookup") as span:
+                    if self.response_cache.semantic:
+                        query_embedding = self.retrieval.embeddings.embed_query(question)
+                    cached = self.response_cache.get(question, k, query_embedding)
+                    span.set(hit=cached is not None)
+                if cached:
+                    logger.info("Serving answer from response cache")
+                    return {
+                        "answer_stream": replay_stream(cached.answer),
+                        "sources": cached.sources,
+                        "num_sources": len(cached.sources),
+                        "cached": True
+                    }
+
+            # Retrieve relevant documents, over-fetching candidates for the rerank stage
+            timings = {}
+            fetch_k = max(k, RERANK_FETCH_K) if self.rerank_stage else k
+            search_query, relevant_docs = self._retrieve(question, chat_history, fetch_k, filters, timings)
+            relevant_docs = self._rerank(search_query, relevant_docs, k, timings)
             
             if not relevant_docs:
                 def empty_stream():
@@ -46,33 +239,39 @@ class RAGPipeline:
                     "num_sources": 0
                 }
             
+            # Hits are widened with their neighbouring chunks for generation; sources list the hits themselves
+            context_docs = self.retrieval.expand_neighbours(relevant_docs)
+
             # Generate streaming response with chat history
+            outcome = StreamOutcome()
             answer_stream = self.generation.generate_response_stream(
                 question, 
-                relevant_docs, 
-                chat_history=chat_history
+                context_docs, 
+                chat_history=chat_history,
+                outcome=outcome
             )
             
             # Extract source information
-            sources = []
-            for doc in relevant_docs:
-                source_info = {
-                    "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                    "metadata": doc.metadata
-                }
-                sources.append(source_info)
+            sources = self._build_sources(relevant_docs)
+
+            if use_cache:
+                answer_stream = self._caching_stream(question, k, answer_stream, outcome, sources, query_embedding)
             
             return {
                 "answer_stream": answer_stream,
                 "sources": sources,
-                "num_sources": len(sources)
+                "num_sources": len(sources),
+                "cached": False,
+                "timings": timings
             }
             
         except Exception as e:
             logger.error(f"Error in RAG pipeline streaming: {e}")
+            # Bound now: ``e`` is cleared when the except block ends, before the stream is consumed
+            message = f"I encountered an error while processing your question: {str(e)}"
             
             def error_stream():
-                yield f"I encountered an error while processing your question: {str(e)}"
+                yield message
             
             return {
                 "answer_stream": error_stream(),
@@ -80,28 +279,199 @@ class RAGPipeline:
                 "num_sources": 0
             }
     
-    def health_check(self) -> Dict[str, bool]:
-        """Check if all components are working"""
-        status = {
-            "ingestion": False,
-            "retrieval": False,
-            "generation": False
-        }
-        
+    def query_batch(self, questions: Sequence[str], k: int = 5, filters: Optional[RetrievalFilter] = None,
+                    batch_size: int = BATCH_QUERY_SIZE, max_workers: int = BATCH_GENERATION_WORKERS,
+                    generate: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Answer many standalone questions, yielding results in input order
+
+        Questions are processed ``batch_size`` at a time: embedded together,
+        looked up in the response cache, and retrieved with one multi-query
+        search. Reranking and generation then run on a pool of
+        ``max_workers`` threads, so the LLM server sees a bounded number of
+        concurrent requests.
+
+        Args:
+            questions: Questions without chat history
+            k: Number of documents used per answer
+            filters: Optional restriction applied to every question
+            generate: Set to False to only retrieve, e.g. for retrieval evaluation
+
+        Yields:
+            Dictionaries with the question, answer (None without generation), sources and timings
+        """
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="batch-query") as executor:
+            for start in range(0, len(questions), max(1, batch_size)):
+                yield from self._query_window(list(questions[start:start + batch_size]), k, filters,
+                                              executor, generate)
+
+    def _query_window(self, questions: List[str], k: int, filters: Optional[RetrievalFilter],
+                      executor: ThreadPoolExecutor, generate: bool) -> List[Dict[str, Any]]:
+        """Answer one window of a batch"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        # Batch questions carry no chat history, so only the filters decide whether the cache applies
+        use_cache = generate and self.response_cache is not None and (filters is None or filters.is_empty)
+        query_embeddings = None
+        if use_cache and self.response_cache.semantic:
+            query_embeddings = self.retrieval.embeddings.embed_documents(questions)
+
+        pending = []
+        for i, question in enumerate(questions):
+            cached = self.response_cache.get(question, k, query_embeddings[i] if query_embeddings else None) \
+                if use_cache else None
+            if cached:
+                results[i] = {"question": question, "answer": cached.answer, "sources": cached.sources,
+                              "num_sources": len(cached.sources), "cached": True}
+            else:
+                pending.append(i)
+
+        if pending:
+            fetch_k = max(k, RERANK_FETCH_K) if self.rerank_stage else k
+            start = time.perf_counter()
+            retrieved = self.retrieval.retrieve_documents_batch(
+                [questions[i] for i in pending], k=fetch_k, filters=filters,
+                query_embeddings=[query_embeddings[i] for i in pending] if query_embeddings else None
+            )
+            # Batch retrieval time is shared by its questions
+            retrieval_ms = round((time.perf_counter() - start) * 1000 / len(pending), 2)
+
+            futures = [
+                executor.submit(self._answer_retrieved, questions[i], docs, k, retrieval_ms, generate,
+                                query_embeddings[i] if query_embeddings else None, use_cache)
+                for i, docs in zip(pending, retrieved)
+            ]
+            for i, future in zip(pending, futures):
+                results[i] = future.result()
+        return results
+
+    def _answer_retrieved(self, question: str, relevant_docs: List, k: int, retrieval_ms: float, generate: bool,
+                          query_embedding: Optional[List[float]], use_cache: bool) -> Dict[str, Any]:
+        """Rerank, expand and answer one batch question whose documents were already retrieved"""
+        with tracer.span("query", k=k, batch=True) as span:
+            timings = {"retrieval_ms": retrieval_ms}
+            try:
+                relevant_docs = self._rerank(question, relevant_docs, k, timings)
+                sources = self._build_sources(relevant_docs)
+                answer = None
+                if generate:
+                    if relevant_docs:
+                        start = time.perf_counter()
+                        outcome = StreamOutcome()
+                        # Batch answers yield generation slots to interactive chats
+                        with generation_request("batch", priority=PRIORITY_BATCH):
+                            answer = "".join(self.generation.generate_response_stream(
+                                question, self.retrieval.expand_neighbours(relevant_docs), outcome=outcome
+                            ))
+                        timings["generation_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                        if use_cache and outcome.completed:
+                            self.response_cache.put(question, k, answer, sources,
+                                                    generation_seconds=timings["generation_ms"] / 1000,
+                                                    embedding=query_embedding)
+                    else:
+                        answer = "I couldn't find any relevant information to answer your question."
+                span.set(documents=len(sources))
+                return {"question": question, "answer": answer, "sources": sources,
+                        "num_sources": len(sources), "cached": False, "timings": timings}
+            except Exception as e:
+                logger.error(f"Error answering batch question: {e}")
+                return {"question": question, "answer": None, "sources": [], "num_sources": 0,
+                        "cached": False, "error": str(e)}
+
+    async def aquery_stream(self, question: str, chat_history: List = None, k: int = 5,
+                            filters: Optional[RetrievalFilter] = None) -> Dict[str, Any]:
+        """
+        Async counterpart of query_stream
+
+        Embedding, retrieval and generation never block the event loop, so a
+        single process can serve many concurrent chats.
+
+        Returns:
+            Dictionary containing an async iterator of answer tokens and metadata
+        """
+        with tracer.span("query", k=k) as query_span:
+            result = await self._aquery_stream(question, chat_history, k, filters)
+            query_span.set(cached=result.get("cached", False), documents=result["num_sources"])
+        result["answer_stream"] = tracer.awithin(result["answer_stream"], query_span)
+        return result
+
+    async def _aquery_stream(self, question: str, chat_history: Optional[List], k: int,
+                             filters: Optional[RetrievalFilter]) -> Dict[str, Any]:
+        async def message_stream(message: str) -> AsyncIterator[str]:
+            yield message
+
+        async def areplay_stream(answer: str) -> AsyncIterator[str]:
+            for piece in replay_stream(answer):
+                yield piece
+
         try:
-            # Check retrieval (most critical for query time)
-            if self.retrieval.vectorstore:
-                status["retrieval"] = True
-            
-            # Check generation
-            test_response = list(self.generation.generate_response_stream("Test", [], []))
-            if test_response:
-                status["generation"] = True
-                
-            # Ingestion is checked when needed
-            status["ingestion"] = True
-            
+            use_cache = self._use_cache(question, chat_history, filters)
+            query_embedding = None
+            if use_cache:
+                with tracer.span("response_cache.lookup") as span:
+                    if self.response_cache.semantic:
+                        query_embedding = await self.retrieval.embeddings.aembed_query(question)
+                    cached = self.response_cache.get(question, k, query_embedding)
+                    span.set(hit=cached is not None)
+                if cached:
+                    logger.info("Serving answer from response cache")
+                    return {
+                        "answer_stream": areplay_stream(cached.answer),
+                        "sources": cached.sources,
+                        "num_sources": len(cached.sources),
+                        "cached": True
+                    }
+
+            timings = {}
+            fetch_k = max(k, RERANK_FETCH_K) if self.rerank_stage else k
+            search_query, relevant_docs = await self._aretrieve(question, chat_history, fetch_k, filters, timings)
+            # Executor threads run in a copy of this context, keeping the query's trace and generation request
+            relevant_docs = await asyncio.get_running_loop().run_in_executor(
+                None, contextvars.copy_context().run, self._rerank, search_query, relevant_docs, k, timings
+            )
+
+            if not relevant_docs:
+                return {
+                    "answer_stream": message_stream("I couldn't find any relevant information to answer your question."),
+                    "sources": [],
+                    "num_sources": 0
+                }
+
+            context_docs = await asyncio.get_running_loop().run_in_executor(
+                None, contextvars.copy_context().run, self.retrieval.expand_neighbours, relevant_docs
+            )
+            outcome = StreamOutcome()
+            answer_stream = self.generation.agenerate_response_stream(
+                question,
+                context_docs,
+                chat_history=chat_history,
+                outcome=outcome
+            )
+            sources = self._build_sources(relevant_docs)
+
+            if use_cache:
+                answer_stream = self._acaching_stream(question, k, answer_stream, outcome, sources, query_embedding)
+
+            return {
+                "answer_stream": answer_stream,
+                "sources": sources,
+                "num_sources": len(sources),
+                "cached": False,
+                "timings": timings
+            }
+
         except Exception as e:
-            logger.error(f"Health check failed: {e}")
-            
-        return status
+            logger.error(f"Error in RAG pipeline streaming: {e}")
+            return {
+                "answer_stream": message_stream(f"I encountered an error while processing your question: {str(e)}"),
+                "sources": [],
+                "num_sources": 0
+            }
+
+    def health_check(self, deep: bool = False) -> Dict[str, Any]:
+        """Check if all components are working
+
+        By default only cheap, cached liveness probes run (Ollama model
+        availability and collection size). Pass ``deep=True`` to also embed a
+        query and run a real generation.
+        """
+        return self.health.check(deep=deep)
@@ -0,0 +1,191 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    INGESTION_MANIFEST_PATH, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_SIMILARITY_THRESHOLD
+)
+from src.utils.vectors import normalize
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for exact-match lookups"""
+    normalized = re.sub(r"\s+", " ", question.strip().lower())
+    return normalized.rstrip("?!. ")
+
+
+def manifest_version(path: Path = INGESTION_MANIFEST_PATH) -> int:
+    """Version stamp of the collection, taken from the ingestion manifest's mtime
+
+    The manifest is rewritten only by ingestion runs that change its
+    records, so a changed mtime means cached answers may be stale.
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+@dataclass
+class CachedResponse:
+    """A generated answer stored in the response cache"""
+    question: str
+    answer: str
+    sources: List[Dict[str, Any]]
+    generation_seconds: float
+
+
+class ResponseCache:
+    """In-memory LRU cache of generated answers
+
+    Entries are keyed by the normalized question text and the number of
+    documents the answer was generated from. Lookups match the key exactly
+    and, when a similarity threshold is set, fall back to the most similar
+    cached query embedding with the same ``k``. Embeddings are kept
+    normalized in one matrix with a row per cache slot, so that fallback is a
+    single matrix-vector product. The whole cache is dropped when the
+    collection version changes.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 similarity_threshold: Optional[float] = RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+                 version_fn: Callable[[], int] = manifest_version):
+        self.max_entries = max(1, max_entries)
+        self.similarity_threshold = similarity_threshold
+        self.version_fn = version_fn
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._entries: "OrderedDict[Tuple[str, int], CachedResponse]" = OrderedDict()
+        # Semantic index: embedding rows, the key and k stored in each slot (k is 0 for a free slot)
+        self._matrix: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[Tuple[str, int]]] = [None] * self.max_entries
+        self._slot_k = np.zeros(self.max_entries, dtype=np.int64)
+        self._slots: Dict[Tuple[str, int], int] = {}
+        self._version = version_fn()
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity_threshold is not None
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._slots.clear()
+        self._slot_keys = [None] * self.max_entries
+        self._slot_k[:] = 0
+
+    def _check_version(self):
+        """Drop every entry if the collection changed since they were stored"""
+        version = self.version_fn()
+        if version != self._version:
+            if self._entries:
+                logger.info(f"Collection changed, invalidating {len(self._entries)} cached responses")
+            self._clear_locked()
+            self._version = version
+
+    def _remove_slot(self, key: Tuple[str, int]):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._slot_keys[slot] = None
+            self._slot_k[slot] = 0
+
+    def _store_embedding(self, key: Tuple[str, int], embedding: List[float]):
+        """Write a query embedding into a free slot of the matrix"""
+        vector = normalize(embedding)
+        if self._matrix is None or self._matrix.shape[1] != len(vector):
+            # First embedding, or the embedding model changed: older rows are not comparable
+            self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            self._slots.clear()
+            self._slot_keys = [None] * self.max_entries
+            self._slot_k[:] = 0
+        slot = self._slot_keys.index(None)
+        self._matrix[slot] = vector
+        self._slot_keys[slot] = key
+        self._slot_k[slot] = key[1]
+        self._slots[key] = slot
+
+    def _most_similar(self, embedding: List[float], k: int) -> Optional[Tuple[str, int]]:
+        """Key of the most similar cached query with the same ``k``, if it clears the threshold"""
+        if self._matrix is None or self._matrix.shape[1] != len(embedding):
+            return None
+        scores = self._matrix @ normalize(embedding)
+        scores[self._slot_k != k] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return self._slot_keys[best]
+
+    def get(self, question: str, k: int, embedding: Optional[List[float]] = None) -> Optional[CachedResponse]:
+        """Look up an answer generated from ``k`` documents by exact question text, then by embedding similarity"""
+        key = (normalize_question(question), k)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+
+            if entry is None and embedding is not None and self.semantic:
+                similar = self._most_similar(embedding, k)
+                if similar is not None:
+                    key, entry = similar, self._entries[similar]
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.latency_saved += entry.generation_seconds
+            return entry
+
+    def put(self, question: str, k: int, answer: str, sources: List[Dict[str, Any]],
+            generation_seconds: float, embedding: Optional[List[float]] = None):
+        """Store an answer generated from ``k`` documents, evicting the least recently used entry if full"""
+        key = (normalize_question(question), k)
+        with self._lock:
+            self._check_version()
+            self._remove_slot(key)
+            self._entries[key] = CachedResponse(
+                question=question,
+                answer=answer,
+                sources=sources,
+                generation_seconds=generation_seconds
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._remove_slot(evicted)
+            if embedding is not None:
+                self._store_embedding(key, embedding)
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+            self._version = self.version_fn()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate and latency-saved counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+
+def replay_stream(answer: str) -> Iterator[str]:
+    """Replay a cached answer word by word so it renders like a live stream"""
+    for piece in re.findall(r"\s*\S+\s*", answer) or [answer]:
+        yield piece
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from config import (
+    CHROMA_COLLECTION_NAME, CHROMA_PERSIST_DIRECTORY, EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED,
+    LLM_MODEL, LLM_KEEP_ALIVE, OLLAMA_BASE_URL, LEXICAL_INDEX_ENABLED, VECTOR_INDEX, COMPACT_INDEX_DIR,
+    VECTOR_STORE_BACKEND, NUMPY_STORE_DIR, ensure_data_dirs
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """Process-wide clients, created on first use and shared by every component
+
+    Heavy libraries (chromadb, langchain loaders, the Ollama client) are
+    imported inside the factories, so importing the pipeline stays cheap
+    and a query-only process never opens what it does not use.
+    """
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        # Reentrant because factories fetch the resources they depend on
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = factory()
+                self._instances[name] = instance
+                logger.info(f"Initialized {name} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return instance
+
+    def embedding_client(self):
+        """Batched Ollama embeddings client"""
+        def create():
+            from src.embeddings import BatchedOllamaEmbeddings
+            return BatchedOllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
+        return self._get("embedding_client", create)
+
+    def embeddings(self):
+        """Embedding client wrapped with the persistent cache when enabled"""
+        def create():
+            from src.embeddings import wrap_with_cache
+            return wrap_with_cache(self.embedding_client(), EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED)
+        return self._get("embeddings", create)
+
+    def chroma_client(self):
+        """Persistent Chroma client"""
+        def create():
+            import chromadb
+            ensure_data_dirs()
+            return chromadb.PersistentClient(path=CHROMA_PERSIST_DIRECTORY)
+        return self._get("chroma_client", create)
+
+    def vectorstore(self, collection_name: str = CHROMA_COLLECTION_NAME):
+        """Document collection on the configured ``VectorStore`` backend, the shared one by default"""
+        def create():
+            if VECTOR_STORE_BACKEND == "numpy":
+                from src.vectorstores.numpy_store import NumpyVectorStore
+                ensure_data_dirs()
+                return NumpyVectorStore(NUMPY_STORE_DIR / collection_name, self.embeddings(), name=collection_name)
+            if VECTOR_STORE_BACKEND == "chroma":
+                from src.vectorstores.chroma import ChromaVectorStore
+                return ChromaVectorStore(self.chroma_client(), collection_name, self.embeddings())
+            raise ValueError(f"Unknown vector store backend: {VECTOR_STORE_BACKEND}")
+        key = "vectorstore" if collection_name == CHROMA_COLLECTION_NAME else f"vectorstore:{collection_name}"
+        return self._get(key, create)
+
+    def lexical_index(self):
+        """BM25 index, or None when disabled"""
+        if not LEXICAL_INDEX_ENABLED:
+            return None
+
+        def create():
+            from src.retrieval.lexical_index import LexicalIndex
+            return LexicalIndex()
+        return self._get("lexical_index", create)
+
+    def compact_index(self, collection_name: str = CHROMA_COLLECTION_NAME):
+        """Memory-mapped int8 index of a collection's vectors, or None when the vector store searches itself"""
+        if VECTOR_INDEX != "compact":
+            return None
+
+        def create():
+            from src.retrieval.compact_index import CompactIndex
+            return CompactIndex(COMPACT_INDEX_DIR / collection_name)
+        key = "compact_index" if collection_name == CHROMA_COLLECTION_NAME else f"compact_index:{collection_name}"
+        return self._get(key, create)
+
+    def llm(self, base_url: str = OLLAMA_BASE_URL):
+        """Chat model used for generation, on the default Ollama server unless ``base_url`` names another"""
+        def create():
+            from langchain_ollama import ChatOllama
+            return ChatOllama(model=LLM_MODEL, base_url=base_url, keep_alive=LLM_KEEP_ALIVE)
+        return self._get("llm" if base_url == OLLAMA_BASE_URL else f"llm:{base_url}", create)
+
+    def generation_scheduler(self):
+        """Queue and slots shared by every generation in the process"""
+        def create():
+            from src.generation.scheduler import GenerationScheduler
+            return GenerationScheduler()
+        return self._get("generation_scheduler", create)
+
+    def override(self, **instances):
+        """Replace resources, e.g. with fake backends in benchmarks
+
+        Resources built on top of a replaced one (the cached embeddings and
+        the vector store on top of the embedding client) are dropped so they
+        are rebuilt around the replacement.
+        """
+        dependents = {
+            "embedding_client": ["embeddings", "vectorstore"],
+            "embeddings": ["vectorstore"],
+            "chroma_client": ["vectorstore"],
+        }
+        with self._lock:
+            for name, instance in instances.items():
+                for dependent in dependents.get(name, []):
+                    for key in list(self._instances):
+                        # Per-collection stores are keyed "vectorstore:<collection>"
+                        if key.split(":", 1)[0] == dependent and key not in instances:
+                            del self._instances[key]
+                self._instances[name] = instance
+
+    def is_created(self, name: str) -> bool:
+        return name in self._instances
+
+    def created(self) -> List[str]:
+        """Names of the resources initialized so far"""
+        return sorted(self._instances)
+
+    def reset(self):
+        """Forget all resources so the next access creates them again"""
+        with self._lock:
+            self._instances.clear()
+
+
+# Process-wide registry shared by all pipeline components
+resources = ResourceRegistry()
@@ -1,3 +1,5 @@
 from .document_retrieval import DocumentRetrieval
+from .filters import RetrievalFilter
+from .reranker import RerankStage, create_reranker
 
-__all__ = ['DocumentRetrieval']
+__all__ = ['DocumentRetrieval', 'RetrievalFilter', 'RerankStage', 'create_reranker']
@@ -0,0 +1,329 @@
+import heapq
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import COMPACT_RESCORE_CANDIDATES, COMPACT_SCAN_BLOCK_ROWS, COMPACT_VACUUM_RATIO
+from src.utils.vectors import normalize
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 900
+
+# Per-row files: int8 codes and their scales; rescoring reads the vector store's own embeddings
+CODES_FILE = "codes.{generation}.i8"
+SCALES_FILE = "scales.{generation}.f4"
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization, returning codes and the scale to restore them"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class CompactIndex:
+    """Memory-mapped int8 vector index for one collection
+
+    Vectors are normalized and quantized to int8 with one scale per row,
+    a quarter of the float32 size, and scanned block by block with NumPy,
+    so a query touches the codes sequentially and never searches a graph.
+    The best ``rescore_candidates`` rows are then re-scored by cosine
+    similarity against the embeddings the vector store already keeps for
+    them, so the index adds only the codes to what is on disk.
+
+    Files are append-only. Deleted rows are dropped from the row table and
+    masked out of the scan; once ``vacuum_ratio`` of the rows are dead the
+    live ones are copied into a new generation of files. Writes update the
+    live-row mask in place; other processes pick up changes through a
+    version counter checked before each search.
+    """
+
+    def __init__(self, directory: Path, rescore_candidates: int = COMPACT_RESCORE_CANDIDATES,
+                 block_rows: int = COMPACT_SCAN_BLOCK_ROWS, vacuum_ratio: float = COMPACT_VACUUM_RATIO):
+        self.directory = Path(directory)
+        self.rescore_candidates = rescore_candidates
+        self.block_rows = max(1, block_rows)
+        self.vacuum_ratio = vacuum_ratio
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+        self._version = None
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.directory / "rows.sqlite3"), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        conn.commit()
+        return conn
+
+    def _meta(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, **values: int):
+        self._conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            list(values.items())
+        )
+
+    def _path(self, template: str, generation: int) -> Path:
+        return self.directory / template.format(generation=generation)
+
+    def _map(self, template: str, dtype, shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+        if not shape[0]:
+            return None
+        return np.memmap(self._path(template, self._generation), dtype=dtype, mode="r", shape=shape)
+
+    def _remap(self):
+        """Map ``self._rows`` rows of the current generation's files"""
+        self._codes = self._map(CODES_FILE, np.int8, (self._rows, self._dim))
+        self._scales = self._map(SCALES_FILE, np.float32, (self._rows,))
+
+    def _load(self):
+        """Map the current generation of files and rebuild the live-row mask from the row table"""
+        self._version = self._meta("version")
+        self._generation = self._meta("generation")
+        self._rows = self._meta("rows")
+        self._dim = self._meta("dim")
+        self._remap()
+        self._alive = np.zeros(self._rows, dtype=bool)
+        live = np.fromiter((row for (row,) in self._conn.execute("SELECT row FROM rows")), dtype=np.int64)
+        self._alive[live[live < self._rows]] = True
+
+    def _refresh(self):
+        if self._meta("version") != self._version:
+            self._load()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def _append(self, generation: int, rows: int, codes: np.ndarray, scales: np.ndarray):
+        """Append rows to a generation's files, first dropping any tail left by an interrupted write"""
+        for template, data, row_bytes in ((CODES_FILE, codes, self._dim), (SCALES_FILE, scales, 4)):
+            path = self._path(template, generation)
+            with open(path, "ab") as f:
+                f.truncate(rows * row_bytes)
+                f.write(np.ascontiguousarray(data).tobytes())
+
+    def add(self, chunk_ids: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        """Index vectors, replacing any existing entries with the same IDs"""
+        if not chunk_ids:
+            return
+        vectors = normalize(embeddings)
+        with self._lock:
+            self._refresh()
+            if self._dim and vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vectors, got {vectors.shape[1]}")
+            self._dim = vectors.shape[1]
+
+            replaced = self._delete_locked(chunk_ids)
+            codes, scales = quantize(vectors)
+            start = self._rows
+            self._append(self._generation, start, codes, scales)
+            self._conn.executemany(
+                "INSERT INTO rows (row, chunk_id) VALUES (?, ?)",
+                [(start + i, chunk_id) for i, chunk_id in enumerate(chunk_ids)]
+            )
+            self._set_meta(rows=start + len(chunk_ids), dim=self._dim, version=self._version + 1)
+            self._conn.commit()
+
+            # Only the new rows and the replaced ones change, so the mask is patched rather than reread
+            self._version += 1
+            self._rows = start + len(chunk_ids)
+            self._remap()
+            alive = np.concatenate([self._alive, np.ones(len(chunk_ids), dtype=bool)])
+            alive[replaced] = False
+            self._alive = alive
+
+    def add_from(self, vectorstore, chunk_ids: Sequence[str]):
+        """Index chunks already stored in a vector store collection, reusing their embeddings"""
+        if not chunk_ids:
+            return
+        stored = vectorstore.get(ids=list(chunk_ids), include=["embeddings"])
+        self.add(stored["ids"], stored["embeddings"])
+
+    def _delete_locked(self, chunk_ids: Sequence[str]) -> np.ndarray:
+        """Drop chunks from the row table, returning the rows they occupied"""
+        rows = []
+        for start in range(0, len(chunk_ids), SQLITE_MAX_PARAMS):
+            batch = list(chunk_ids[start:start + SQLITE_MAX_PARAMS])
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(row for (row,) in self._conn.execute(
+                f"SELECT row FROM rows WHERE chunk_id IN ({placeholders})", batch
+            ))
+            self._conn.execute(f"DELETE FROM rows WHERE chunk_id IN ({placeholders})", batch)
+        return np.asarray(rows, dtype=np.int64)
+
+    def delete(self, chunk_ids: Sequence[str]):
+        """Remove chunks from the index, rewriting the files once enough rows are dead"""
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._refresh()
+            deleted = self._delete_locked(chunk_ids)
+            self._set_meta(version=self._version + 1)
+            self._conn.commit()
+            self._version += 1
+            # Copied rather than patched in place: searches scan the mask outside the lock
+            alive = self._alive.copy()
+            alive[deleted[deleted < self._rows]] = False
+            self._alive = alive
+            if self._rows and 1 - self._alive.sum() / self._rows > self.vacuum_ratio:
+                self.vacuum()
+
+    def vacuum(self):
+        """Copy live rows into a new generation of files and drop the old one
+
+        The new files are written first and switched to in the same
+        transaction that renumbers the rows, so an interruption leaves the
+        previous generation intact. Readers that still map the old files
+        keep working until they reload.
+        """
+        with self._lock:
+            self._refresh()
+            old_generation, generation = self._generation, self._generation + 1
+            live = np.flatnonzero(self._alive)
+            for template in (CODES_FILE, SCALES_FILE):
+                self._path(template, generation).unlink(missing_ok=True)
+            for start in range(0, len(live), self.block_rows):
+                rows = live[start:start + self.block_rows]
+                self._append(generation, start, self._codes[rows], self._scales[rows])
+
+            chunk_ids = [chunk_id for (chunk_id,) in self._conn.execute("SELECT chunk_id FROM rows ORDER BY row")]
+            self._conn.execute("DELETE FROM rows")
+            self._conn.executemany("INSERT INTO rows (row, chunk_id) VALUES (?, ?)", enumerate(chunk_ids))
+            self._set_meta(generation=generation, rows=len(chunk_ids), version=self._version + 1)
+            self._conn.commit()
+            self._load()
+
+            for template in (CODES_FILE, SCALES_FILE):
+                self._path(template, old_generation).unlink(missing_ok=True)
+            logger.info(f"Vacuumed compact index {self.directory.name} to {len(chunk_ids)} rows")
+
+    def clear(self):
+        with self._lock:
+            self._refresh()
+            self._conn.execute("DELETE FROM rows")
+            self._set_meta(rows=0, dim=0, version=self._version + 1)
+            self._conn.commit()
+            self._load()
+            self.vacuum()
+
+    def search(self, query_embedding: Sequence[float], k: int, vectorstore) -> List[Tuple[str, float]]:
+        """Top ``k`` chunk IDs by cosine similarity, best first, rescored against ``vectorstore``'s embeddings"""
+        return self.search_batch([query_embedding], k, vectorstore)[0]
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], k: int,
+                     vectorstore) -> List[List[Tuple[str, float]]]:
+        """Top ``k`` chunk IDs for each query, scoring all queries in one pass over the codes
+
+        The candidates of every query are rescored together, with one
+        embeddings lookup in the vector store holding the collection.
+        """
+        candidates = self.candidates_batch(query_embeddings, max(k, self.rescore_candidates))
+        wanted = list({chunk_id for query_candidates in candidates for chunk_id in query_candidates})
+        if not wanted:
+            return [[] for _ in query_embeddings]
+
+        stored = vectorstore.get(ids=wanted, include=["embeddings"])
+        if stored["ids"] is None or not len(stored["ids"]):
+            return [[] for _ in query_embeddings]
+        positions = {chunk_id: i for i, chunk_id in enumerate(stored["ids"])}
+        vectors = normalize(stored["embeddings"])
+        queries = normalize(query_embeddings)
+
+        results = []
+        for query, query_candidates in zip(queries, candidates):
+            found = [chunk_id for chunk_id in query_candidates if chunk_id in positions]
+            exact = vectors[[positions[chunk_id] for chunk_id in found]] @ query if found else []
+            results.append(heapq.nlargest(k, zip(found, np.asarray(exact).tolist()), key=lambda hit: hit[1]))
+        return results
+
+    def candidates_batch(self, query_embeddings: Sequence[Sequence[float]], n: int) -> List[List[str]]:
+        """Approximate top ``n`` chunk IDs for each query from the int8 codes alone, unordered"""
+        with self._lock:
+            self._refresh()
+            codes, scales, alive = self._codes, self._scales, self._alive
+        if codes is None or n <= 0 or not alive.any() or not len(query_embeddings):
+            return [[] for _ in query_embeddings]
+
+        queries = normalize(query_embeddings)
+
+        # Dequantized dot products, block by block, keeping each query's best candidates
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(codes), self.block_rows):
+            end = min(start + self.block_rows, len(codes))
+            scores = (queries @ codes[start:end].astype(np.float32).T) * scales[start:end]
+            scores[:, ~alive[start:end]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > n:
+                keep = np.argpartition(-best_scores, n - 1, axis=1)[:, :n]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        row_lists = [query_rows[np.isfinite(query_scores)].tolist()
+                     for query_rows, query_scores in zip(best_rows, best_scores)]
+        wanted = sorted({row for rows in row_lists for row in rows})
+        chunk_ids = {}
+        with self._lock:
+            for offset in range(0, len(wanted), SQLITE_MAX_PARAMS):
+                batch = wanted[offset:offset + SQLITE_MAX_PARAMS]
+                chunk_ids.update(self._conn.execute(
+                    f"SELECT row, chunk_id FROM rows WHERE row IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return [[chunk_ids[row] for row in rows if row in chunk_ids] for rows in row_lists]
+
+    def rebuild_from(self, vectorstore, batch_size: int = 1000) -> int:
+        """Index every chunk already stored in a vector store collection"""
+        self.clear()
+        indexed = 0
+        offset = 0
+        while True:
+            batch = vectorstore.get(include=["embeddings"], limit=batch_size, offset=offset)
+            ids = batch.get("ids") or []
+            if not ids:
+                break
+            self.add(ids, batch["embeddings"])
+            indexed += len(ids)
+            offset += len(ids)
+        logger.info(f"Rebuilt compact index {self.directory.name} with {indexed} chunks")
+        return indexed
+
+    def stats(self) -> dict:
+        """Row counts and the size of the scanned files"""
+        with self._lock:
+            self._refresh()
+            live = int(self._alive.sum())
+            return {
+                "rows": live,
+                "dead_rows": self._rows - live,
+                "dim": self._dim,
+                "scan_mb": round(self._rows * (self._dim + 4) / 1024 ** 2, 2),
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,54 +1,88 @@
-from typing import List
+from collections import defaultdict
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import heapq
 import logging
 
-from langchain.embeddings import OllamaEmbeddings
-from langchain.vectorstores import Chroma
 from langchain.schema import Document
 
 from config import (
-    CHROMA_COLLECTION_NAME, CHROMA_PERSIST_DIRECTORY,
-    EMBEDDING_MODEL, TOP_K_RETRIEVAL, OLLAMA_BASE_URL
+    TOP_K_RETRIEVAL, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, LEXICAL_INDEX_ENABLED, CHUNK_NEIGHBOUR_WINDOW,
+    CONTEXT_TOKEN_BUDGET
 )
 
+from src.ingestion.manifest import neighbour_chunk_id
+from src.observability import tracer
+from src.resources import resources
+from src.utils.tokens import estimate_tokens
+from .filters import RetrievalFilter, all_collection_names
+
 logger = logging.getLogger(__name__)
 
+# Extra candidates fetched when part of a filter can only be checked after the search
+POST_FILTER_OVERFETCH = 5
+
+
+def chunk_id_of(doc: Document) -> Optional[str]:
+    """Chunk ID of a retrieved document, if it was stored with one"""
+    return doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+
+
+def _is_filtered(filters: Optional[RetrievalFilter]) -> bool:
+    return filters is not None and not filters.is_empty
+
 
 class DocumentRetrieval:
-    """Handles document retrieval from vector database using semantic search"""
+    """Handles document retrieval from vector database using semantic and hybrid search"""
     
-    def __init__(self):
-        self.embeddings = OllamaEmbeddings(
-            model=EMBEDDING_MODEL,
-            base_url=OLLAMA_BASE_URL
-        )
-        self.vectorstore = None
-        self._initialize_vectorstore()
-        
-    def _initialize_vectorstore(self):
-        """Initialize connection to existing vector store"""
+    def __init__(self, mode: str = RETRIEVAL_MODE):
+        self.mode = mode
+        if mode == "hybrid" and not LEXICAL_INDEX_ENABLED:
+            logger.warning("Hybrid retrieval requires the lexical index, falling back to vector search")
+
+    # Clients come from the shared registry and are only created on first use
+
+    @property
+    def embedding_client(self):
+        return resources.embedding_client()
+
+    @property
+    def embeddings(self):
+        return resources.embeddings()
+
+    @property
+    def vectorstore(self):
         try:
-            self.vectorstore = Chroma(
-                collection_name=CHROMA_COLLECTION_NAME,
-                embedding_function=self.embeddings,
-                persist_directory=CHROMA_PERSIST_DIRECTORY
-            )
-            logger.info("Vector store initialized successfully")
+            return resources.vectorstore()
         except Exception as e:
             logger.error(f"Failed to initialize vector store: {e}")
             raise
+
+    @property
+    def lexical_index(self):
+        return resources.lexical_index() if self.mode == "hybrid" else None
     
-    def retrieve_documents(self, query: str, k: int = TOP_K_RETRIEVAL) -> List[Document]:
-        """Retrieve relevant documents for a query"""
+    def retrieve_documents(self, query: str, k: int = TOP_K_RETRIEVAL,
+                           filters: Optional[RetrievalFilter] = None) -> List[Document]:
+        """Retrieve relevant documents for a query, optionally restricted by ``filters``"""
         if not self.vectorstore:
             raise ValueError("Vector store not initialized")
         
         try:
-            # Perform similarity search
-            relevant_docs = self.vectorstore.similarity_search(
-                query, 
-                k=k
-            )
-            
+            with tracer.span("retrieval", mode=self.mode, k=k, filtered=_is_filtered(filters)) as span:
+                with tracer.span("retrieval.embed_query"):
+                    query_embedding = self.embeddings.embed_query(query)
+
+                if self.lexical_index is not None:
+                    relevant_docs = self._hybrid_search(query, query_embedding, k, filters)
+                else:
+                    # Perform similarity search
+                    with tracer.span("retrieval.vector_search", k=k) as search_span:
+                        relevant_docs = self._vector_search(query_embedding, k, filters)
+                        search_span.set(documents=len(relevant_docs))
+                span.set(documents=len(relevant_docs))
+
             logger.info(f"Retrieved {len(relevant_docs)} relevant documents")
             return relevant_docs
             
@@ -56,10 +90,381 @@ class DocumentRetrieval:
             logger.error(f"Error retrieving documents: {e}")
             return []
     
+    async def aretrieve_documents(self, query: str, k: int = TOP_K_RETRIEVAL,
+                                  filters: Optional[RetrievalFilter] = None) -> List[Document]:
+        """Retrieve relevant documents without blocking the event loop
+
+        The query is embedded with the async Ollama client. The vector
+        stores have no async API, so the vector search and the BM25 lookup
+        run concurrently in the default executor.
+        """
+        if not self.vectorstore:
+            raise ValueError("Vector store not initialized")
+
+        try:
+            with tracer.span("retrieval", mode=self.mode, k=k, filtered=_is_filtered(filters)) as span:
+                loop = asyncio.get_running_loop()
+                with tracer.span("retrieval.embed_query"):
+                    query_embedding = await self.embeddings.aembed_query(query)
+                candidates = max(k, HYBRID_CANDIDATES) if self.lexical_index is not None else k
+                # Vector and BM25 searches overlap, so they are timed together
+                with tracer.span("retrieval.search", candidates=candidates):
+                    vector_search = loop.run_in_executor(
+                        None, self._vector_search, query_embedding, candidates, filters
+                    )
+
+                    if self.lexical_index is not None:
+                        lexical_search = loop.run_in_executor(
+                            None, self._lexical_search, query, candidates, filters
+                        )
+                        vector_docs, (lexical_hits, lexical_docs) = await asyncio.gather(
+                            vector_search, lexical_search
+                        )
+                    else:
+                        relevant_docs = await vector_search
+
+                if self.lexical_index is not None:
+                    with tracer.span("retrieval.fuse"):
+                        relevant_docs = await loop.run_in_executor(
+                            None, partial(self._fuse, vector_docs, lexical_hits, k, filters, lexical_docs)
+                        )
+                span.set(documents=len(relevant_docs))
+
+            logger.info(f"Retrieved {len(relevant_docs)} relevant documents")
+            return relevant_docs
+
+        except Exception as e:
+            logger.error(f"Error retrieving documents: {e}")
+            return []
+
+    def retrieve_documents_batch(self, queries: List[str], k: int = TOP_K_RETRIEVAL,
+                                 filters: Optional[RetrievalFilter] = None,
+                                 query_embeddings: Optional[List[List[float]]] = None) -> List[List[Document]]:
+        """Retrieve documents for many queries at once, in input order
+
+        Queries are embedded together in batched requests (unless their
+        embeddings are passed in) and searched with one multi-query call per
+        collection. BM25 lookups and fusion stay per query, as they are
+        local SQLite reads.
+        """
+        if not queries:
+            return []
+        if not self.vectorstore:
+            raise ValueError("Vector store not initialized")
+
+        try:
+            with tracer.span("retrieval.batch", mode=self.mode, k=k, queries=len(queries),
+                             filtered=_is_filtered(filters)) as span:
+                if query_embeddings is None:
+                    with tracer.span("retrieval.embed_query", queries=len(queries)):
+                        query_embeddings = self.embeddings.embed_documents(list(queries))
+
+                candidates = max(k, HYBRID_CANDIDATES) if self.lexical_index is not None else k
+                with tracer.span("retrieval.vector_search", k=candidates, queries=len(queries)):
+                    vector_results = self._vector_search_batch(query_embeddings, candidates, filters)
+
+                if self.lexical_index is None:
+                    results = [docs[:k] for docs in vector_results]
+                else:
+                    results = []
+                    with tracer.span("retrieval.lexical_search", k=candidates, queries=len(queries)):
+                        lexical_results = [self._lexical_search(query, candidates, filters) for query in queries]
+                    with tracer.span("retrieval.fuse", queries=len(queries)):
+                        for vector_docs, (lexical_hits, lexical_docs) in zip(vector_results, lexical_results):
+                            results.append(self._fuse(vector_docs, lexical_hits, k, filters, lexical_docs))
+                span.set(documents=sum(len(docs) for docs in results))
+
+            logger.info(f"Retrieved documents for {len(queries)} queries")
+            return results
+
+        except Exception as e:
+            logger.error(f"Error retrieving documents for batch: {e}")
+            return [[] for _ in queries]
+
+    def _stores(self, filters: Optional[RetrievalFilter]) -> List:
+        """Vector stores of the collections that can hold matching chunks"""
+        names = filters.collection_names() if filters is not None else all_collection_names()
+        return [resources.vectorstore(name) for name in names]
+
+    def _vector_search(self, query_embedding: List[float], k: int,
+                       filters: Optional[RetrievalFilter] = None) -> List[Document]:
+        """Nearest chunks, with the filter pushed down into the vector store's ``where`` clause"""
+        return self._vector_search_batch([query_embedding], k, filters)[0]
+
+    def _vector_search_batch(self, query_embeddings: List[List[float]], k: int,
+                             filters: Optional[RetrievalFilter] = None) -> List[List[Document]]:
+        """Nearest chunks for each query, with one search call per collection"""
+        where = filters.to_where() if filters is not None else None
+        post_filter = filters is not None and filters.needs_post_filter
+        if where is None and not post_filter:
+            compact_indexes = self._compact_indexes(filters)
+            if compact_indexes:
+                return self._compact_search_batch(compact_indexes, query_embeddings, k, filters)
+
+        fetch_k = k * POST_FILTER_OVERFETCH if post_filter else k
+        scored: List[List[Tuple[Document, float]]] = [[] for _ in query_embeddings]
+        for store in self._stores(filters):
+            for pairs, found in zip(scored, store.search(query_embeddings, fetch_k, where)):
+                pairs.extend(found)
+
+        results = []
+        for pairs in scored:
+            # Distances, so the closest chunks across collections come first
+            pairs.sort(key=lambda pair: pair[1])
+            docs = [doc for doc, _ in pairs]
+            if post_filter:
+                docs = [doc for doc in docs if filters.matches(doc.metadata)]
+            results.append(docs[:k])
+        return results
+
+    def _compact_search_batch(self, compact_indexes: List, query_embeddings: List[List[float]], k: int,
+                              filters: Optional[RetrievalFilter] = None) -> List[List[Document]]:
+        """Nearest chunks from the int8 indexes; texts and metadata are then read from the vector store by ID
+
+        The compact indexes hold no metadata, so only unfiltered searches
+        (or a dedicated namespace, which is its own collection) use them.
+        Each index rescores its candidates against its collection's stored
+        embeddings, and every hit's text is then fetched in one lookup.
+        """
+        hits: List[List[Tuple[str, float]]] = [[] for _ in query_embeddings]
+        for index, store in compact_indexes:
+            for query_hits, index_hits in zip(hits, index.search_batch(query_embeddings, k, store)):
+                query_hits.extend(index_hits)
+        hits = [heapq.nlargest(k, query_hits, key=lambda hit: hit[1]) for query_hits in hits]
+        docs = self._get_by_ids(list({chunk_id for query_hits in hits for chunk_id, _ in query_hits}), filters)
+        return [[docs[chunk_id] for chunk_id, _ in query_hits if chunk_id in docs] for query_hits in hits]
+
+    def _compact_indexes(self, filters: Optional[RetrievalFilter]) -> List[Tuple[Any, Any]]:
+        """(index, vector store) per searched collection, or an empty list if any index is disabled or not built"""
+        names = filters.collection_names() if filters is not None else all_collection_names()
+        indexes = [resources.compact_index(name) for name in names]
+        if any(index is None for index in indexes) or not any(len(index) for index in indexes):
+            return []
+        return [(index, resources.vectorstore(name)) for index, name in zip(indexes, names)]
+
+    def _get_by_ids(self, chunk_ids: List[str], filters: Optional[RetrievalFilter] = None) -> Dict[str, Document]:
+        """Fetch chunks by ID from whichever collection holds them, keeping only those matching ``filters``"""
+        where = filters.to_where() if filters is not None else None
+        found: Dict[str, Document] = {}
+        for store in self._stores(filters):
+            remaining = [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+            if not remaining:
+                break
+            fetched = store.get(ids=remaining, where=where, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                metadata = metadata or {}
+                if filters is None or filters.matches(metadata):
+                    found[chunk_id] = Document(page_content=text, metadata=metadata)
+        return found
+
+    def stored_embeddings(self, docs: List[Document]) -> List[Optional[List[float]]]:
+        """Embeddings stored at ingest for retrieved chunks, None for chunks without a stored one"""
+        chunk_ids = [chunk_id_of(doc) for doc in docs]
+        found: Dict[str, List[float]] = {}
+        for store in self._stores(None):
+            remaining = list({chunk_id for chunk_id in chunk_ids if chunk_id and chunk_id not in found})
+            if not remaining:
+                break
+            fetched = store.get(ids=remaining, include=["embeddings"])
+            for chunk_id, embedding in zip(fetched["ids"], fetched.get("embeddings") or []):
+                found[chunk_id] = embedding
+        return [found.get(chunk_id) if chunk_id else None for chunk_id in chunk_ids]
+
+    def _lexical_search(self, query: str, k: int, filters: Optional[RetrievalFilter] = None
+                        ) -> Tuple[List[Tuple[str, float]], Optional[Dict[str, Document]]]:
+        """Top BM25 hits, plus the matching chunks themselves when a filter had to be checked
+
+        The lexical index holds no metadata, so with a filter more hits are
+        taken and checked against the collection in one lookup.
+        """
+        if not _is_filtered(filters):
+            return self.lexical_index.search(query, k), None
+
+        hits = self.lexical_index.search(query, k * POST_FILTER_OVERFETCH)
+        docs = self._get_by_ids([chunk_id for chunk_id, _ in hits], filters)
+        return [hit for hit in hits if hit[0] in docs][:k], docs
+
+    def _hybrid_search(self, query: str, query_embedding: List[float], k: int,
+                       filters: Optional[RetrievalFilter] = None) -> List[Document]:
+        """Fuse BM25 and vector rankings with reciprocal rank fusion"""
+        candidates = max(k, HYBRID_CANDIDATES)
+        with tracer.span("retrieval.vector_search", k=candidates):
+            vector_docs = self._vector_search(query_embedding, candidates, filters)
+        with tracer.span("retrieval.lexical_search", k=candidates) as span:
+            lexical_hits, lexical_docs = self._lexical_search(query, candidates, filters)
+            span.set(hits=len(lexical_hits))
+        with tracer.span("retrieval.fuse"):
+            return self._fuse(vector_docs, lexical_hits, k, filters, lexical_docs)
+
+    def _fuse(self, vector_docs: List[Document], lexical_hits: List[Tuple[str, float]], k: int,
+              filters: Optional[RetrievalFilter] = None,
+              lexical_docs: Optional[Dict[str, Document]] = None) -> List[Document]:
+        """Combine ranked lists by summing 1 / (RRF_K + rank) per chunk"""
+        docs_by_id: Dict[str, Document] = {}
+        scores: Dict[str, float] = defaultdict(float)
+
+        for rank, doc in enumerate(vector_docs, start=1):
+            # Chunks stored without an ID cannot be matched across rankers but still count
+            chunk_id = chunk_id_of(doc) or f"__vector_{rank}"
+            docs_by_id.setdefault(chunk_id, doc)
+            scores[chunk_id] += 1.0 / (RRF_K + rank)
+
+        for rank, (chunk_id, _) in enumerate(lexical_hits, start=1):
+            scores[chunk_id] += 1.0 / (RRF_K + rank)
+
+        top_ids = heapq.nlargest(k, scores, key=scores.get)
+
+        # Chunks found only by BM25 are fetched from the collection by ID
+        for chunk_id, doc in (lexical_docs or {}).items():
+            docs_by_id.setdefault(chunk_id, doc)
+        missing = [chunk_id for chunk_id in top_ids if chunk_id not in docs_by_id]
+        if missing:
+            docs_by_id.update(self._get_by_ids(missing, filters))
+
+        return [docs_by_id[chunk_id] for chunk_id in top_ids if chunk_id in docs_by_id]
+
+    @staticmethod
+    def merge_results(result_lists: List[List[Document]], k: int) -> List[Document]:
+        """Combine result lists of related queries with reciprocal rank fusion, earlier lists winning ties"""
+        docs_by_id: Dict[str, Document] = {}
+        scores: Dict[str, float] = defaultdict(float)
+        for list_index, docs in enumerate(result_lists):
+            for rank, doc in enumerate(docs, start=1):
+                chunk_id = chunk_id_of(doc) or f"__list{list_index}_{rank}"
+                docs_by_id.setdefault(chunk_id, doc)
+                scores[chunk_id] += 1.0 / (RRF_K + rank)
+        top_ids = heapq.nlargest(k, scores, key=scores.get)
+        return [docs_by_id[chunk_id] for chunk_id in top_ids]
+
+    def expand_neighbours(self, docs: List[Document], window: int = CHUNK_NEIGHBOUR_WINDOW,
+                          token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[Document]:
+        """Stitch each chunk together with up to ``window`` adjacent chunks from the same page
+
+        Neighbours are fetched by their deterministic IDs in one lookup and
+        joined with blank lines, so context around a hit is recovered at
+        query time rather than duplicated as overlap at ingest. Where
+        chunks were cut with overlap, their stored character offsets show
+        how much of a chunk repeats the end of the one before it, and that
+        part is dropped when they are joined. Hits already covered by an
+        earlier hit's expansion are dropped. Chunks without IDs or offsets
+        are returned unchanged.
+
+        Neighbours only use the part of ``token_budget`` the hits leave
+        free: every hit that fits is reserved first, then neighbours are
+        added nearest first, most relevant hit first, while they fit. A
+        neighbour costs only the text it adds beyond the overlap.
+        """
+        if window <= 0 or not docs:
+            return docs
+
+        wanted = []
+        for doc in docs:
+            chunk_id = chunk_id_of(doc)
+            if chunk_id is None or "start_index" not in doc.metadata:
+                continue
+            for offset in range(-window, window + 1):
+                neighbour_id = neighbour_chunk_id(chunk_id, offset) if offset else None
+                if neighbour_id is not None:
+                    wanted.append(neighbour_id)
+
+        with tracer.span("retrieval.expand_neighbours", documents=len(docs)) as span:
+            try:
+                neighbours = self._get_by_ids(list(dict.fromkeys(wanted))) if wanted else {}
+            except Exception as e:
+                logger.error(f"Error fetching neighbouring chunks: {e}")
+                return docs
+
+            # Hits are reserved first, in the order the context builder packs them
+            reserved = set()
+            remaining = token_budget
+            for doc in docs:
+                tokens = self._joined_tokens(doc.page_content)
+                if tokens <= remaining:
+                    remaining -= tokens
+                    reserved.add(chunk_id_of(doc))
+
+            expanded = []
+            covered = set()
+            added = 0
+            for doc in docs:
+                chunk_id = chunk_id_of(doc)
+                if chunk_id in covered:
+                    continue
+                if chunk_id is None or "start_index" not in doc.metadata:
+                    expanded.append(doc)
+                    continue
+
+                run = [doc]
+                blocked = set()
+                for distance in range(1, window + 1):
+                    for step in (-1, 1):
+                        if step in blocked:
+                            continue
+                        neighbour = neighbours.get(neighbour_chunk_id(chunk_id, step * distance) or "")
+                        if neighbour is None or neighbour.metadata.get("page") != doc.metadata.get("page") \
+                                or chunk_id_of(neighbour) in covered:
+                            blocked.add(step)
+                            continue
+                        # A neighbour that is itself a reserved hit is already paid for
+                        if chunk_id_of(neighbour) in reserved:
+                            tokens = 0
+                        elif step < 0:
+                            overlap = self._overlap(neighbour, run[0])
+                            text = neighbour.page_content[:len(neighbour.page_content) - overlap]
+                            tokens = self._joined_tokens(text, separated=not overlap)
+                        else:
+                            overlap = self._overlap(run[-1], neighbour)
+                            tokens = self._joined_tokens(neighbour.page_content[overlap:], separated=not overlap)
+                        if tokens > remaining:
+                            blocked.add(step)
+                            continue
+                        remaining -= tokens
+                        added += 1
+                        if step < 0:
+                            run.insert(0, neighbour)
+                        else:
+                            run.append(neighbour)
+
+                covered.update(chunk_id_of(part) for part in run)
+                if len(run) == 1:
+                    expanded.append(doc)
+                    continue
+                metadata = dict(doc.metadata)
+                metadata["start_index"] = run[0].metadata.get("start_index", doc.metadata["start_index"])
+                metadata["end_index"] = run[-1].metadata.get("end_index", doc.metadata.get("end_index"))
+                metadata["expanded_chunks"] = len(run)
+                expanded.append(Document(page_content=self._join(run), metadata=metadata))
+            span.set(chunks=sum(doc.metadata.get("expanded_chunks", 1) for doc in expanded), neighbours=added)
+        return expanded
+
+    @staticmethod
+    def _overlap(previous: Document, doc: Document) -> int:
+        """Characters at the start of ``doc`` that repeat the end of the chunk before it on the page"""
+        start, end = doc.metadata.get("start_index"), previous.metadata.get("end_index")
+        if start is None or end is None:
+            return 0
+        return max(0, min(end - start, len(doc.page_content)))
+
+    @classmethod
+    def _join(cls, run: List[Document]) -> str:
+        """Text of consecutive chunks, with each chunk's overlap with the one before it dropped"""
+        text = run[0].page_content
+        for previous, doc in zip(run, run[1:]):
+            overlap = cls._overlap(previous, doc)
+            text += doc.page_content[overlap:] if overlap else "\n\n" + doc.page_content
+        return text
+
+    @staticmethod
+    def _joined_tokens(text: str, separated: bool = True) -> int:
+        """Tokens text adds to the context, including the blank line it is joined with when ``separated``"""
+        return estimate_tokens(text) + (estimate_tokens("\n\n") if separated else 0)
+
     def get_retriever(self):
         """Get retriever interface for the vector store"""
         if not self.vectorstore:
             raise ValueError("Vector store not initialized")
+        if not hasattr(self.vectorstore, "as_retriever"):
+            raise ValueError(f"{type(self.vectorstore).__name__} has no LangChain retriever, use retrieve_documents")
         
         return self.vectorstore.as_retriever(
             search_kwargs={"k": TOP_K_RETRIEVAL}
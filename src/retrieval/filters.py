@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+from typing import Any, Dict, List, Optional
+
+from config import (
+    CHROMA_COLLECTION_NAME, METADATA_DIR_DEPTH, NAMESPACE_FROM_FOLDER, DEFAULT_NAMESPACE, DEDICATED_NAMESPACES
+)
+
+
+def collection_name(namespace: Optional[str]) -> str:
+    """Collection holding a namespace's chunks: its own if dedicated, otherwise the shared one"""
+    if namespace in DEDICATED_NAMESPACES:
+        return f"{CHROMA_COLLECTION_NAME}__{namespace}"
+    return CHROMA_COLLECTION_NAME
+
+
+def all_collection_names() -> List[str]:
+    return [CHROMA_COLLECTION_NAME] + [collection_name(namespace) for namespace in DEDICATED_NAMESPACES]
+
+
+# Bump when file_metadata changes so files are re-ingested with the new fields
+METADATA_SCHEMA_VERSION = 1
+
+
+def metadata_settings() -> Dict[str, Any]:
+    """Settings that decide the metadata and collection of each chunk, part of the ingestion fingerprint"""
+    return {
+        "version": METADATA_SCHEMA_VERSION,
+        "dir_depth": METADATA_DIR_DEPTH,
+        "namespace_from_folder": NAMESPACE_FROM_FOLDER,
+        "default_namespace": DEFAULT_NAMESPACE,
+        "dedicated_namespaces": sorted(DEDICATED_NAMESPACES),
+    }
+
+
+def _dir_key(depth: int) -> str:
+    return f"dir_{depth}"
+
+
+def file_metadata(rel_path: str, ingested_at: int) -> Dict[str, Any]:
+    """Filterable metadata attached to every chunk of a file at ingest time
+
+    Chroma can only compare metadata values for equality or order, so the
+    folder path is stored as cumulative prefixes ``dir_1`` ("hr"), ``dir_2``
+    ("hr/policies") and so on, turning a path prefix filter into a single
+    equality clause.
+    """
+    path = PurePosixPath(rel_path)
+    folders = path.parts[:-1]
+    metadata: Dict[str, Any] = {
+        "rel_path": path.as_posix(),
+        "file_type": path.suffix.lower().lstrip("."),
+        "ingested_at": int(ingested_at),
+        "namespace": folders[0] if NAMESPACE_FROM_FOLDER and folders else DEFAULT_NAMESPACE,
+    }
+    for depth in range(1, min(len(folders), METADATA_DIR_DEPTH) + 1):
+        metadata[_dir_key(depth)] = "/".join(folders[:depth])
+    return metadata
+
+
+@dataclass
+class RetrievalFilter:
+    """Restricts retrieval to part of the corpus
+
+    Every set field must match. ``where`` is an extra raw clause in Chroma's
+    filter syntax, which every vector store backend accepts, for anything
+    not covered by the named fields (e.g. ``{"page": 3}``).
+    """
+    namespace: Optional[str] = None
+    path_prefix: Optional[str] = None
+    file_types: List[str] = field(default_factory=list)
+    ingested_after: Optional[int] = None
+    ingested_before: Optional[int] = None
+    where: Optional[Dict[str, Any]] = None
+
+    def __post_init__(self):
+        if self.path_prefix is not None:
+            self.path_prefix = self.path_prefix.strip("/") or None
+        self.file_types = [file_type.lower().lstrip(".") for file_type in self.file_types]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RetrievalFilter":
+        """Build a filter from request JSON, raising ValueError on unknown or malformed fields"""
+        if not isinstance(data, dict):
+            raise ValueError("filters must be a JSON object")
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+
+        file_types = data.get("file_types") or []
+        if isinstance(file_types, str):
+            file_types = [file_types]
+        if not all(isinstance(file_type, str) for file_type in file_types):
+            raise ValueError("file_types must be a list of strings")
+        for key in ("namespace", "path_prefix"):
+            if data.get(key) is not None and not isinstance(data[key], str):
+                raise ValueError(f"{key} must be a string")
+        for key in ("ingested_after", "ingested_before"):
+            if data.get(key) is not None and not isinstance(data[key], (int, float)):
+                raise ValueError(f"{key} must be a Unix timestamp")
+        if data.get("where") is not None and not isinstance(data["where"], dict):
+            raise ValueError("where must be a JSON object")
+
+        return cls(
+            namespace=data.get("namespace"),
+            path_prefix=data.get("path_prefix"),
+            file_types=list(file_types),
+            ingested_after=data.get("ingested_after"),
+            ingested_before=data.get("ingested_before"),
+            where=data.get("where"),
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return self.namespace is None and self.to_where() is None and not self.needs_post_filter
+
+    @property
+    def _prefix_parts(self) -> List[str]:
+        return self.path_prefix.split("/") if self.path_prefix else []
+
+    def to_where(self) -> Optional[Dict[str, Any]]:
+        """``where`` clause (Chroma's syntax) for the filter, or None when it matches everything"""
+        clauses: List[Dict[str, Any]] = []
+        # Namespaces with their own collection are selected by collection instead
+        if self.namespace is not None and self.namespace not in DEDICATED_NAMESPACES:
+            clauses.append({"namespace": self.namespace})
+        if self.path_prefix:
+            # Prefixes deeper than the stored levels are narrowed further by matches()
+            depth = min(len(self._prefix_parts), METADATA_DIR_DEPTH)
+            clauses.append({_dir_key(depth): "/".join(self._prefix_parts[:depth])})
+        if self.file_types:
+            clauses.append({"file_type": {"$in": self.file_types}})
+        if self.ingested_after is not None:
+            clauses.append({"ingested_at": {"$gte": int(self.ingested_after)}})
+        if self.ingested_before is not None:
+            clauses.append({"ingested_at": {"$lt": int(self.ingested_before)}})
+        if self.where:
+            clauses.append(self.where)
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    @property
+    def needs_post_filter(self) -> bool:
+        return len(self._prefix_parts) > METADATA_DIR_DEPTH
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """Check the part of the filter a ``where`` clause cannot express (deep path prefixes)"""
+        if not self.needs_post_filter:
+            return True
+        rel_path = str(metadata.get("rel_path", ""))
+        return rel_path.startswith(self.path_prefix + "/")
+
+    def collection_names(self) -> List[str]:
+        """Collections that can hold matching chunks"""
+        if self.namespace is not None:
+            return [collection_name(self.namespace)]
+        return all_collection_names()
@@ -0,0 +1,223 @@
+import heapq
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B, LEXICAL_MAX_DF_RATIO, LEXICAL_MAX_POSTINGS
+
+logger = logging.getLogger(__name__)
+
+# Words joined by - _ . / are kept whole so identifiers like "PN-4471" or
+# "12.3.1" match exactly; their parts are indexed too
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 900
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word and identifier tokens of a text"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """Incremental BM25 inverted index stored in SQLite
+
+    Postings live in a ``WITHOUT ROWID`` table clustered by term and refer to
+    chunks by integer ID. Document frequencies and collection statistics are
+    maintained on write. Each posting also stores its impact, the BM25 term
+    weight computed with the average chunk length at write time, and a query
+    scores at most ``max_postings`` postings per term in impact order, so its
+    cost grows with the number of query terms rather than with the corpus.
+    Chunks beyond that cap lose the term's contribution, which only matters
+    for terms frequent enough to carry little weight. Terms found in more
+    than ``max_df_ratio`` of all chunks are skipped entirely.
+    """
+
+    def __init__(self, path: Path = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B,
+                 max_df_ratio: float = LEXICAL_MAX_DF_RATIO, max_postings: int = LEXICAL_MAX_POSTINGS):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.max_postings = max(1, max_postings)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                length INTEGER NOT NULL,
+                terms TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                impact REAL NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_by_impact ON postings (term, impact DESC);
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                num_docs INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats (id, num_docs, total_length) VALUES (0, 0, 0);
+        """)
+        conn.commit()
+        return conn
+
+    def _impact(self, tf: int, length: int, avg_length: float) -> float:
+        """BM25 weight of a term in a chunk, without the term's idf"""
+        return tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT num_docs FROM stats").fetchone()[0]
+
+    def _delete_locked(self, chunk_ids: Sequence[str]):
+        for chunk_id in chunk_ids:
+            row = self._conn.execute(
+                "SELECT doc_id, length, terms FROM docs WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            if row is None:
+                continue
+            doc_id, length, terms = row[0], row[1], row[2].split(" ") if row[2] else []
+            self._conn.executemany(
+                "DELETE FROM postings WHERE term = ? AND doc_id = ?",
+                [(term, doc_id) for term in terms]
+            )
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(term,) for term in terms])
+            self._conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+            self._conn.execute(
+                "UPDATE stats SET num_docs = num_docs - 1, total_length = total_length - ?", (length,)
+            )
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    def add(self, chunk_ids: Sequence[str], texts: Sequence[str]):
+        """Index chunks, replacing any existing entries with the same IDs"""
+        with self._lock:
+            self._delete_locked(chunk_ids)
+            num_docs, total_length = self._conn.execute("SELECT num_docs, total_length FROM stats").fetchone()
+            token_counts = [Counter(tokenize(text)) for text in texts]
+            lengths = [sum(counts.values()) for counts in token_counts]
+            added_length = sum(lengths)
+            # Impacts only order postings, so the average length after this batch is close enough
+            avg_length = max(1.0, (total_length + added_length) / max(1, num_docs + len(token_counts)))
+
+            postings = []
+            term_counts = Counter()
+            for chunk_id, counts, length in zip(chunk_ids, token_counts, lengths):
+                doc_id = self._conn.execute(
+                    "INSERT INTO docs (chunk_id, length, terms) VALUES (?, ?, ?)",
+                    (chunk_id, length, " ".join(counts))
+                ).lastrowid
+                postings.extend(
+                    (term, doc_id, tf, self._impact(tf, length, avg_length)) for term, tf in counts.items()
+                )
+                term_counts.update(counts.keys())
+
+            # Sorted inserts append to the clustered index instead of splitting pages
+            postings.sort()
+            self._conn.executemany("INSERT INTO postings (term, doc_id, tf, impact) VALUES (?, ?, ?, ?)", postings)
+            self._conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                sorted(term_counts.items())
+            )
+            self._conn.execute(
+                "UPDATE stats SET num_docs = num_docs + ?, total_length = total_length + ?",
+                (len(chunk_ids), added_length)
+            )
+            self._conn.commit()
+
+    def delete(self, chunk_ids: Sequence[str]):
+        """Remove chunks from the index"""
+        with self._lock:
+            self._delete_locked(chunk_ids)
+            self._conn.commit()
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return the top ``k`` chunk IDs by BM25 score, scoring at most ``max_postings`` chunks per term"""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            num_docs, total_length = self._conn.execute(
+                "SELECT num_docs, total_length FROM stats"
+            ).fetchone()
+            if not num_docs:
+                return []
+            avg_length = total_length / num_docs
+            max_df = max(1, int(num_docs * self.max_df_ratio))
+
+            placeholders = ",".join("?" * len(query_terms[:SQLITE_MAX_PARAMS]))
+            dfs = dict(self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({placeholders})",
+                query_terms[:SQLITE_MAX_PARAMS]
+            ).fetchall())
+
+            scores = Counter()
+            for term, df in dfs.items():
+                if df > max_df:
+                    continue
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf, length in self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p INDEXED BY postings_by_impact "
+                    "JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ? ORDER BY p.impact DESC LIMIT ?",
+                    (term, self.max_postings)
+                ):
+                    scores[doc_id] += idf * self._impact(tf, length, avg_length)
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            if not top:
+                return []
+            placeholders = ",".join("?" * len(top))
+            chunk_ids = dict(self._conn.execute(
+                f"SELECT doc_id, chunk_id FROM docs WHERE doc_id IN ({placeholders})",
+                [doc_id for doc_id, _ in top]
+            ).fetchall())
+
+        return [(chunk_ids[doc_id], score) for doc_id, score in top if doc_id in chunk_ids]
+
+    def rebuild_from(self, vectorstore, batch_size: int = 1000) -> int:
+        """Index every chunk already stored in a vector store collection"""
+        indexed = 0
+        offset = 0
+        while True:
+            batch = vectorstore.get(include=["documents"], limit=batch_size, offset=offset)
+            ids = batch.get("ids") or []
+            if not ids:
+                break
+            self.add(ids, [text or "" for text in batch["documents"]])
+            indexed += len(ids)
+            offset += len(ids)
+        logger.info(f"Rebuilt lexical index with {indexed} chunks")
+        return indexed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,191 @@
+import json
+import logging
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from config import (
+    RERANKER, RERANK_TOP_N, MMR_LAMBDA, CROSS_ENCODER_MODEL, RERANK_LLM_MODEL,
+    RERANK_BATCH_SIZE
+)
+from src.resources import resources
+from src.utils.vectors import normalize
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """Scores candidate documents against a query; higher is more relevant"""
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        raise NotImplementedError
+
+
+class CrossEncoderReranker(Reranker):
+    """Local CPU cross-encoder scoring (query, passage) pairs in batches
+
+    Requires the optional ``sentence-transformers`` package.
+    """
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL, batch_size: int = RERANK_BATCH_SIZE):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "The cross-encoder reranker requires sentence-transformers: pip install sentence-transformers"
+            ) from e
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        pairs = [(query, doc.page_content) for doc in docs]
+        return [float(s) for s in self.model.predict(pairs, batch_size=self.batch_size)]
+
+
+class LLMReranker(Reranker):
+    """Scores passages with the Ollama LLM, several passages per prompt
+
+    Each prompt takes a slot from the generation scheduler, so reranking
+    shares the endpoints and queue of the query it serves.
+    """
+
+    PROMPT = (
+        "Rate how relevant each passage is to the question on a scale from 0 (irrelevant) "
+        "to 10 (directly answers it).\n\nQuestion: {question}\n\n{passages}\n\n"
+        'Reply with JSON only, in the form {{"scores": [<score for passage 1>, <score for passage 2>, ...]}}.'
+    )
+
+    def __init__(self, model: str = RERANK_LLM_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 max_passage_chars: int = 600):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_passage_chars = max_passage_chars
+
+    def _score_batch(self, query: str, docs: List[Document]) -> List[float]:
+        passages = "\n\n".join(
+            f"Passage {i}:\n{doc.page_content[:self.max_passage_chars]}"
+            for i, doc in enumerate(docs, start=1)
+        )
+        with resources.generation_scheduler().acquire() as lease:
+            llm = resources.llm(lease.endpoint)
+            # Options replace the model's defaults; keep its context size so Ollama does not reload the model
+            reply = llm.invoke(
+                self.PROMPT.format(question=query, passages=passages), model=self.model, format="json",
+                options={"num_ctx": getattr(llm, "num_ctx", None), "temperature": 0}
+            ).content
+        try:
+            scores = [float(s) for s in json.loads(reply)["scores"]]
+        except (ValueError, KeyError, TypeError):
+            scores = [float(s) for s in re.findall(r"\d+(?:\.\d+)?", reply)]
+
+        if len(scores) != len(docs):
+            logger.warning(f"LLM reranker returned {len(scores)} scores for {len(docs)} passages")
+            # Pad or trim so every passage has a score; unscored passages rank last
+            scores = (scores + [0.0] * len(docs))[:len(docs)]
+        return scores
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        scores = []
+        for start in range(0, len(docs), self.batch_size):
+            scores.extend(self._score_batch(query, docs[start:start + self.batch_size]))
+        return scores
+
+
+def mmr_select(doc_embeddings: List[List[float]], relevance: np.ndarray, top_n: int,
+               mmr_lambda: float) -> List[int]:
+    """Maximal marginal relevance: trade relevance off against similarity to already selected documents"""
+    docs = normalize(doc_embeddings)
+    similarity = docs @ docs.T
+
+    selected: List[int] = []
+    candidates = list(range(len(docs)))
+    while candidates and len(selected) < top_n:
+        if selected:
+            redundancy = similarity[np.ix_(candidates, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates))
+        mmr = mmr_lambda * relevance[candidates] - (1 - mmr_lambda) * redundancy
+        best = candidates[int(np.argmax(mmr))]
+        selected.append(best)
+        candidates.remove(best)
+    return selected
+
+
+class RerankStage:
+    """Narrows over-fetched candidates to the best few
+
+    Candidates are scored by the reranker (or by embedding similarity to the
+    query when there is none), then MMR picks ``top_n`` of them, trading
+    relevance against redundancy with ``mmr_lambda``. Candidate embeddings
+    come from ``stored_embeddings`` when given, so only the query and any
+    chunk without a stored vector are embedded.
+    """
+
+    def __init__(self, embeddings, reranker: Optional[Reranker] = None, top_n: int = RERANK_TOP_N,
+                 mmr_lambda: float = MMR_LAMBDA,
+                 stored_embeddings: Optional[Callable[[List[Document]], List[Optional[List[float]]]]] = None):
+        self.embeddings = embeddings
+        self.reranker = reranker
+        self.stored_embeddings = stored_embeddings
+        self.top_n = top_n
+        self.mmr_lambda = mmr_lambda
+
+    def _doc_embeddings(self, docs: List[Document]) -> List[List[float]]:
+        """Candidate embeddings, read back from the vector store where possible"""
+        if self.stored_embeddings is None:
+            stored: List[Optional[List[float]]] = [None] * len(docs)
+        else:
+            try:
+                stored = self.stored_embeddings(docs)
+            except Exception as e:
+                logger.warning(f"Could not read stored embeddings, embedding candidates: {e}")
+                stored = [None] * len(docs)
+
+        missing = [i for i, embedding in enumerate(stored) if embedding is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([docs[i].page_content for i in missing])
+            for i, embedding in zip(missing, embedded):
+                stored[i] = embedding
+        return stored
+
+    def rerank(self, query: str, docs: List[Document], top_n: Optional[int] = None,
+               timings: Optional[Dict[str, float]] = None) -> List[Document]:
+        """Return the ``top_n`` best candidates, recording per-step timings into ``timings`` if given"""
+        top_n = top_n or self.top_n
+        if len(docs) <= 1:
+            return docs
+
+        start = time.perf_counter()
+        query_embedding = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        doc_embeddings = self._doc_embeddings(docs)
+        embed_done = time.perf_counter()
+
+        if self.reranker is not None:
+            relevance = np.asarray(self.reranker.score(query, docs), dtype=np.float32)
+            spread = relevance.max() - relevance.min()
+            relevance = (relevance - relevance.min()) / spread if spread else np.ones_like(relevance)
+        else:
+            relevance = normalize(doc_embeddings) @ normalize(query_embedding)
+        score_done = time.perf_counter()
+
+        order = mmr_select(doc_embeddings, relevance, top_n, self.mmr_lambda)
+        end = time.perf_counter()
+
+        if timings is not None:
+            timings["rerank_embed_ms"] = round((embed_done - start) * 1000, 2)
+            timings["rerank_score_ms"] = round((score_done - embed_done) * 1000, 2)
+            timings["rerank_mmr_ms"] = round((end - score_done) * 1000, 2)
+        logger.info(f"Reranked {len(docs)} candidates down to {len(order)} in {(end - start) * 1000:.1f} ms")
+        return [docs[i] for i in order]
+
+
+def create_reranker(kind: str = RERANKER) -> Optional[Reranker]:
+    """Build the configured reranker: "cross-encoder", "llm", or None to score by embedding similarity"""
+    if kind == "cross-encoder":
+        return CrossEncoderReranker()
+    if kind == "llm":
+        return LLMReranker()
+    return None
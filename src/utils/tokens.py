@@ -0,0 +1,8 @@
+import math
+
+from config import CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate based on character count"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
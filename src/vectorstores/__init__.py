@@ -0,0 +1,14 @@
+from .base import VectorStore
+
+__all__ = ['VectorStore', 'ChromaVectorStore', 'NumpyVectorStore']
+
+
+def __getattr__(name):
+    # Backends import chromadb or NumPy, so they are only loaded once selected
+    if name == 'ChromaVectorStore':
+        from .chroma import ChromaVectorStore
+        return ChromaVectorStore
+    if name == 'NumpyVectorStore':
+        from .numpy_store import NumpyVectorStore
+        return NumpyVectorStore
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
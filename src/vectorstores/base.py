@@ -0,0 +1,54 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+# Result of a search: each query's chunks with their distance, closest first
+SearchResults = List[List[Tuple[Document, float]]]
+
+
+class VectorStore:
+    """A collection of embedded chunks addressed by chunk ID
+
+    ``where`` clauses use Chroma's metadata filter syntax (as produced by
+    ``RetrievalFilter.to_where``) on every backend. Distances are
+    backend-specific, but lower is always closer, so results from several
+    collections of one backend can be merged by distance.
+    """
+
+    name: str
+
+    def add_documents(self, documents: List[Document], ids: Sequence[str]):
+        """Embed and store chunks, replacing any stored under the same IDs"""
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]):
+        """Remove chunks by ID; unknown IDs are ignored"""
+        raise NotImplementedError
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], k: int,
+               where: Optional[Dict[str, Any]] = None) -> SearchResults:
+        """Nearest ``k`` chunks matching ``where`` for each query embedding
+
+        Returned documents carry their ID in ``metadata["chunk_id"]``.
+        """
+        raise NotImplementedError
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        """Stored chunks by ID and/or filter, shaped like Chroma's ``get``
+
+        The result has an ``ids`` list plus one list per ``include`` entry
+        (``documents``, ``metadatas``, ``embeddings``).
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def persist(self):
+        """Flush pending writes to disk"""
+
+    def search_by_vector(self, query_embedding: Sequence[float], k: int,
+                         where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        return self.search([query_embedding], k, where)[0]
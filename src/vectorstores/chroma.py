@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.schema import Document
+
+from config import CHROMA_PERSIST_DIRECTORY
+from .base import SearchResults, VectorStore
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma collection, written through LangChain's wrapper and searched with the raw collection API
+
+    LangChain's wrapper only searches one query at a time, so searches go
+    to the collection directly to score a batch of queries in one call.
+    """
+
+    def __init__(self, client, collection_name: str, embeddings):
+        from langchain.vectorstores import Chroma
+
+        self.name = collection_name
+        self.langchain = Chroma(
+            client=client,
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=CHROMA_PERSIST_DIRECTORY
+        )
+
+    def add_documents(self, documents: List[Document], ids: Sequence[str]):
+        self.langchain.add_documents(documents, ids=list(ids))
+
+    def delete(self, ids: Sequence[str]):
+        if ids:
+            self.langchain.delete(ids=list(ids))
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], k: int,
+               where: Optional[Dict[str, Any]] = None) -> SearchResults:
+        found = self.langchain._collection.query(
+            query_embeddings=[list(embedding) for embedding in query_embeddings], n_results=k, where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        results: SearchResults = []
+        for ids, texts, metadatas, distances in zip(
+                found["ids"], found["documents"], found["metadatas"], found["distances"]):
+            pairs = []
+            for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances):
+                metadata = dict(metadata or {})
+                metadata.setdefault("chunk_id", chunk_id)
+                pairs.append((Document(page_content=text, metadata=metadata), distance))
+            results.append(pairs)
+        return results
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        return self.langchain.get(
+            ids=list(ids) if ids is not None else None, where=where, limit=limit, offset=offset,
+            include=list(include)
+        )
+
+    def count(self) -> int:
+        return self.langchain._collection.count()
+
+    def persist(self):
+        self.langchain.persist()
+
+    def as_retriever(self, **kwargs):
+        """LangChain retriever over the collection"""
+        return self.langchain.as_retriever(**kwargs)
@@ -0,0 +1,384 @@
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from config import NUMPY_SCAN_BLOCK_ROWS, NUMPY_VACUUM_RATIO
+from src.retrieval.compact_index import SQLITE_MAX_PARAMS
+from src.utils.vectors import normalize
+from .base import SearchResults, VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Normalized float32 vectors, one row per stored chunk
+VECTORS_FILE = "vectors.{generation}.f4"
+
+# Row masks of recent ``where`` clauses, reused until the collection changes
+WHERE_MASK_CACHE_SIZE = 32
+
+COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def where_to_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma ``where`` clause into an SQL condition on the JSON ``metadata`` column"""
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(clause) for clause in value]
+            if parts:
+                clauses.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+                params.extend(param for _, part_params in parts for param in part_params)
+            continue
+        if key.startswith("$") or '"' in key:
+            raise ValueError(f"Unsupported where key: {key}")
+
+        conditions = value if isinstance(value, dict) else {"$eq": value}
+        for operator, operand in conditions.items():
+            if operator in COMPARISONS:
+                clauses.append(f"json_extract(metadata, ?) {COMPARISONS[operator]} ?")
+                params.extend([f'$."{key}"', operand])
+            elif operator in ("$in", "$nin"):
+                operand = list(operand)
+                placeholders = ",".join("?" * len(operand))
+                clauses.append(f"json_extract(metadata, ?) {'IN' if operator == '$in' else 'NOT IN'} ({placeholders})")
+                params.extend([f'$."{key}"', *operand])
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return " AND ".join(clauses) or "1", params
+
+
+class NumpyVectorStore(VectorStore):
+    """In-process vector store: a memory-mapped float32 matrix plus texts and metadata in SQLite
+
+    Vectors are normalized and appended to a flat file that is mapped with
+    ``np.memmap``, so opening a collection reads nothing up front and
+    there is no index to build or load. A search scores every candidate
+    row for all queries at once, one matrix multiply per ``block_rows``
+    rows, and keeps each query's top k with ``argpartition``. Results are
+    exact; distances are cosine distances (1 - cosine similarity).
+
+    ``where`` clauses are evaluated in SQLite over the JSON metadata and
+    applied as a row mask before scoring, so filtered searches only score
+    matching rows. Deleted rows are masked out and compacted into a new
+    generation of files once ``vacuum_ratio`` of them are dead. As with
+    ``CompactIndex``, other processes pick up writes through a version
+    counter checked before each read; this process's own writes patch the
+    live-row mask instead of rereading it.
+    """
+
+    def __init__(self, directory: Path, embeddings=None, name: Optional[str] = None,
+                 block_rows: int = NUMPY_SCAN_BLOCK_ROWS, vacuum_ratio: float = NUMPY_VACUUM_RATIO):
+        self.directory = Path(directory)
+        self.name = name or self.directory.name
+        self.embeddings = embeddings
+        self.block_rows = max(1, block_rows)
+        self.vacuum_ratio = vacuum_ratio
+        self._lock = threading.RLock()
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._conn = self._connect()
+        self._version = None
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.directory / "rows.sqlite3"), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        conn.commit()
+        return conn
+
+    def _meta(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, **values: int):
+        self._conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            list(values.items())
+        )
+
+    def _path(self, generation: int) -> Path:
+        return self.directory / VECTORS_FILE.format(generation=generation)
+
+    def _remap(self):
+        """Map ``self._rows`` rows of the current generation's vectors"""
+        self._vectors = np.memmap(self._path(self._generation), dtype=np.float32, mode="r",
+                                  shape=(self._rows, self._dim)) if self._rows else None
+
+    def _load(self):
+        """Map the current generation of vectors and rebuild the live-row mask from the row table"""
+        self._version = self._meta("version")
+        self._generation = self._meta("generation")
+        self._rows = self._meta("rows")
+        self._dim = self._meta("dim")
+        self._remap()
+        self._alive = np.zeros(self._rows, dtype=bool)
+        live = np.fromiter((row for (row,) in self._conn.execute("SELECT row FROM rows")), dtype=np.int64)
+        self._alive[live[live < self._rows]] = True
+        self._masks.clear()
+
+    def _refresh(self):
+        if self._meta("version") != self._version:
+            self._load()
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def add_documents(self, documents: List[Document], ids: Sequence[str]):
+        if not documents:
+            return
+        if self.embeddings is None:
+            raise ValueError(f"Vector store {self.name} has no embedding function")
+        self.add_embeddings(ids, documents, self.embeddings.embed_documents([doc.page_content for doc in documents]))
+
+    def add_embeddings(self, ids: Sequence[str], documents: List[Document], embeddings: Sequence[Sequence[float]]):
+        """Store chunks with precomputed embeddings, replacing any stored under the same IDs"""
+        if not ids:
+            return
+        vectors = normalize(embeddings)
+        rows = [(doc.page_content, json.dumps(doc.metadata)) for doc in documents]
+        with self._lock:
+            self._refresh()
+            if self._dim and vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vectors, got {vectors.shape[1]}")
+            self._dim = vectors.shape[1]
+
+            replaced = self._delete_locked(ids)
+            start = self._rows
+            with open(self._path(self._generation), "ab") as f:
+                # Drop any tail left by an interrupted write
+                f.truncate(start * self._dim * 4)
+                f.write(np.ascontiguousarray(vectors).tobytes())
+            self._conn.executemany(
+                "INSERT INTO rows (row, chunk_id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(start + i, chunk_id, text, metadata) for i, (chunk_id, (text, metadata)) in enumerate(zip(ids, rows))]
+            )
+            self._set_meta(rows=start + len(ids), dim=self._dim, version=self._version + 1)
+            self._conn.commit()
+
+            # Only the new rows and the replaced ones change, so the mask is patched rather than reread
+            self._version += 1
+            self._rows = start + len(ids)
+            self._remap()
+            alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            alive[replaced] = False
+            self._alive = alive
+            self._masks.clear()
+
+    def _delete_locked(self, ids: Sequence[str]) -> np.ndarray:
+        """Drop chunks from the row table, returning the rows they occupied"""
+        rows = []
+        for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+            batch = list(ids[start:start + SQLITE_MAX_PARAMS])
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(row for (row,) in self._conn.execute(
+                f"SELECT row FROM rows WHERE chunk_id IN ({placeholders})", batch
+            ))
+            self._conn.execute(f"DELETE FROM rows WHERE chunk_id IN ({placeholders})", batch)
+        return np.asarray(rows, dtype=np.int64)
+
+    def delete(self, ids: Sequence[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._refresh()
+            deleted = self._delete_locked(ids)
+            self._set_meta(version=self._version + 1)
+            self._conn.commit()
+            self._version += 1
+            # Copied rather than patched in place: searches scan the mask outside the lock
+            alive = self._alive.copy()
+            alive[deleted[deleted < self._rows]] = False
+            self._alive = alive
+            self._masks.clear()
+            if self._rows and 1 - self._alive.sum() / self._rows > self.vacuum_ratio:
+                self.vacuum()
+
+    def vacuum(self):
+        """Copy live vectors into a new generation of files and renumber their rows
+
+        Live rows keep their order, so renumbering them in ascending order
+        never collides with a row not yet moved. The new file is written
+        before the transaction that switches to it, so an interruption
+        leaves the previous generation intact.
+        """
+        with self._lock:
+            self._refresh()
+            old_generation, generation = self._generation, self._generation + 1
+            live = np.flatnonzero(self._alive)
+            self._path(generation).unlink(missing_ok=True)
+            with open(self._path(generation), "wb") as f:
+                for start in range(0, len(live), self.block_rows):
+                    f.write(np.ascontiguousarray(self._vectors[live[start:start + self.block_rows]]).tobytes())
+
+            self._conn.executemany("UPDATE rows SET row = ? WHERE row = ?", enumerate(live.tolist()))
+            self._set_meta(generation=generation, rows=len(live), version=self._version + 1)
+            self._conn.commit()
+            self._load()
+
+            self._path(old_generation).unlink(missing_ok=True)
+            logger.info(f"Vacuumed vector store {self.name} to {len(live)} rows")
+
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Rows matching a ``where`` clause; called with the lock held"""
+        key = json.dumps(where, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is not None:
+            self._masks.move_to_end(key)
+            return mask
+
+        sql, params = where_to_sql(where)
+        rows = np.fromiter(
+            (row for (row,) in self._conn.execute(f"SELECT row FROM rows WHERE {sql}", params)), dtype=np.int64
+        )
+        mask = np.zeros(self._rows, dtype=bool)
+        mask[rows[rows < self._rows]] = True
+        self._masks[key] = mask
+        if len(self._masks) > WHERE_MASK_CACHE_SIZE:
+            self._masks.popitem(last=False)
+        return mask
+
+    def _scan(self, vectors: np.ndarray, mask: np.ndarray, queries: np.ndarray,
+              k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Best ``k`` rows among those set in ``mask`` and their cosine similarities, per query, best first"""
+        selected = np.flatnonzero(mask)
+        # Sparse selections (filters, many deleted rows) are gathered, dense ones scored in place
+        gather = len(selected) < len(mask) // 2
+        total = len(selected) if gather else len(mask)
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, self.block_rows):
+            end = min(start + self.block_rows, total)
+            if gather:
+                rows = selected[start:end]
+                scores = queries @ np.asarray(vectors[rows]).T
+            else:
+                rows = np.arange(start, end)
+                scores = queries @ np.asarray(vectors[start:end]).T
+                if not mask[start:end].all():
+                    scores[:, ~mask[start:end]] = -np.inf
+
+            keep = min(k, len(rows))
+            top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            best_rows = np.concatenate([best_rows, rows[top]], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            if best_scores.shape[1] > k:
+                top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _fetch_rows(self, rows: List[int]) -> Dict[int, Tuple[str, str, str]]:
+        found = {}
+        for start in range(0, len(rows), SQLITE_MAX_PARAMS):
+            batch = rows[start:start + SQLITE_MAX_PARAMS]
+            for row, chunk_id, text, metadata in self._conn.execute(
+                    f"SELECT row, chunk_id, document, metadata FROM rows WHERE row IN ({','.join('?' * len(batch))})",
+                    batch):
+                found[row] = (chunk_id, text, metadata)
+        return found
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], k: int,
+               where: Optional[Dict[str, Any]] = None) -> SearchResults:
+        if k <= 0 or not len(query_embeddings):
+            return [[] for _ in query_embeddings]
+        queries = normalize(query_embeddings)
+
+        while True:
+            with self._lock:
+                self._refresh()
+                generation, vectors = self._generation, self._vectors
+                mask = self._where_mask(where) if where else self._alive
+            if vectors is None or not mask.any():
+                return [[] for _ in query_embeddings]
+            if queries.shape[1] != vectors.shape[1]:
+                raise ValueError(f"Expected {vectors.shape[1]}-dimensional queries, got {queries.shape[1]}")
+
+            # The scan runs without the lock, so concurrent searches overlap
+            best_rows, best_scores = self._scan(vectors, mask, queries, k)
+            with self._lock:
+                self._refresh()
+                # A vacuum renumbers rows, so a scan of an older generation is redone
+                if self._generation != generation:
+                    continue
+                stored = self._fetch_rows(sorted(set(best_rows[np.isfinite(best_scores)].tolist())))
+            break
+
+        results: SearchResults = []
+        for rows, scores in zip(best_rows.tolist(), best_scores.tolist()):
+            pairs = []
+            for row, score in zip(rows, scores):
+                # Rows deleted since the scan are skipped
+                if row not in stored or score == -np.inf:
+                    continue
+                chunk_id, text, metadata = stored[row]
+                metadata = json.loads(metadata)
+                metadata.setdefault("chunk_id", chunk_id)
+                pairs.append((Document(page_content=text, metadata=metadata), 1.0 - score))
+            results.append(pairs)
+        return results
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        where_sql, where_params = where_to_sql(where) if where else ("1", [])
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                ids = list(ids)
+                found = []
+                for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+                    batch = ids[start:start + SQLITE_MAX_PARAMS]
+                    found.extend(self._conn.execute(
+                        f"SELECT row, chunk_id, document, metadata FROM rows "
+                        f"WHERE chunk_id IN ({','.join('?' * len(batch))}) AND {where_sql}", batch + where_params
+                    ).fetchall())
+                found.sort()
+                found = found[offset or 0:][:limit]
+            else:
+                found = self._conn.execute(
+                    f"SELECT row, chunk_id, document, metadata FROM rows WHERE {where_sql} "
+                    f"ORDER BY row LIMIT ? OFFSET ?", where_params + [limit if limit is not None else -1, offset or 0]
+                ).fetchall()
+
+            result: Dict[str, list] = {"ids": [chunk_id for _, chunk_id, _, _ in found]}
+            if "documents" in include:
+                result["documents"] = [text for _, _, text, _ in found]
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(metadata) for _, _, _, metadata in found]
+            if "embeddings" in include:
+                # Stored normalized, which cosine similarity does not distinguish
+                rows = [row for row, _, _, _ in found if row < self._rows]
+                result["embeddings"] = np.asarray(self._vectors[rows]).tolist() if rows else []
+        return result
+
+    def persist(self):
+        """Nothing to do: every write is committed before it returns"""
+
+    def close(self):
+        with self._lock:
+            self._conn.close()